@@ -0,0 +1,128 @@
+"""
+Micro-benchmark of the event differs (diff_event, part_of_event_as_map and same_key)
+on the objects recorded in examples/*/oracle/*/state.json.
+Each object is paired with a copy that has one more metadata label,
+and with a copy that has one changed field deep in a large nested value.
+
+Run it from the root of the repo:
+    python3 benchmarks/bench_event_delta.py [-r 5]
+To compare with another revision, run the same script against a checkout of it:
+    git worktree add /tmp/sieve-base <revision>
+    PYTHONPATH=/tmp/sieve-base python3 benchmarks/bench_event_delta.py
+"""
+
+import copy
+import glob
+import json
+import optparse
+import os
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if "PYTHONPATH" not in os.environ:
+    sys.path.insert(0, REPO_DIR)
+
+from sieve_common.event_delta import MaskSpec, diff_event, part_of_event_as_map
+from sieve_common.event_delta import canonical_event, same_key
+
+MASK_SPEC = MaskSpec(
+    {"uid", "resourceVersion"}, {"metadata/managedFields", "status/conditions"}
+)
+
+
+def load_objects():
+    objects = []
+    for state_path in sorted(
+        glob.glob(os.path.join(REPO_DIR, "examples", "*", "oracle", "*", "state.json"))
+    ):
+        with open(state_path) as state_file:
+            for obj in json.load(state_file).values():
+                if isinstance(obj, dict):
+                    objects.append(obj)
+    return objects
+
+
+def add_label(obj):
+    changed_obj = copy.deepcopy(obj)
+    changed_obj.setdefault("metadata", {})["labels"] = {"sieve": "changed"}
+    return changed_obj
+
+
+def change_deepest_field(obj):
+    # Changes the last scalar of the deepest path so that the structural
+    # comparison at every level above it walks (almost) the whole subtree
+    changed_obj = copy.deepcopy(obj)
+    deepest = (0, None, None)
+    stack = [(changed_obj, 0)]
+    while stack:
+        value, depth = stack.pop()
+        items = value.items() if isinstance(value, dict) else enumerate(value)
+        for key, item in items:
+            if isinstance(item, (dict, list)):
+                stack.append((item, depth + 1))
+            elif depth >= deepest[0]:
+                deepest = (depth, value, key)
+    if deepest[1] is not None:
+        deepest[1][deepest[2]] = "sieve-changed"
+    return changed_obj
+
+
+def bench(name, pairs, rounds):
+    canonical_pairs = [
+        (
+            prev_obj,
+            cur_obj,
+            diff_event(prev_obj, cur_obj, MASK_SPEC)[1],
+            canonical_event(cur_obj, MASK_SPEC),
+        )
+        for prev_obj, cur_obj in pairs
+    ]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for prev_obj, cur_obj in pairs:
+            diff_event(prev_obj, cur_obj, MASK_SPEC)
+    diff_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for _, _, slim_cur_obj, canonical_cur_obj in canonical_pairs:
+            if slim_cur_obj is not None:
+                part_of_event_as_map(slim_cur_obj, canonical_cur_obj)
+            part_of_event_as_map(canonical_cur_obj, canonical_cur_obj)
+    part_of_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for prev_obj, cur_obj, _, _ in canonical_pairs:
+            same_key(prev_obj, cur_obj)
+            same_key(prev_obj, prev_obj)
+    same_key_time = time.perf_counter() - start
+    print(
+        "%-14s diff_event %.2fs  part_of_event_as_map %.2fs  same_key %.2fs"
+        % (name, diff_time, part_of_time, same_key_time)
+    )
+
+
+if __name__ == "__main__":
+    usage = "usage: python3 benchmarks/bench_event_delta.py [options]"
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option(
+        "-r",
+        "--rounds",
+        dest="rounds",
+        help="diff every pair ROUNDS times",
+        metavar="ROUNDS",
+        type="int",
+        default=5,
+    )
+    (options, args) = parser.parse_args()
+    objects = load_objects()
+    print(
+        "python %s, %d objects, %d rounds"
+        % (sys.version.split()[0], len(objects), options.rounds)
+    )
+    bench("new label", [(obj, add_label(obj)) for obj in objects], options.rounds)
+    bench(
+        "deep change",
+        [(obj, change_deepest_field(obj)) for obj in objects],
+        options.rounds,
+    )
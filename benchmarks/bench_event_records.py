@@ -0,0 +1,91 @@
+"""
+Micro-benchmark of the event records: construction time, memory per event
+and the time of a scan reading one attribute of every event.
+
+Run it from the root of the repo:
+    python3 benchmarks/bench_event_records.py [-n 1000000]
+To compare with another revision, run the same script against a checkout of it:
+    git worktree add /tmp/sieve-base <revision>
+    PYTHONPATH=/tmp/sieve-base python3 benchmarks/bench_event_records.py
+"""
+
+import optparse
+import os
+import sys
+import time
+import tracemalloc
+
+if "PYTHONPATH" not in os.environ:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sieve_common.k8s_event import (
+    OperatorHear,
+    OperatorWrite,
+    APIEvent,
+    ReconcileBegin,
+)
+from sieve_analyzer.event_graph import EventVertex
+
+OBJ_STR = '{"metadata": {"name": "p", "namespace": "default"}}'
+
+
+def bench(name, make_event, attribute, n):
+    start = time.perf_counter()
+    events = [make_event(i) for i in range(n)]
+    construct_time = time.perf_counter() - start
+    del events
+    tracemalloc.start()
+    events = [make_event(i) for i in range(n)]
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for event in events:
+        getattr(event, attribute)
+    scan_time = time.perf_counter() - start
+    print(
+        "%-14s construct %.2fs  memory %.0f B/event  attribute scan %.3fs"
+        % (name, construct_time, memory / n, scan_time)
+    )
+
+
+if __name__ == "__main__":
+    usage = "usage: python3 benchmarks/bench_event_records.py [options]"
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option(
+        "-n",
+        "--number",
+        dest="number",
+        help="construct NUMBER events of each type",
+        metavar="NUMBER",
+        type="int",
+        default=1000000,
+    )
+    (options, args) = parser.parse_args()
+    n = options.number
+    print("python %s, %d events of each type" % (sys.version.split()[0], n))
+    bench(
+        "OperatorHear",
+        lambda i: OperatorHear(str(i), "Added", "pod", OBJ_STR),
+        "start_timestamp",
+        n,
+    )
+    bench(
+        "OperatorWrite",
+        lambda i: OperatorWrite(str(i), "Update", "pod", "rt", "NoError", OBJ_STR),
+        "start_timestamp",
+        n,
+    )
+    bench(
+        "APIEvent",
+        lambda i: APIEvent("ADDED", "k", "pod", "default", "p", OBJ_STR),
+        "etype",
+        n,
+    )
+    bench(
+        "ReconcileBegin",
+        lambda i: ReconcileBegin("rt", str(i)),
+        "end_timestamp",
+        n,
+    )
+    operator_hear = OperatorHear("1", "Added", "pod", OBJ_STR)
+    bench("EventVertex", lambda i: EventVertex(i, operator_hear), "gid", n)
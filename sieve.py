@@ -16,6 +16,10 @@ from sieve_oracle.oracle import (
     persist_state,
     persist_history,
     generate_controller_family,
+    load_api_event_store,
+    start_incremental_ingestion,
+    finish_incremental_ingestion,
+    compress_result_logs,
     canonicalize_history_and_state,
     generate_fatal,
     check,
@@ -466,6 +470,7 @@ def run_workload(
         shell=True,
         preexec_fn=os.setsid,
     )
+    start_incremental_ingestion(test_context)
 
     use_soft_timeout = "0"
     if "pauseController" in test_context.action_types:
@@ -516,6 +521,7 @@ def run_workload(
     streamed_log_file.close()
     os.killpg(streaming_api_server.pid, signal.SIGTERM)
     streamed_api_server_log_file.close()
+    finish_incremental_ingestion(test_context)
     if test_context.mode != sieve_modes.VANILLA:
         stop_sieve_server()
 
@@ -523,9 +529,11 @@ def run_workload(
 def check_result(
     test_context: TestContext,
 ) -> TestResult:
-    generate_controller_family(test_context)
-    persist_history(test_context)
-    persist_state(test_context)
+    compress_result_logs(test_context)
+    api_event_store, history_digest = load_api_event_store(test_context)
+    generate_controller_family(test_context, api_event_store)
+    persist_history(test_context, api_event_store, history_digest)
+    persist_state(test_context, api_event_store)
     if test_context.stage == sieve_stages.LEARN:
         if test_context.mode == sieve_modes.LEARN_TWICE:
             canonicalize_history_and_state(test_context)
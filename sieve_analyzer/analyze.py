@@ -1,4 +1,6 @@
+import bisect
 import copy
+import heapq
 import os
 import shutil
 from typing import List
@@ -11,122 +13,140 @@ from sieve_perturbation_policies.intermediate_state import intermediate_state_an
 from sieve_perturbation_policies.stale_state import stale_state_analysis
 from sieve_perturbation_policies.unobserved_state import unobserved_state_analysis
 from sieve_common.k8s_event import *
+from sieve_common.trace_cache import open_sieve_log
+from sieve_analyzer.event_graph_snapshot import (
+    event_graph_fingerprint,
+    read_event_graph_snapshot,
+    write_event_graph_snapshot,
+)
 from sieve_analyzer.event_graph import (
     EventGraph,
     EventVertex,
+    positions_of_bits,
 )
 
 
-def sanity_check_sieve_log(path):
-    lines = open(path).readlines()
-    reconcile_status = {}
-    operator_write_status = {}
-    operator_hear_status = {}
-    for i in range(len(lines)):
-        line = lines[i]
-        if SIEVE_BEFORE_WRITE_MARK in line:
-            operator_write_id = parse_operator_write_id_only(line).id
-            assert operator_write_id not in operator_write_status, line
-            operator_write_status[operator_write_id] = 1
-        elif SIEVE_AFTER_WRITE_MARK in line:
-            operator_write_id = parse_operator_write_id_only(line).id
-            assert operator_write_id in operator_write_status, line
-            operator_write_status[operator_write_id] += 1
-        elif SIEVE_BEFORE_HEAR_MARK in line:
-            operator_hear_id = parse_operator_hear_id_only(line).id
-            assert operator_hear_id not in operator_hear_status, line
-            operator_hear_status[operator_hear_id] = 1
-        elif SIEVE_AFTER_HEAR_MARK in line:
-            operator_hear_id = parse_operator_hear_id_only(line).id
-            assert operator_hear_id in operator_hear_status, line
-            operator_hear_status[operator_hear_id] += 1
-        elif SIEVE_BEFORE_RECONCILE_MARK in line:
-            reconciler_type = parse_reconcile(line).reconciler_type
-            if reconciler_type not in reconcile_status:
-                reconcile_status[reconciler_type] = 0
-            reconcile_status[reconciler_type] += 1
-            assert reconcile_status[reconciler_type] == 1, line
-        elif SIEVE_AFTER_RECONCILE_MARK in line:
-            reconciler_type = parse_reconcile(line).reconciler_type
-            assert reconciler_type in reconcile_status, line
-            reconcile_status[reconciler_type] -= 1
-            assert reconcile_status[reconciler_type] == 0, line
-    for key in operator_write_status:
-        assert operator_write_status[key] == 1 or operator_write_status[key] == 2
-    for key in operator_hear_status:
-        assert operator_hear_status[key] == 1 or operator_hear_status[key] == 2
-    for key in reconcile_status:
-        assert (
-            reconcile_status[reconciler_type] == 0
-            or reconcile_status[reconciler_type] == 1
-        )
-
-
-def parse_receiver_events(path):
-    # { operator_hear id -> operator_hear }
-    operator_hear_id_map = {}
-    # we need this map to later find the previous operator_hear for each crucial operator_hear
-    operator_hear_list = []
-    lines = open(path).readlines()
-    largest_timestamp = len(lines)
-    for i in range(len(lines)):
-        line = lines[i]
-        if SIEVE_BEFORE_HEAR_MARK in line:
-            operator_hear = parse_operator_hear(line)
-            operator_hear.start_timestamp = i
-            # We initially set the operator_hear end time as the largest timestamp
-            # so that if we never meet SIEVE_AFTER_HEAR_MARK for this operator_hear,
-            # we will not pose any constraint on its end time in range_overlap
-            operator_hear.end_timestamp = largest_timestamp
-            operator_hear_id_map[operator_hear.id] = operator_hear
-        elif SIEVE_AFTER_HEAR_MARK in line:
-            operator_hear_id_only = parse_operator_hear_id_only(line)
-            operator_hear_id_map[operator_hear_id_only.id].end_timestamp = i
-    for i in range(len(lines)):
-        line = lines[i]
-        if SIEVE_BEFORE_HEAR_MARK in line:
-            operator_hear = parse_operator_hear(line)
-            operator_hear_list.append(operator_hear_id_map[operator_hear.id])
-    return operator_hear_list
-
-
-def parse_reconciler_events(test_context: TestContext, path):
-    operator_write_start_timestamp_map = {}
-    operator_nk_write_start_timestamp_map = {}
-    read_types_this_reconcile = set()
-    read_keys_this_reconcile = set()
-    prev_reconcile_per_type = {}
-    cur_reconcile_per_type = {}
-    cur_reconcile_is_trivial = {}
-    ts_to_event_map = {}
-    # there could be multiple controllers running concurrently
-    # we need to record all the ongoing controllers
-    # there could be multiple workers running for a single controller
-    # so we need to count each worker for each controller
-    # ongoing_reconcile = { reconciler_type -> number of ongoing workers for this controller }
-    ongoing_reconciles = {}
-    lines = open(path).readlines()
-    for i in range(len(lines)):
-        line = lines[i]
-        if SIEVE_BEFORE_WRITE_MARK in line:
-            operator_write_id_only = parse_operator_write_id_only(line)
-            operator_write_start_timestamp_map[operator_write_id_only.id] = i
-        elif SIEVE_AFTER_WRITE_MARK in line:
+class SieveLogSanityChecker:
+    def __init__(self):
+        self.reconcile_status = {}
+        self.operator_write_status = {}
+        self.operator_hear_status = {}
+
+    def consume(self, record: SieveLogRecord):
+        mark = record.mark
+        if mark == SIEVE_BEFORE_WRITE_MARK:
+            operator_write_id = record.id
+            assert operator_write_id not in self.operator_write_status, record.tokens
+            self.operator_write_status[operator_write_id] = 1
+        elif mark == SIEVE_AFTER_WRITE_MARK:
+            operator_write_id = record.id
+            assert operator_write_id in self.operator_write_status, record.tokens
+            self.operator_write_status[operator_write_id] += 1
+        elif mark == SIEVE_BEFORE_HEAR_MARK:
+            operator_hear_id = record.id
+            assert operator_hear_id not in self.operator_hear_status, record.tokens
+            self.operator_hear_status[operator_hear_id] = 1
+        elif mark == SIEVE_AFTER_HEAR_MARK:
+            operator_hear_id = record.id
+            assert operator_hear_id in self.operator_hear_status, record.tokens
+            self.operator_hear_status[operator_hear_id] += 1
+        elif mark == SIEVE_BEFORE_RECONCILE_MARK:
+            reconciler_type = record.tokens[1]
+            if reconciler_type not in self.reconcile_status:
+                self.reconcile_status[reconciler_type] = 0
+            self.reconcile_status[reconciler_type] += 1
+            assert self.reconcile_status[reconciler_type] == 1, record.tokens
+        elif mark == SIEVE_AFTER_RECONCILE_MARK:
+            reconciler_type = record.tokens[1]
+            assert reconciler_type in self.reconcile_status, record.tokens
+            self.reconcile_status[reconciler_type] -= 1
+            assert self.reconcile_status[reconciler_type] == 0, record.tokens
+
+    def finish(self):
+        for key in self.operator_write_status:
+            assert (
+                self.operator_write_status[key] == 1
+                or self.operator_write_status[key] == 2
+            )
+        for key in self.operator_hear_status:
+            assert (
+                self.operator_hear_status[key] == 1
+                or self.operator_hear_status[key] == 2
+            )
+        for key in self.reconcile_status:
+            assert self.reconcile_status[key] == 0 or self.reconcile_status[key] == 1
+
+
+class OperatorHearCollector:
+    def __init__(self):
+        # { operator_hear id -> operator_hear }
+        self.operator_hear_id_map = {}
+        # we need this list to later find the previous operator_hear for each crucial operator_hear
+        self.operator_hear_list = []
+
+    def consume(self, record: SieveLogRecord):
+        mark = record.mark
+        if mark == SIEVE_BEFORE_HEAR_MARK:
+            operator_hear = parse_operator_hear_tokens(record.tokens)
+            operator_hear.start_timestamp = record.timestamp
+            self.operator_hear_id_map[operator_hear.id] = operator_hear
+            self.operator_hear_list.append(operator_hear)
+        elif mark == SIEVE_AFTER_HEAR_MARK:
+            self.operator_hear_id_map[record.id].end_timestamp = record.timestamp
+
+    def finish(self, largest_timestamp: int) -> List[OperatorHear]:
+        # If we never meet SIEVE_AFTER_HEAR_MARK for an operator_hear,
+        # we set its end time as the largest timestamp
+        # so that we will not pose any constraint on its end time in range_overlap
+        for operator_hear in self.operator_hear_list:
+            if operator_hear.end_timestamp == -1:
+                operator_hear.end_timestamp = largest_timestamp
+        return self.operator_hear_list
+
+
+class ReconcilerEventCollector:
+    def __init__(self, test_context: TestContext, key_table: ResourceKeyTable):
+        self.test_context = test_context
+        self.key_table = key_table
+        self.operator_write_start_timestamp_map = {}
+        self.operator_nk_write_start_timestamp_map = {}
+        self.read_types_this_reconcile = set()
+        # a bitset of the ids of the read keys
+        self.read_key_ids_this_reconcile = 0
+        self.prev_reconcile_per_type = {}
+        self.cur_reconcile_per_type = {}
+        self.cur_reconcile_is_trivial = {}
+        self.ts_to_event_map = {}
+        # there could be multiple controllers running concurrently
+        # we need to record all the ongoing controllers
+        # there could be multiple workers running for a single controller
+        # so we need to count each worker for each controller
+        # ongoing_reconcile = { reconciler_type -> number of ongoing workers for this controller }
+        self.ongoing_reconciles = {}
+
+    def consume(self, record: SieveLogRecord):
+        mark = record.mark
+        i = record.timestamp
+        test_context = self.test_context
+        cur_reconcile_per_type = self.cur_reconcile_per_type
+        prev_reconcile_per_type = self.prev_reconcile_per_type
+        cur_reconcile_is_trivial = self.cur_reconcile_is_trivial
+        if mark == SIEVE_BEFORE_WRITE_MARK:
+            self.operator_write_start_timestamp_map[record.id] = i
+        elif mark == SIEVE_AFTER_WRITE_MARK:
             for key in cur_reconcile_is_trivial:
                 cur_reconcile_is_trivial[key] = False
             # If we have not met any reconcile yet, skip the operator_write since it is not caused by reconcile
             # though it should not happen at all.
             # TODO: handle the writes that are not in any reconcile
-            operator_write = parse_operator_write(line)
+            operator_write = parse_operator_write_tokens(record.tokens)
             if operator_write.reconciler_type not in cur_reconcile_per_type:
                 if not test_context.controller_config.loosen_reconciler_boundary:
-                    continue
-            # Do deepcopy here to ensure the later changes to the two sets
-            # will not affect this operator_write.
-            # cache read during that possible interval
-            operator_write.read_keys = copy.deepcopy(read_keys_this_reconcile)
-            operator_write.read_types = copy.deepcopy(read_types_this_reconcile)
-            operator_write.start_timestamp = operator_write_start_timestamp_map[
+                    return
+            # The read keys are an immutable bitset so no copy is needed.
+            operator_write.read_key_ids = self.read_key_ids_this_reconcile
+            operator_write.read_types = copy.deepcopy(self.read_types_this_reconcile)
+            operator_write.start_timestamp = self.operator_write_start_timestamp_map[
                 operator_write.id
             ]
             operator_write.end_timestamp = i
@@ -138,20 +158,19 @@ def parse_reconciler_events(test_context: TestContext, path):
                     earliest_timestamp = prev_reconcile.end_timestamp
                 operator_write.set_range(earliest_timestamp, i)
                 operator_write.reconcile_id = cur_reconcile.reconcile_id
-            ts_to_event_map[operator_write.start_timestamp] = operator_write
-        elif SIEVE_BEFORE_ANNOTATED_API_INVOCATION_MARK in line:
-            id_only = parse_operator_non_k8s_write_id_only(line)
-            operator_nk_write_start_timestamp_map[id_only.id] = i
-        elif SIEVE_AFTER_ANNOTATED_API_INVOCATION_MARK in line:
+            self.ts_to_event_map[operator_write.start_timestamp] = operator_write
+        elif mark == SIEVE_BEFORE_ANNOTATED_API_INVOCATION_MARK:
+            self.operator_nk_write_start_timestamp_map[record.id] = i
+        elif mark == SIEVE_AFTER_ANNOTATED_API_INVOCATION_MARK:
             for key in cur_reconcile_is_trivial:
                 cur_reconcile_is_trivial[key] = False
-            operator_nk_write = parse_operator_non_k8s_write(line)
+            operator_nk_write = parse_operator_non_k8s_write_tokens(record.tokens)
             if operator_nk_write.reconciler_type not in cur_reconcile_per_type:
                 if not test_context.controller_config.loosen_reconciler_boundary:
-                    continue
-            operator_nk_write.start_timestamp = operator_nk_write_start_timestamp_map[
-                operator_nk_write.id
-            ]
+                    return
+            operator_nk_write.start_timestamp = (
+                self.operator_nk_write_start_timestamp_map[operator_nk_write.id]
+            )
             operator_nk_write.end_timestamp = i
             if operator_nk_write.reconciler_type in cur_reconcile_per_type:
                 prev_reconcile = prev_reconcile_per_type[
@@ -165,32 +184,34 @@ def parse_reconciler_events(test_context: TestContext, path):
                     earliest_timestamp = prev_reconcile.end_timestamp
                 operator_nk_write.set_range(earliest_timestamp, i)
                 operator_nk_write.reconcile_id = cur_reconcile.reconcile_id
-            ts_to_event_map[operator_nk_write.start_timestamp] = operator_nk_write
+            self.ts_to_event_map[operator_nk_write.start_timestamp] = operator_nk_write
             print("nk write end")
-        elif SIEVE_AFTER_READ_MARK in line:
+        elif mark == SIEVE_AFTER_READ_MARK:
             # TODO: handle the reads that are not in any reconcile
-            operator_read = parse_operator_read(line)
+            operator_read = parse_operator_read_tokens(record.tokens)
             if operator_read.reconciler_type not in cur_reconcile_per_type:
-                continue
+                return
             operator_read.end_timestamp = i
             cur_reconcile = cur_reconcile_per_type[operator_read.reconciler_type]
             operator_read.reconcile_id = cur_reconcile.reconcile_id
-            ts_to_event_map[operator_read.end_timestamp] = operator_read
+            self.ts_to_event_map[operator_read.end_timestamp] = operator_read
             if operator_read.etype == "Get":
-                read_keys_this_reconcile.update(operator_read.key_set)
+                self.read_key_ids_this_reconcile |= self.key_table.intern_bitset(
+                    operator_read.key_set
+                )
             else:
-                read_types_this_reconcile.add(operator_read.rtype)
-        elif SIEVE_BEFORE_RECONCILE_MARK in line:
-            reconcile_begin = parse_reconcile(line)
+                self.read_types_this_reconcile.add(operator_read.rtype)
+        elif mark == SIEVE_BEFORE_RECONCILE_MARK:
+            reconcile_begin = parse_reconcile_tokens(record.tokens)
             reconcile_begin.end_timestamp = i
-            ts_to_event_map[reconcile_begin.end_timestamp] = reconcile_begin
+            self.ts_to_event_map[reconcile_begin.end_timestamp] = reconcile_begin
             reconciler_type = reconcile_begin.reconciler_type
-            if reconciler_type not in ongoing_reconciles:
-                ongoing_reconciles[reconciler_type] = 1
+            if reconciler_type not in self.ongoing_reconciles:
+                self.ongoing_reconciles[reconciler_type] = 1
             else:
-                ongoing_reconciles[reconciler_type] += 1
+                self.ongoing_reconciles[reconciler_type] += 1
             # let's assume there should be only one worker for each controller here
-            assert ongoing_reconciles[reconciler_type] == 1
+            assert self.ongoing_reconciles[reconciler_type] == 1
             if reconciler_type not in cur_reconcile_per_type:
                 prev_reconcile_per_type[reconciler_type] = None
                 cur_reconcile_per_type[reconciler_type] = reconcile_begin
@@ -209,71 +230,263 @@ def parse_reconciler_events(test_context: TestContext, path):
                     ]
                     cur_reconcile_per_type[reconciler_type] = reconcile_begin
             cur_reconcile_is_trivial[reconciler_type] = True
-        elif SIEVE_AFTER_RECONCILE_MARK in line:
-            reconcile_end = parse_reconcile(line)
+        elif mark == SIEVE_AFTER_RECONCILE_MARK:
+            reconcile_end = parse_reconcile_tokens(record.tokens)
             reconcile_end.end_timestamp = i
-            ts_to_event_map[reconcile_end.end_timestamp] = reconcile_end
+            self.ts_to_event_map[reconcile_end.end_timestamp] = reconcile_end
             reconciler_type = reconcile_end.reconciler_type
-            ongoing_reconciles[reconciler_type] -= 1
-            if ongoing_reconciles[reconciler_type] == 0:
-                del ongoing_reconciles[reconciler_type]
+            self.ongoing_reconciles[reconciler_type] -= 1
+            if self.ongoing_reconciles[reconciler_type] == 0:
+                del self.ongoing_reconciles[reconciler_type]
             # Clear the read keys and types set since all the ongoing reconciles are done
-            if len(ongoing_reconciles) == 0:
-                read_keys_this_reconcile = set()
-                read_types_this_reconcile = set()
-    reconciler_event_list = [event for ts, event in sorted(ts_to_event_map.items())]
-    return reconciler_event_list
+            if len(self.ongoing_reconciles) == 0:
+                self.read_key_ids_this_reconcile = 0
+                self.read_types_this_reconcile = set()
+
+    def finish(self) -> List:
+        return [event for ts, event in sorted(self.ts_to_event_map.items())]
+
+
+def sanity_check_sieve_log(path):
+    sanity_checker = SieveLogSanityChecker()
+    for record in open_sieve_log(path):
+        sanity_checker.consume(record)
+    sanity_checker.finish()
+
+
+def parse_receiver_events(path):
+    tokenizer = open_sieve_log(path)
+    operator_hear_collector = OperatorHearCollector()
+    for record in tokenizer:
+        operator_hear_collector.consume(record)
+    return operator_hear_collector.finish(tokenizer.line_cnt)
+
+
+def parse_reconciler_events(
+    test_context: TestContext, path, key_table: ResourceKeyTable = None
+):
+    if key_table is None:
+        key_table = ResourceKeyTable()
+    reconciler_event_collector = ReconcilerEventCollector(test_context, key_table)
+    for record in open_sieve_log(path):
+        reconciler_event_collector.consume(record)
+    return reconciler_event_collector.finish()
+
+
+def parse_sieve_log(
+    test_context: TestContext, path, key_table: ResourceKeyTable = None
+):
+    # Sanity check the log and collect both the operator_hears and the reconciler events
+    # in a single streaming pass over the log (or its trace cache)
+    if key_table is None:
+        key_table = ResourceKeyTable()
+    tokenizer = open_sieve_log(path, test_context.common_config.trace_cache_enabled)
+    sanity_checker = SieveLogSanityChecker()
+    operator_hear_collector = OperatorHearCollector()
+    reconciler_event_collector = ReconcilerEventCollector(test_context, key_table)
+    for record in tokenizer:
+        sanity_checker.consume(record)
+        operator_hear_collector.consume(record)
+        reconciler_event_collector.consume(record)
+    sanity_checker.finish()
+    operator_hear_list = operator_hear_collector.finish(tokenizer.line_cnt)
+    reconciler_event_list = reconciler_event_collector.finish()
+    return operator_hear_list, reconciler_event_list
+
+
+# The number of vertices under which HearIntervalIndex scans them instead of its segment tree
+HEAR_INTERVAL_INDEX_SCAN_SIZE = 32
+
+
+class HearIntervalIndex:
+    """
+    An index of some operator_hear vertices for enumerating, in order, the ones
+    with end_timestamp > after and start_timestamp < before without visiting the others.
+    The vertices are given by their positions in operator_hear_vertices,
+    which are sorted by start_timestamp (see EventGraph.sanity_check).
+    The ones starting after `after` also end after it, so they are found by bisect.
+    The ones starting no later than `after` are found in a segment tree
+    of the latest end_timestamp under each subtree.
+    """
+
+    def __init__(self, operator_hear_vertices: List[EventVertex], positions: List[int]):
+        self.__positions = positions
+        self.__start_timestamps = [
+            operator_hear_vertices[position].content.start_timestamp
+            for position in positions
+        ]
+        self.__sorted_end_timestamps = sorted(
+            operator_hear_vertices[position].content.end_timestamp
+            for position in positions
+        )
+        self.__size = 1
+        while self.__size < len(positions):
+            self.__size *= 2
+        self.__max_end_timestamps = [-1] * (2 * self.__size)
+        for i in range(len(positions)):
+            self.__max_end_timestamps[self.__size + i] = operator_hear_vertices[
+                positions[i]
+            ].content.end_timestamp
+        for node in reversed(range(1, self.__size)):
+            self.__max_end_timestamps[node] = max(
+                self.__max_end_timestamps[2 * node],
+                self.__max_end_timestamps[2 * node + 1],
+            )
+
+    def __ending_after(self, hi: int, after: int) -> List[int]:
+        # Returns the indexes in [0, hi) whose end_timestamp > after in order,
+        # descending only into the subtrees ending after `after`
+        max_end_timestamps = self.__max_end_timestamps
+        if hi <= HEAR_INTERVAL_INDEX_SCAN_SIZE:
+            return [i for i in range(hi) if max_end_timestamps[self.__size + i] > after]
+        indexes = []
+        stack = [(1, 0)]
+        while len(stack) != 0:
+            node, node_lo = stack.pop()
+            if node_lo >= hi or max_end_timestamps[node] <= after:
+                continue
+            if node >= self.__size:
+                indexes.append(node_lo)
+                continue
+            half = (self.__size >> (node.bit_length() - 1)) // 2
+            stack.append((2 * node + 1, node_lo + half))
+            stack.append((2 * node, node_lo))
+        return indexes
+
+    def __bounds(self, after: int, before: int):
+        # Returns (lo, hi, spanning_cnt) where [lo, hi) are the indexes starting
+        # after `after` and before `before` and spanning_cnt is the number of the indexes
+        # starting no later than `after` but ending after it.
+        # Every vertex ending no later than `after` also starts before `after`,
+        # so spanning_cnt is counted by bisect too.
+        hi = bisect.bisect_left(self.__start_timestamps, before)
+        lo = bisect.bisect_right(self.__start_timestamps, after)
+        spanning_cnt = lo - bisect.bisect_right(self.__sorted_end_timestamps, after)
+        return lo, hi, spanning_cnt
+
+    def overlapping(self, after: int, before: int) -> List[int]:
+        # Returns the positions of the vertices with end_timestamp > after
+        # and start_timestamp < before in order
+        lo, hi, spanning_cnt = self.__bounds(after, before)
+        positions = self.__positions
+        if lo >= hi:
+            if spanning_cnt == 0:
+                return []
+            return [positions[i] for i in self.__ending_after(hi, after)]
+        if spanning_cnt == 0:
+            return positions[lo:hi]
+        return [positions[i] for i in self.__ending_after(lo, after)] + positions[lo:hi]
+
+    def overlapping_cnt(self, after: int, before: int) -> int:
+        # Same as len(overlapping(after, before))
+        lo, hi, spanning_cnt = self.__bounds(after, before)
+        if lo > hi:
+            if spanning_cnt == 0:
+                return 0
+            return len(self.__ending_after(hi, after))
+        return hi - lo + spanning_cnt
 
 
 def base_pass(
     operator_hear_vertices: List[EventVertex],
     operator_write_vertices: List[EventVertex],
     operator_non_k8s_write_vertices: List[EventVertex],
+    hear_read_overlap_filtering: bool = False,
 ):
+    # The operator_hears that can lead to each operator_write are those ending after
+    # its reconcile scope starts and starting before it.
+    # If hear_read_overlap_filtering is set, the operator_hears of an operator_write
+    # are also required to have a key or a type read before the operator_write,
+    # which is looked up in the indexes of the operator_hears per type and per key
+    # so that the pairs pruned by the filtering are never enumerated.
     print("Running base pass...")
+    if hear_read_overlap_filtering:
+        print("Running optional pass: hear-read-overlap-filtering...")
+    all_positions = list(range(len(operator_hear_vertices)))
+    hear_index = HearIntervalIndex(operator_hear_vertices, all_positions)
+    type_to_positions = {}
+    key_id_to_positions = {}
+    for position in all_positions:
+        operator_hear = operator_hear_vertices[position].content
+        type_to_positions.setdefault(operator_hear.rtype, []).append(position)
+        key_id_to_positions.setdefault(operator_hear.key_id, []).append(position)
+    type_to_hear_index = {}
+    key_id_to_hear_index = {}
+    for rtype in type_to_positions:
+        type_to_hear_index[rtype] = HearIntervalIndex(
+            operator_hear_vertices, type_to_positions[rtype]
+        )
+    for key_id in key_id_to_positions:
+        key_id_to_hear_index[key_id] = HearIntervalIndex(
+            operator_hear_vertices, key_id_to_positions[key_id]
+        )
+
     vertex_pairs = []
+    base_pair_cnt = 0
     write_vertices = operator_write_vertices + operator_non_k8s_write_vertices
     for operator_write_vertex in write_vertices:
-        for operator_hear_vertex in operator_hear_vertices:
-            if operator_write_vertex.content.reconcile_id == -1:
-                continue
-            # operator_hears can lead to that operator_write
-            hear_within_reconcile_scope = (
-                operator_write_vertex.content.range_start_timestamp
-                < operator_hear_vertex.content.end_timestamp
-            )
-            write_after_hear = (
-                operator_write_vertex.content.start_timestamp
-                > operator_hear_vertex.content.start_timestamp
+        operator_write = operator_write_vertex.content
+        if operator_write.reconcile_id == -1:
+            continue
+        after = operator_write.range_start_timestamp
+        before = operator_write.start_timestamp
+        if (
+            not hear_read_overlap_filtering
+            or not operator_write_vertex.is_operator_write()
+        ):
+            positions = hear_index.overlapping(after, before)
+            base_pair_cnt += len(positions)
+        else:
+            window_cnt = hear_index.overlapping_cnt(after, before)
+            base_pair_cnt += window_cnt
+            read_cnt = len(operator_write.read_types) + bin(
+                operator_write.read_key_ids
+            ).count("1")
+            if window_cnt <= read_cnt:
+                # Checking the few operator_hears in the window is cheaper
+                # than looking up each read type and key
+                positions = [
+                    position
+                    for position in hear_index.overlapping(after, before)
+                    if operator_hear_vertices[position].content.rtype
+                    in operator_write.read_types
+                    or bitset_contains(
+                        operator_write.read_key_ids,
+                        operator_hear_vertices[position].content.key_id,
+                    )
+                ]
+            else:
+                # The hear indexes of different types or different keys are disjoint,
+                # and a key whose type is read is already covered by the type
+                matched_indexes = [
+                    type_to_hear_index[rtype]
+                    for rtype in operator_write.read_types
+                    if rtype in type_to_hear_index
+                ]
+                for key_id in positions_of_bits(operator_write.read_key_ids):
+                    if (
+                        key_id in key_id_to_positions
+                        and operator_hear_vertices[
+                            key_id_to_positions[key_id][0]
+                        ].content.rtype
+                        not in operator_write.read_types
+                    ):
+                        matched_indexes.append(key_id_to_hear_index[key_id])
+                positions = heapq.merge(
+                    *[
+                        matched_index.overlapping(after, before)
+                        for matched_index in matched_indexes
+                    ]
+                )
+        for position in positions:
+            vertex_pairs.append(
+                [operator_hear_vertices[position], operator_write_vertex]
             )
-            if hear_within_reconcile_scope and write_after_hear:
-                vertex_pairs.append([operator_hear_vertex, operator_write_vertex])
+    if hear_read_overlap_filtering:
+        print("<e, s> pairs: %d -> %d" % (base_pair_cnt, len(vertex_pairs)))
     return vertex_pairs
 
 
-def hear_read_overlap_filtering_pass(vertex_pairs: List[List[EventVertex]]):
-    print("Running optional pass: hear-read-overlap-filtering...")
-    pruned_vertex_pairs = []
-    for pair in vertex_pairs:
-        operator_hear_vertex = pair[0]
-        operator_write_vertex = pair[1]
-        if operator_write_vertex.is_operator_write():
-            key_match = (
-                operator_hear_vertex.content.key
-                in operator_write_vertex.content.read_keys
-            )
-            type_match = (
-                operator_hear_vertex.content.rtype
-                in operator_write_vertex.content.read_types
-            )
-            if key_match or type_match:
-                pruned_vertex_pairs.append(pair)
-        else:
-            pruned_vertex_pairs.append(pair)
-    print("<e, s> pairs: %d -> %d" % (len(vertex_pairs), len(pruned_vertex_pairs)))
-    return pruned_vertex_pairs
-
-
 def error_msg_filtering_pass(vertex_pairs: List[List[EventVertex]]):
     print("Running optional pass: error-message-filtering...")
     pruned_vertex_pairs = []
@@ -292,12 +505,12 @@ def generate_hear_write_pairs(event_graph: EventGraph):
     operator_hear_vertices = event_graph.operator_hear_vertices
     operator_write_vertices = event_graph.operator_write_vertices
     operator_non_k8s_write_vertices = event_graph.operator_non_k8s_write_vertices
-    vertex_pairs = base_pass(
-        operator_hear_vertices, operator_write_vertices, operator_non_k8s_write_vertices
+    return base_pass(
+        operator_hear_vertices,
+        operator_write_vertices,
+        operator_non_k8s_write_vertices,
+        HEAR_READ_FILTER_FLAG,
     )
-    if HEAR_READ_FILTER_FLAG:
-        vertex_pairs = hear_read_overlap_filtering_pass(vertex_pairs)
-    return vertex_pairs
 
 
 def generate_write_hear_pairs(event_graph: EventGraph):
@@ -306,7 +519,7 @@ def generate_write_hear_pairs(event_graph: EventGraph):
     operator_write_vertices = event_graph.operator_write_vertices
     operator_hear_key_map = event_graph.operator_hear_key_to_vertices
     for operator_write_vertex in operator_write_vertices:
-        if operator_write_vertex.content.key in operator_hear_key_map:
+        if operator_write_vertex.content.key_id in operator_hear_key_map:
             for operator_hear_vertex in operator_hear_vertices:
                 if (
                     operator_hear_vertex.content.obj_str
@@ -326,13 +539,16 @@ def generate_write_hear_pairs(event_graph: EventGraph):
 def build_event_graph(test_context: TestContext, log_path, oracle_dir):
     learned_masked_paths = json.load(open(os.path.join(oracle_dir, "mask.json")))
 
-    operator_hear_list = parse_receiver_events(log_path)
-    reconciler_event_list = parse_reconciler_events(test_context, log_path)
+    key_table = ResourceKeyTable()
+    operator_hear_list, reconciler_event_list = parse_sieve_log(
+        test_context, log_path, key_table
+    )
 
     event_graph = EventGraph(
         learned_masked_paths,
         test_context.common_config.field_key_mask,
         test_context.common_config.field_path_mask,
+        key_table,
     )
     event_graph.add_sorted_operator_hears(operator_hear_list)
     event_graph.add_sorted_reconciler_events(reconciler_event_list)
@@ -346,12 +562,33 @@ def build_event_graph(test_context: TestContext, log_path, oracle_dir):
     # for pair in write_hear_pairs:
     #     event_graph.connect_write_to_hear(pair[0], pair[1])
 
-    event_graph.finalize()
+    event_graph.finalize(
+        test_context.common_config.analysis_workers,
+        test_context.common_config.diff_cache_size,
+        test_context.common_config.reachability_index_enabled,
+    )
     event_graph.sanity_check()
 
     return event_graph
 
 
+def load_or_build_event_graph(test_context: TestContext, log_path, oracle_dir):
+    # Reuses the event graph snapshot in the result dir if the graph would be built
+    # from the same log, masks and config, e.g., when only the pruning flags change
+    log_dir = test_context.result_dir
+    fingerprint = event_graph_fingerprint(test_context, log_path, oracle_dir)
+    event_graph = read_event_graph_snapshot(log_dir, fingerprint)
+    if event_graph is None:
+        event_graph = build_event_graph(test_context, log_path, oracle_dir)
+        write_event_graph_snapshot(log_dir, event_graph, fingerprint)
+        return event_graph
+    print("Loaded the event graph snapshot in %s" % log_dir)
+    if test_context.common_config.reachability_index_enabled:
+        event_graph.build_reachability_index()
+    event_graph.sanity_check()
+    return event_graph
+
+
 def generate_test_config(
     test_context: TestContext, analysis_mode, event_graph: EventGraph
 ):
@@ -379,13 +616,15 @@ def analyze_trace(
     oracle_dir = test_context.oracle_dir
 
     log_path = os.path.join(log_dir, "sieve-server.log")
-    print("Sanity checking the sieve log %s..." % log_path)
-    sanity_check_sieve_log(log_path)
+    print("Sanity checking and parsing the sieve log %s..." % log_path)
 
     if not os.path.exists(os.path.join(oracle_dir, "mask.json")):
         fail("cannot find mask.json")
         return
-    event_graph = build_event_graph(test_context, log_path, oracle_dir)
+    if test_context.common_config.event_graph_snapshot_enabled:
+        event_graph = load_or_build_event_graph(test_context, log_path, oracle_dir)
+    else:
+        event_graph = build_event_graph(test_context, log_path, oracle_dir)
     sieve_learn_result = {
         "project": test_context.project,
         "test": test_context.test_name,
@@ -1,3 +1,6 @@
+import bisect
+import multiprocessing
+from collections import deque
 from typing import Dict, List, Optional, Set, Tuple, Union
 from sieve_common.k8s_event import (
     OperatorHear,
@@ -6,20 +9,34 @@ from sieve_common.k8s_event import (
     OperatorRead,
     ReconcileBegin,
     ReconcileEnd,
+    ResourceKeyTable,
     EVENT_NONE_TYPE,
     generate_key,
     get_event_signature,
-    conflicting_event,
     get_mask_by_resource_key,
+    OperatorHearTypes,
     parse_key,
 )
-from sieve_common.event_delta import diff_event
+from sieve_common.event_delta import (
+    EventDeltaCache,
+    MaskSpec,
+    event_value_at,
+    part_of_event_conditions,
+)
 
 INTER_RECONCILER_EDGE = "INTER-RECONCILER"
 INTRA_RECONCILER_EDGE = "INTRA-RECONCILER"
 
 
 class EventVertex:
+    __slots__ = (
+        "gid",
+        "content",
+        "key_position",
+        "out_inter_reconciler_edges",
+        "out_intra_reconciler_edges",
+    )
+
     def __init__(
         self,
         gid: int,
@@ -32,26 +49,12 @@ class EventVertex:
             ReconcileEnd,
         ],
     ):
-        self.__gid = gid
-        self.__content = content
-        self.__out_inter_reconciler_edges = []
-        self.__out_intra_reconciler_edges = []
-
-    @property
-    def gid(self):
-        return self.__gid
-
-    @property
-    def content(self):
-        return self.__content
-
-    @property
-    def out_inter_reconciler_edges(self) -> List:
-        return self.__out_inter_reconciler_edges
-
-    @property
-    def out_intra_reconciler_edges(self) -> List:
-        return self.__out_intra_reconciler_edges
+        self.gid = gid
+        self.content = content
+        # The position of an operator_hear vertex in operator_hear_key_to_vertices of its key
+        self.key_position = -1
+        self.out_inter_reconciler_edges = []
+        self.out_intra_reconciler_edges = []
 
     def add_out_inter_reconciler_edge(self, edge):
         self.out_inter_reconciler_edges.append(edge)
@@ -79,22 +82,122 @@ class EventVertex:
 
 
 class EventEdge:
-    def __init__(self, source: EventVertex, sink: EventVertex, type: str):
-        self.__source = source
-        self.__sink = sink
-        self.__type = type
-
-    @property
-    def source(self):
-        return self.__source
+    __slots__ = ("source", "sink", "type")
 
-    @property
-    def sink(self):
-        return self.__sink
+    def __init__(self, source: EventVertex, sink: EventVertex, type: str):
+        self.source = source
+        self.sink = sink
+        self.type = type
+
+
+class ReachabilityIndex:
+    """
+    The transitive closure of the inter-reconciler edges of a complete event graph.
+    The sinks of the edges are numbered in topological order (by start_timestamp,
+    as every edge goes forward in time), and each vertex with out edges keeps
+    the sinks it reaches as a bitset, shifted by the first position it can reach.
+    A reachability query is then a lookup and a bit test instead of a BFS.
+    """
+
+    def __init__(self, vertices: List[EventVertex]):
+        # vertices should contain every vertex with inter-reconciler edges
+        sorted_vertices = sorted(
+            vertices, key=lambda vertex: vertex.content.start_timestamp
+        )
+        sink_gids = set()
+        for vertex in sorted_vertices:
+            for edge in vertex.out_inter_reconciler_edges:
+                sink_gids.add(edge.sink.gid)
+        self.__sink_to_position = {}
+        for vertex in sorted_vertices:
+            if vertex.gid in sink_gids:
+                self.__sink_to_position[vertex.gid] = len(self.__sink_to_position)
+        # Maps each vertex with out edges to the (offset, bitset) of the sinks it reaches,
+        # where bit i of the bitset stands for the sink at position offset + i
+        self.__vertex_to_reach = {}
+        for vertex in reversed(sorted_vertices):
+            if len(vertex.out_inter_reconciler_edges) == 0:
+                continue
+            # The sinks reachable through an edge are all later than the sink of the edge
+            offset = min(
+                self.__sink_to_position[edge.sink.gid]
+                for edge in vertex.out_inter_reconciler_edges
+            )
+            bits = 0
+            for edge in vertex.out_inter_reconciler_edges:
+                assert (
+                    edge.source.content.start_timestamp
+                    < edge.sink.content.start_timestamp
+                )
+                bits |= 1 << (self.__sink_to_position[edge.sink.gid] - offset)
+                if edge.sink.gid in self.__vertex_to_reach:
+                    sink_offset, sink_bits = self.__vertex_to_reach[edge.sink.gid]
+                    bits |= sink_bits << (sink_offset - offset)
+            self.__vertex_to_reach[vertex.gid] = (offset, bits)
+
+    def reachable(self, source: EventVertex, sink: EventVertex) -> bool:
+        if source.gid == sink.gid:
+            return True
+        if (
+            source.gid not in self.__vertex_to_reach
+            or sink.gid not in self.__sink_to_position
+        ):
+            return False
+        offset, bits = self.__vertex_to_reach[source.gid]
+        position = self.__sink_to_position[sink.gid]
+        return position >= offset and (bits >> (position - offset)) & 1 == 1
+
+
+class OperatorReadIndex:
+    """
+    Indexes the operator_reads of each key by the reconcile they belong to,
+    to tell what the controller last read of a key in a reconcile before a given time.
+    For each key, the read list is cut at the first read that ends after the time
+    (as the linear scan over the reads of the key used to do),
+    and the last read of the reconcile before the cut is found by bisect.
+    """
+
+    def __init__(self, operator_read_key_to_vertices: Dict[int, List[EventVertex]]):
+        # Maps each key to the running max of the end_timestamp of its reads in order,
+        # and each (reconciler_type, reconcile_id, key) to the positions of its reads
+        self.__key_to_end_timestamp_prefix_max = {}
+        self.__reconcile_key_to_positions = {}
+        self.__key_to_vertices = operator_read_key_to_vertices
+        for key_id, operator_read_vertices in operator_read_key_to_vertices.items():
+            end_timestamp_prefix_max = []
+            max_end_timestamp = -1
+            for i in range(len(operator_read_vertices)):
+                operator_read = operator_read_vertices[i].content
+                max_end_timestamp = max(max_end_timestamp, operator_read.end_timestamp)
+                end_timestamp_prefix_max.append(max_end_timestamp)
+                reconcile_key = (
+                    operator_read.reconciler_type,
+                    operator_read.reconcile_id,
+                    key_id,
+                )
+                if reconcile_key not in self.__reconcile_key_to_positions:
+                    self.__reconcile_key_to_positions[reconcile_key] = []
+                self.__reconcile_key_to_positions[reconcile_key].append(i)
+            self.__key_to_end_timestamp_prefix_max[key_id] = end_timestamp_prefix_max
 
-    @property
-    def type(self):
-        return self.__type
+    def get_last_read_before(
+        self, reconciler_type: str, reconcile_id: int, key_id: int, timestamp: int
+    ) -> Optional[EventVertex]:
+        # Returns the last read of the key in the reconcile before the first read of the key
+        # that ends after timestamp, or None if there is no such read
+        reconcile_key = (reconciler_type, reconcile_id, key_id)
+        if reconcile_key not in self.__reconcile_key_to_positions:
+            return None
+        cut = bisect.bisect_right(
+            self.__key_to_end_timestamp_prefix_max[key_id], timestamp
+        )
+        positions = self.__reconcile_key_to_positions[reconcile_key]
+        i = bisect.bisect_left(positions, cut) - 1
+        if i < 0:
+            return None
+        operator_read_vertex = self.__key_to_vertices[key_id][positions[i]]
+        assert operator_read_vertex.content.end_timestamp < timestamp
+        return operator_read_vertex
 
 
 class EventGraph:
@@ -103,10 +206,13 @@ class EventGraph:
         learned_masked_paths: Dict,
         configured_masked_keys: Dict,
         configured_masked_paths: Dict,
+        key_table: Optional[ResourceKeyTable] = None,
     ):
         self.__learned_masked_paths = learned_masked_paths
         self.__configured_masked_keys = configured_masked_keys
         self.__configured_masked_paths = configured_masked_paths
+        # The key_to_vertices indexes are keyed by the ids interned in key_table
+        self.__key_table = key_table if key_table is not None else ResourceKeyTable()
         self.__vertex_cnt = 0
         self.__operator_hear_vertices = []
         self.__operator_write_vertices = []
@@ -121,6 +227,27 @@ class EventGraph:
         self.__operator_hear_operator_write_edges = []
         self.__operator_write_operator_hear_edges = []
         self.__intra_reconciler_edges = []
+        self.__resource_key_to_mask_spec = {}
+        self.__delta_cache = EventDeltaCache(0)
+        self.__reachability_index = None
+        self.__operator_read_index = None
+
+    @property
+    def delta_cache(self) -> EventDeltaCache:
+        return self.__delta_cache
+
+    @property
+    def reachability_index(self) -> Optional[ReachabilityIndex]:
+        return self.__reachability_index
+
+    @property
+    def operator_read_index(self) -> OperatorReadIndex:
+        # Built on first use, after all the reconciler events are added
+        if self.__operator_read_index is None:
+            self.__operator_read_index = OperatorReadIndex(
+                self.operator_read_key_to_vertices
+            )
+        return self.__operator_read_index
 
     @property
     def learned_masked_paths(self) -> Dict:
@@ -134,6 +261,10 @@ class EventGraph:
     def configured_masked_keys(self) -> Set[str]:
         return self.__configured_masked_keys
 
+    @property
+    def key_table(self) -> ResourceKeyTable:
+        return self.__key_table
+
     @property
     def operator_hear_vertices(self) -> List[EventVertex]:
         return self.__operator_hear_vertices
@@ -161,19 +292,19 @@ class EventGraph:
     @property
     def operator_read_key_to_vertices(
         self,
-    ) -> Dict[str, List[EventVertex]]:
+    ) -> Dict[int, List[EventVertex]]:
         return self.__operator_read_key_to_vertices
 
     @property
     def operator_write_key_to_vertices(
         self,
-    ) -> Dict[str, List[EventVertex]]:
+    ) -> Dict[int, List[EventVertex]]:
         return self.__operator_write_key_to_vertices
 
     @property
     def operator_hear_key_to_vertices(
         self,
-    ) -> Dict[str, List[EventVertex]]:
+    ) -> Dict[int, List[EventVertex]]:
         return self.__operator_hear_key_to_vertices
 
     @property
@@ -194,7 +325,10 @@ class EventGraph:
     def intra_reconciler_edges(self) -> List[EventEdge]:
         return self.__intra_reconciler_edges
 
-    def retrieve_masked(self, resource_key):
+    def retrieve_masked(self, resource_key) -> MaskSpec:
+        # The mask spec of each resource key is compiled only once
+        if resource_key in self.__resource_key_to_mask_spec:
+            return self.__resource_key_to_mask_spec[resource_key]
         masked_keys = set()
         masked_keys.update(
             set(get_mask_by_resource_key(self.configured_masked_keys, resource_key))
@@ -206,7 +340,9 @@ class EventGraph:
         masked_paths.update(
             set(get_mask_by_resource_key(self.learned_masked_paths, resource_key))
         )
-        return (masked_keys, masked_paths)
+        mask_spec = MaskSpec(masked_keys, masked_paths)
+        self.__resource_key_to_mask_spec[resource_key] = mask_spec
+        return mask_spec
 
     def get_operator_hear_with_id(self, operator_hear_id) -> Optional[EventVertex]:
         if operator_hear_id in self.operator_hear_id_to_vertices:
@@ -214,16 +350,85 @@ class EventGraph:
         else:
             return None
 
+    def get_prev_operator_hear(
+        self, operator_hear_vertex: EventVertex
+    ) -> Optional[EventVertex]:
+        # Returns the previous operator_hear of the same key, or None if it is the first one
+        position = operator_hear_vertex.key_position
+        if position == 0:
+            return None
+        key_id = operator_hear_vertex.content.key_id
+        return self.operator_hear_key_to_vertices[key_id][position - 1]
+
+    def get_next_operator_hear(
+        self, operator_hear_vertex: EventVertex
+    ) -> Optional[EventVertex]:
+        # Returns the next operator_hear of the same key, or None if it is the last one
+        position = operator_hear_vertex.key_position
+        operator_hear_vertices = self.operator_hear_key_to_vertices[
+            operator_hear_vertex.content.key_id
+        ]
+        if position == len(operator_hear_vertices) - 1:
+            return None
+        return operator_hear_vertices[position + 1]
+
     def get_prev_operator_hear_with_key(
         self, key, cur_operator_hear_id
     ) -> Optional[EventVertex]:
-        for i in range(len(self.operator_hear_key_to_vertices[key])):
-            operator_hear_vertex = self.operator_hear_key_to_vertices[key][i]
-            if operator_hear_vertex.content.id == cur_operator_hear_id:
-                if i == 0:
-                    return None
-                else:
-                    return self.operator_hear_key_to_vertices[key][i - 1]
+        operator_hear_vertex = self.get_operator_hear_with_id(cur_operator_hear_id)
+        if (
+            operator_hear_vertex is None
+            or operator_hear_vertex.content.key_id != self.key_table.id_of(key)
+        ):
+            return None
+        return self.get_prev_operator_hear(operator_hear_vertex)
+
+    def vertices_reachable(self, source: EventVertex, sink: EventVertex) -> bool:
+        # Answered by the reachability index if it has been built in finalize
+        if self.reachability_index is not None:
+            return self.reachability_index.reachable(source, sink)
+        return event_vertices_reachable(source, sink)
+
+    def build_reachability_index(self):
+        self.__reachability_index = ReachabilityIndex(
+            self.operator_hear_vertices
+            + self.operator_write_vertices
+            + self.operator_non_k8s_write_vertices
+        )
+
+    def snapshot(self) -> Dict:
+        # The events (carrying the results of finalize) and the inter-reconciler edges,
+        # from which restore_event_graph rebuilds the graph without finalize.
+        # The edges refer to their vertices by gid, which holds because the operator_hears
+        # are added before the reconciler events and both are added back in the same order.
+        reconciler_event_vertices = sorted(
+            self.operator_write_vertices
+            + self.operator_non_k8s_write_vertices
+            + self.operator_read_vertices
+            + self.reconcile_begin_vertices
+            + self.reconcile_end_vertices,
+            key=lambda vertex: vertex.gid,
+        )
+        for i in range(len(self.operator_hear_vertices)):
+            assert self.operator_hear_vertices[i].gid == i
+        return {
+            "learned_masked_paths": self.learned_masked_paths,
+            "configured_masked_keys": self.configured_masked_keys,
+            "configured_masked_paths": self.configured_masked_paths,
+            "key_table": self.key_table,
+            "operator_hears": [
+                vertex.content for vertex in self.operator_hear_vertices
+            ],
+            "reconciler_events": [
+                vertex.content for vertex in reconciler_event_vertices
+            ],
+            "operator_hear_operator_write_edges": edge_gids(
+                self.operator_hear_operator_write_edges
+            ),
+            "operator_write_operator_hear_edges": edge_gids(
+                self.operator_write_operator_hear_edges
+            ),
+        }
 
     def sanity_check(self):
         # Be careful!!! The operator_hear_id and operator_write_id are only used to differentiate operator_hears/operator_writes
@@ -298,16 +503,14 @@ class EventGraph:
             operator_hear_vertex = EventVertex(self.__vertex_cnt, operator_hear)
             self.__vertex_cnt += 1
             self.operator_hear_vertices.append(operator_hear_vertex)
-            if (
-                operator_hear_vertex.content.key
-                not in self.operator_hear_key_to_vertices
-            ):
-                self.operator_hear_key_to_vertices[
-                    operator_hear_vertex.content.key
-                ] = []
-            self.operator_hear_key_to_vertices[operator_hear_vertex.content.key].append(
-                operator_hear_vertex
+            key_id = self.key_table.intern(operator_hear.key)
+            operator_hear.key_id = key_id
+            if key_id not in self.operator_hear_key_to_vertices:
+                self.operator_hear_key_to_vertices[key_id] = []
+            operator_hear_vertex.key_position = len(
+                self.operator_hear_key_to_vertices[key_id]
             )
+            self.operator_hear_key_to_vertices[key_id].append(operator_hear_vertex)
             assert (
                 operator_hear_vertex.content.id not in self.operator_hear_id_to_vertices
             )
@@ -333,18 +536,20 @@ class EventGraph:
             self.__vertex_cnt += 1
             if event_vertex.is_operator_write():
                 self.operator_write_vertices.append(event_vertex)
-                key = event_vertex.content.key
-                if key not in self.operator_write_key_to_vertices:
-                    self.operator_write_key_to_vertices[key] = []
-                self.operator_write_key_to_vertices[key].append(event_vertex)
+                key_id = self.key_table.intern(event.key)
+                event.key_id = key_id
+                if key_id not in self.operator_write_key_to_vertices:
+                    self.operator_write_key_to_vertices[key_id] = []
+                self.operator_write_key_to_vertices[key_id].append(event_vertex)
             elif event_vertex.is_operator_non_k8s_write():
                 self.operator_non_k8s_write_vertices.append(event_vertex)
             elif event_vertex.is_operator_read():
                 self.operator_read_vertices.append(event_vertex)
-                for key in event_vertex.content.key_set:
-                    if key not in self.operator_read_key_to_vertices:
-                        self.operator_read_key_to_vertices[key] = []
-                    self.operator_read_key_to_vertices[key].append(event_vertex)
+                event.key_ids = [self.key_table.intern(key) for key in event.key_set]
+                for key_id in event.key_ids:
+                    if key_id not in self.operator_read_key_to_vertices:
+                        self.operator_read_key_to_vertices[key_id] = []
+                    self.operator_read_key_to_vertices[key_id].append(event_vertex)
             elif event_vertex.is_reconcile_begin():
                 self.reconcile_begin_vertices.append(event_vertex)
             elif event_vertex.is_reconcile_end():
@@ -352,6 +557,7 @@ class EventGraph:
             else:
                 assert False
             event_vertex_list.append(event_vertex)
+        self.__operator_read_index = None
         for i in range(1, len(event_vertex_list)):
             prev_vertex = event_vertex_list[i - 1]
             cur_vertex = event_vertex_list[i]
@@ -396,84 +602,35 @@ class EventGraph:
         operator_write_vertex.add_out_inter_reconciler_edge(edge)
         self.operator_write_operator_hear_edges.append(edge)
 
-    def compute_event_diff(self):
-        for key in self.operator_hear_key_to_vertices:
-            vertices = self.operator_hear_key_to_vertices[key]
-            event_signature_to_counter = {}
-            prev_hear_obj_map = {}
-            prev_hear_etype = EVENT_NONE_TYPE
-            for i in range(len(vertices)):
-                cur_operator_hear = vertices[i].content
-                if not i == 0:
-                    prev_operator_hear = vertices[i - 1].content
-                    prev_hear_obj_map = prev_operator_hear.obj_map
-                    prev_hear_etype = prev_operator_hear.etype
-                masked_keys, masked_paths = self.retrieve_masked(cur_operator_hear.key)
-                slim_prev_object, slim_cur_object = diff_event(
-                    prev_hear_obj_map,
-                    cur_operator_hear.obj_map,
-                    masked_keys,
-                    masked_paths,
-                )
-                cur_operator_hear.slim_prev_obj_map = slim_prev_object
-                cur_operator_hear.slim_cur_obj_map = slim_cur_object
-                cur_operator_hear.prev_etype = prev_hear_etype
-                event_signature = get_event_signature(cur_operator_hear)
-                if event_signature not in event_signature_to_counter:
-                    event_signature_to_counter[event_signature] = 0
-                event_signature_to_counter[event_signature] += 1
-                cur_operator_hear.signature_counter = event_signature_to_counter[
-                    event_signature
-                ]
-
-        for key in self.operator_write_key_to_vertices:
-            vertices = self.operator_write_key_to_vertices[key]
-            event_signature_to_counter = {}
-            for operator_write_vertex in vertices:
-                prev_read_obj_map = {}
-                prev_read_etype = EVENT_NONE_TYPE
-                operator_write = operator_write_vertex.content
-                key = operator_write.key
-                if key in self.operator_read_key_to_vertices:
-                    for operator_read_vertex in self.operator_read_key_to_vertices[key]:
-                        operator_read = operator_read_vertex.content
-                        # TODO: we should only consider the read in the same reconcile round as the write
-                        # if the read happens after write, break
-                        if operator_read.end_timestamp > operator_write.start_timestamp:
-                            break
-                        assert operator_write.key in operator_read.key_set
-                        assert (
-                            operator_read.end_timestamp < operator_write.start_timestamp
-                        )
-                        if (
-                            operator_read.reconciler_type
-                            == operator_write.reconciler_type
-                            and operator_read.reconcile_id
-                            == operator_write.reconcile_id
-                        ):
-                            prev_read_obj_map = operator_read.key_to_obj[key]
-                            prev_read_etype = operator_read.etype
-
-                masked_keys, masked_paths = self.retrieve_masked(operator_write.key)
-                slim_prev_object, slim_cur_object = diff_event(
-                    prev_read_obj_map,
-                    operator_write.obj_map,
-                    masked_keys,
-                    masked_paths,
-                    True,
+    def find_prev_reads(self, key_id: int) -> List[Tuple[Dict, str, Optional[Tuple]]]:
+        # For each operator_write of the key, find the object, the etype and the payload
+        # from the last read of the key in the same reconcile before the write.
+        # The payload (the obj_str of the read and the key) identifies the object
+        # for EventDeltaCache; it is None if there is no such read.
+        prev_reads = []
+        for operator_write_vertex in self.operator_write_key_to_vertices[key_id]:
+            operator_write = operator_write_vertex.content
+            # TODO: we should only consider the read in the same reconcile round as the write
+            operator_read_vertex = self.operator_read_index.get_last_read_before(
+                operator_write.reconciler_type,
+                operator_write.reconcile_id,
+                key_id,
+                operator_write.start_timestamp,
+            )
+            if operator_read_vertex is None:
+                prev_reads.append(({}, EVENT_NONE_TYPE, None))
+            else:
+                operator_read = operator_read_vertex.content
+                prev_reads.append(
+                    (
+                        operator_read.key_to_obj[operator_write.key],
+                        operator_read.etype,
+                        (operator_read.obj_str, operator_write.key),
+                    )
                 )
-                operator_write.prev_obj_map = prev_read_obj_map
-                operator_write.slim_prev_obj_map = slim_prev_object
-                operator_write.slim_cur_obj_map = slim_cur_object
-                operator_write.prev_etype = prev_read_etype
-                event_signature = get_event_signature(operator_write)
-                if event_signature not in event_signature_to_counter:
-                    event_signature_to_counter[event_signature] = 0
-                event_signature_to_counter[event_signature] += 1
-                operator_write.signature_counter = event_signature_to_counter[
-                    event_signature
-                ]
+        return prev_reads
 
+    def compute_non_k8s_signature_counter(self):
         non_k8s_signature_counter_map = {}
         for operator_non_k8s_write in self.operator_non_k8s_write_vertices:
             signature = (
@@ -488,46 +645,362 @@ class EventGraph:
                 non_k8s_signature_counter_map[signature]
             )
 
-    def compute_event_cancel(self):
-        for key in self.operator_hear_key_to_vertices:
-            for i in range(len(self.operator_hear_key_to_vertices[key]) - 1):
-                cancelled_by = set()
-                cur_operator_hear = self.operator_hear_key_to_vertices[key][i].content
-                for j in range(i + 1, len(self.operator_hear_key_to_vertices[key])):
-                    future_operator_hear = self.operator_hear_key_to_vertices[key][
-                        j
-                    ].content
-                    # TODO: why do we always add the future_operator_hear when i == 0?
-                    if i == 0:
-                        cancelled_by.add(future_operator_hear.id)
-                        continue
-                    masked_keys, masked_paths = self.retrieve_masked(
-                        cur_operator_hear.key
-                    )
-                    if conflicting_event(
-                        cur_operator_hear,
-                        future_operator_hear,
-                        masked_keys,
-                        masked_paths,
-                    ):
-                        cancelled_by.add(future_operator_hear.id)
-                cur_operator_hear.cancelled_by = cancelled_by
+    def compute_event_diff_and_cancel(self):
+        for key_id in self.operator_hear_key_to_vertices:
+            mask_spec = self.retrieve_masked(self.key_table.key_of(key_id))
+            diff_and_cancel_operator_hears(
+                [
+                    vertex.content
+                    for vertex in self.operator_hear_key_to_vertices[key_id]
+                ],
+                mask_spec,
+                self.delta_cache,
+            )
+
+        for key_id in self.operator_write_key_to_vertices:
+            mask_spec = self.retrieve_masked(self.key_table.key_of(key_id))
+            diff_operator_writes(
+                [
+                    vertex.content
+                    for vertex in self.operator_write_key_to_vertices[key_id]
+                ],
+                self.find_prev_reads(key_id),
+                mask_spec,
+                self.delta_cache,
+            )
 
-    def finalize(self):
-        self.compute_event_diff()
-        self.compute_event_cancel()
+        self.compute_non_k8s_signature_counter()
+
+    def compute_event_diff_and_cancel_in_parallel(self, workers: int):
+        # The diff and cancel of the operator_hears (and the diff of the operator_writes)
+        # of one key only depend on the events of that key,
+        # so each key is analyzed as a shard in a worker process.
+        # The shards only carry the raw events and the results are merged back here.
+        hear_lists = []
+        hear_shards = []
+        for key_id in self.operator_hear_key_to_vertices:
+            mask_spec = self.retrieve_masked(self.key_table.key_of(key_id))
+            operator_hears = [
+                vertex.content for vertex in self.operator_hear_key_to_vertices[key_id]
+            ]
+            raw_operator_hears = [
+                (hear.id, hear.etype, hear.rtype, hear.obj_str)
+                for hear in operator_hears
+            ]
+            hear_lists.append(operator_hears)
+            hear_shards.append(
+                (raw_operator_hears, mask_spec, self.delta_cache.capacity)
+            )
+        write_lists = []
+        write_shards = []
+        for key_id in self.operator_write_key_to_vertices:
+            mask_spec = self.retrieve_masked(self.key_table.key_of(key_id))
+            operator_writes = [
+                vertex.content for vertex in self.operator_write_key_to_vertices[key_id]
+            ]
+            raw_operator_writes = [
+                (
+                    write.id,
+                    write.etype,
+                    write.rtype,
+                    write.reconciler_type,
+                    write.error,
+                    write.obj_str,
+                )
+                for write in operator_writes
+            ]
+            prev_reads = self.find_prev_reads(key_id)
+            write_lists.append((operator_writes, prev_reads))
+            write_shards.append(
+                (raw_operator_writes, prev_reads, mask_spec, self.delta_cache.capacity)
+            )
+
+        with multiprocessing.Pool(workers) as pool:
+            hear_results = run_shards(pool, analyze_operator_hear_shard, hear_shards)
+            write_results = run_shards(pool, analyze_operator_write_shard, write_shards)
+
+        for operator_hears, (results, hits, misses) in zip(hear_lists, hear_results):
+            self.delta_cache.count(hits, misses)
+            for operator_hear, result in zip(operator_hears, results):
+                (
+                    operator_hear.slim_prev_obj_map,
+                    operator_hear.slim_cur_obj_map,
+                    operator_hear.prev_etype,
+                    operator_hear.signature,
+                    operator_hear.signature_counter,
+                    operator_hear.cancelled_by,
+                ) = result
+        for (operator_writes, prev_reads), (results, hits, misses) in zip(
+            write_lists, write_results
+        ):
+            self.delta_cache.count(hits, misses)
+            for i in range(len(operator_writes)):
+                operator_write = operator_writes[i]
+                operator_write.prev_obj_map = prev_reads[i][0]
+                (
+                    operator_write.slim_prev_obj_map,
+                    operator_write.slim_cur_obj_map,
+                    operator_write.prev_etype,
+                    operator_write.signature,
+                    operator_write.signature_counter,
+                ) = results[i]
+
+        self.compute_non_k8s_signature_counter()
+
+    def finalize(
+        self,
+        workers: int = 1,
+        diff_cache_size: int = 0,
+        reachability_index_enabled: bool = False,
+    ):
+        # No vertex or edge should be added to the graph after finalize
+        self.__delta_cache = EventDeltaCache(diff_cache_size)
+        if workers > 1:
+            self.compute_event_diff_and_cancel_in_parallel(workers)
+        else:
+            self.compute_event_diff_and_cancel()
+        if diff_cache_size > 0:
+            print(
+                "Event delta cache: %d hits, %d misses"
+                % (self.delta_cache.hits, self.delta_cache.misses)
+            )
+        if reachability_index_enabled:
+            self.build_reachability_index()
+
+
+def diff_and_cancel_operator_hears(
+    operator_hears: List[OperatorHear],
+    mask_spec: MaskSpec,
+    delta_cache: EventDeltaCache,
+):
+    # operator_hears should be all the operator_hears of one key in order,
+    # so they are diffed as the version chain of the key.
+    # operator_hears[j] cancels operator_hears[i] (i < j) if conflicting_event holds for them.
+    # Instead of checking each pair, each slim_cur_obj_map is turned into
+    # the conditions on the field paths it reads (see part_of_event_conditions),
+    # and the operator_hears meeting each condition are kept as a bitset of positions,
+    # so only the checked fields of each canonicalized object are visited.
+    # As an operator_hear only cancels the earlier ones, the value of a field path is only
+    # needed for the operator_hears after the one whose conditions read it first,
+    # which allows both to be done in one pass over the version chain.
+    event_signature_to_counter = {}
+    hear_cnt = len(operator_hears)
+    payload_conditions = [None] * hear_cnt
+    condition_to_bits = {}
+    deleted_bits = 0
+    # The first operator_hear is diffed against the empty object
+    prev_hear_etype = EVENT_NONE_TYPE
+    version_chain = delta_cache.diff_event_chain(
+        [operator_hear.obj_str for operator_hear in operator_hears],
+        mask_spec,
+        False,
+        lambda i: operator_hears[i].obj_map,
+    )
+    for j, (slim_prev_object, slim_cur_object, canonical_obj_map) in enumerate(
+        version_chain
+    ):
+        operator_hear = operator_hears[j]
+        if not j == 0:
+            prev_hear_etype = operator_hears[j - 1].etype
+        operator_hear.slim_prev_obj_map = slim_prev_object
+        operator_hear.slim_cur_obj_map = slim_cur_object
+        operator_hear.prev_etype = prev_hear_etype
+        event_signature = get_event_signature(operator_hear)
+        if event_signature not in event_signature_to_counter:
+            event_signature_to_counter[event_signature] = 0
+        event_signature_to_counter[event_signature] += 1
+        operator_hear.signature_counter = event_signature_to_counter[event_signature]
+
+        if operator_hear.etype == OperatorHearTypes.DELETED:
+            deleted_bits |= 1 << j
+            continue
+        for path in condition_to_bits:
+            value_to_bits = condition_to_bits[path]
+            value = event_value_at(canonical_obj_map, path)
+            value_to_bits[value] = value_to_bits.get(value, 0) | (1 << j)
+        if 1 <= j < hear_cnt - 1 and slim_cur_object is not None:
+            payload_conditions[j] = part_of_event_conditions(slim_cur_object)
+            for path, value in payload_conditions[j]:
+                if path not in condition_to_bits:
+                    condition_to_bits[path] = {}
+
+    all_bits = (1 << hear_cnt) - 1
+    non_deleted_bits = all_bits & ~deleted_bits
+    for i in range(hear_cnt - 1):
+        cur_operator_hear = operator_hears[i]
+        later_bits = all_bits & ~((1 << (i + 1)) - 1)
+        # TODO: why do we always add the future_operator_hear when i == 0?
+        if i == 0:
+            cancelled_bits = later_bits
+        elif cur_operator_hear.etype == OperatorHearTypes.DELETED:
+            # Any later operator_hear other than DELETED conflicts in type
+            cancelled_bits = later_bits & non_deleted_bits
+        else:
+            # Any later DELETED conflicts in type,
+            # and any other later operator_hear conflicts if it does not meet the conditions
+            cancelled_bits = deleted_bits
+            if payload_conditions[i] is not None:
+                matched_bits = non_deleted_bits
+                for path, value in payload_conditions[i]:
+                    matched_bits &= condition_to_bits[path].get(value, 0)
+                    if matched_bits == 0:
+                        break
+                cancelled_bits |= non_deleted_bits & ~matched_bits
+            cancelled_bits &= later_bits
+        cur_operator_hear.cancelled_by = {
+            operator_hears[j].id for j in positions_of_bits(cancelled_bits)
+        }
+
+
+def diff_operator_writes(
+    operator_writes: List[OperatorWrite],
+    prev_reads: List[Tuple[Dict, str, Optional[Tuple]]],
+    mask_spec: MaskSpec,
+    delta_cache: EventDeltaCache,
+):
+    # operator_writes should be all the operator_writes of one key in order
+    # and prev_reads[i] is the object, etype and payload of the read before operator_writes[i]
+    event_signature_to_counter = {}
+    for i in range(len(operator_writes)):
+        operator_write = operator_writes[i]
+        prev_read_obj_map, prev_read_etype, prev_read_payload = prev_reads[i]
+        slim_prev_object, slim_cur_object = delta_cache.diff_event(
+            prev_read_payload,
+            operator_write.obj_str,
+            mask_spec,
+            True,
+            lambda: prev_read_obj_map,
+            lambda: operator_write.obj_map,
+        )
+        operator_write.prev_obj_map = prev_read_obj_map
+        operator_write.slim_prev_obj_map = slim_prev_object
+        operator_write.slim_cur_obj_map = slim_cur_object
+        operator_write.prev_etype = prev_read_etype
+        event_signature = get_event_signature(operator_write)
+        if event_signature not in event_signature_to_counter:
+            event_signature_to_counter[event_signature] = 0
+        event_signature_to_counter[event_signature] += 1
+        operator_write.signature_counter = event_signature_to_counter[event_signature]
+
+
+def positions_of_bits(bits: int):
+    # Yields the positions of the set bits in ascending order
+    reversed_bits = bin(bits)[:1:-1]
+    position = reversed_bits.find("1")
+    while position != -1:
+        yield position
+        position = reversed_bits.find("1", position + 1)
+
+
+def run_shards(pool, analyze_shard, shards: List):
+    # Runs the largest shards first for better load balancing,
+    # and returns the results in the order of the shards
+    order = sorted(range(len(shards)), key=lambda i: len(shards[i][0]), reverse=True)
+    results = [None] * len(shards)
+    for i, result in zip(
+        order, pool.imap(analyze_shard, [shards[i] for i in order], chunksize=1)
+    ):
+        results[i] = result
+    return results
+
+
+def analyze_operator_hear_shard(shard):
+    raw_operator_hears, mask_spec, diff_cache_size = shard
+    delta_cache = EventDeltaCache(diff_cache_size)
+    operator_hears = [
+        OperatorHear(str(id), etype, rtype, obj_str)
+        for id, etype, rtype, obj_str in raw_operator_hears
+    ]
+    diff_and_cancel_operator_hears(operator_hears, mask_spec, delta_cache)
+    results = [
+        (
+            operator_hear.slim_prev_obj_map,
+            operator_hear.slim_cur_obj_map,
+            operator_hear.prev_etype,
+            operator_hear.signature,
+            operator_hear.signature_counter,
+            operator_hear.cancelled_by,
+        )
+        for operator_hear in operator_hears
+    ]
+    return results, delta_cache.hits, delta_cache.misses
+
+
+def analyze_operator_write_shard(shard):
+    raw_operator_writes, prev_reads, mask_spec, diff_cache_size = shard
+    delta_cache = EventDeltaCache(diff_cache_size)
+    operator_writes = [
+        OperatorWrite(str(id), etype, rtype, reconciler_type, error, obj_str)
+        for id, etype, rtype, reconciler_type, error, obj_str in raw_operator_writes
+    ]
+    diff_operator_writes(operator_writes, prev_reads, mask_spec, delta_cache)
+    results = [
+        (
+            operator_write.slim_prev_obj_map,
+            operator_write.slim_cur_obj_map,
+            operator_write.prev_etype,
+            operator_write.signature,
+            operator_write.signature_counter,
+        )
+        for operator_write in operator_writes
+    ]
+    return results, delta_cache.hits, delta_cache.misses
+
+
+def restore_event_graph(snapshot: Dict) -> EventGraph:
+    # Rebuilds a finalized EventGraph from EventGraph.snapshot
+    event_graph = EventGraph(
+        snapshot["learned_masked_paths"],
+        snapshot["configured_masked_keys"],
+        snapshot["configured_masked_paths"],
+        snapshot["key_table"],
+    )
+    event_graph.add_sorted_operator_hears(snapshot["operator_hears"])
+    event_graph.add_sorted_reconciler_events(snapshot["reconciler_events"])
+    gid_to_vertex = {}
+    for vertex in (
+        event_graph.operator_hear_vertices
+        + event_graph.operator_write_vertices
+        + event_graph.operator_non_k8s_write_vertices
+    ):
+        gid_to_vertex[vertex.gid] = vertex
+    # The edges were checked by connect_hear_to_write and connect_write_to_hear
+    # when the graph was built (and sanity_check checks them again),
+    # so they are added back directly as there can be millions of them
+    for edges, (source_gids, sink_gids) in [
+        (
+            event_graph.operator_hear_operator_write_edges,
+            snapshot["operator_hear_operator_write_edges"],
+        ),
+        (
+            event_graph.operator_write_operator_hear_edges,
+            snapshot["operator_write_operator_hear_edges"],
+        ),
+    ]:
+        for source_gid, sink_gid in zip(source_gids, sink_gids):
+            source = gid_to_vertex[source_gid]
+            edge = EventEdge(source, gid_to_vertex[sink_gid], INTER_RECONCILER_EDGE)
+            source.out_inter_reconciler_edges.append(edge)
+            edges.append(edge)
+    return event_graph
+
+
+def edge_gids(edges: List[EventEdge]) -> Tuple[List[int], List[int]]:
+    # The gids of the sources and the sinks of the edges, as two flat lists
+    return [edge.source.gid for edge in edges], [edge.sink.gid for edge in edges]
 
 
 def event_vertices_reachable(source: EventVertex, sink: EventVertex):
     # there should be no cycles in the casuality graph
-    queue = []
+    # EventGraph.vertices_reachable uses the reachability index instead if it is built
+    queue = deque()
     visited = set()
     queue.append(source)
     visited.add(source.gid)
     if source.gid == sink.gid:
         return True
     while len(queue) != 0:
-        cur = queue.pop(0)
+        cur = queue.popleft()
         for edge in cur.out_inter_reconciler_edges:
             assert cur.gid == edge.source.gid
             assert (
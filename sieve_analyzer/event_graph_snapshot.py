@@ -0,0 +1,145 @@
+import gc
+import hashlib
+import importlib
+import json
+import os
+import pickle
+from typing import Dict, Optional
+from sieve_common.common import TestContext
+from sieve_common.artifact_storage import resolve_artifact_path
+from sieve_analyzer.event_graph import EventGraph, restore_event_graph
+
+# Bump the version whenever the layout of the snapshot changes
+# so that the snapshots written by an older Sieve are treated as stale.
+# A change to the way the event graph is built is caught by the source digest instead.
+EVENT_GRAPH_SNAPSHOT_VERSION = 1
+EVENT_GRAPH_SNAPSHOT = "event_graph.snapshot"
+# The modules whose code decides what the event graph is built from the log
+EVENT_GRAPH_SOURCE_MODULES = [
+    "sieve_common.k8s_event",
+    "sieve_common.event_delta",
+    "sieve_analyzer.event_graph",
+    "sieve_analyzer.analyze",
+]
+# The only classes a snapshot is allowed to create when it is loaded
+EVENT_GRAPH_SNAPSHOT_CLASSES = {
+    ("sieve_common.k8s_event", "ResourceKeyTable"),
+    ("sieve_common.k8s_event", "OperatorHear"),
+    ("sieve_common.k8s_event", "OperatorWrite"),
+    ("sieve_common.k8s_event", "OperatorNonK8sWrite"),
+    ("sieve_common.k8s_event", "OperatorRead"),
+    ("sieve_common.k8s_event", "ReconcileBegin"),
+    ("sieve_common.k8s_event", "ReconcileEnd"),
+}
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_digest() -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for module_name in EVENT_GRAPH_SOURCE_MODULES:
+        module = importlib.import_module(module_name)
+        digest.update(file_digest(module.__file__).encode())
+    return digest.hexdigest()
+
+
+def module_flags() -> Dict:
+    # The *_FLAG switches of the modules building the graph, as currently set
+    # (analyze has its own copies of the k8s_event flags through import *)
+    flags = {}
+    for module_name in EVENT_GRAPH_SOURCE_MODULES:
+        module = importlib.import_module(module_name)
+        for name in dir(module):
+            if name.endswith("_FLAG"):
+                flags[module_name + "." + name] = getattr(module, name)
+    return flags
+
+
+def event_graph_fingerprint(
+    test_context: TestContext, log_path: str, oracle_dir: str
+) -> Dict:
+    # Everything the event graph is built from:
+    # the sieve log (might be stored compressed), the masks,
+    # the config and the flags that change how the log is parsed,
+    # and the code that builds the graph
+    common_config = test_context.common_config
+    controller_config = test_context.controller_config
+    return {
+        "log": file_digest(resolve_artifact_path(log_path)[0]),
+        "mask": file_digest(os.path.join(oracle_dir, "mask.json")),
+        "field_key_mask": json.dumps(common_config.field_key_mask, sort_keys=True),
+        "field_path_mask": json.dumps(common_config.field_path_mask, sort_keys=True),
+        "compress_trivial_reconcile_enabled": (
+            common_config.compress_trivial_reconcile_enabled
+        ),
+        "loosen_reconciler_boundary": controller_config.loosen_reconciler_boundary,
+        "flags": module_flags(),
+        "source": source_digest(),
+    }
+
+
+class EventGraphSnapshotUnpickler(pickle.Unpickler):
+    # A snapshot is only a file in the result dir, so loading it must not be able to
+    # call anything: only the event classes in EVENT_GRAPH_SNAPSHOT_CLASSES are found,
+    # and the rest of the snapshot is plain data (dicts, lists, sets, strs and ints)
+    def find_class(self, module, name):
+        if (module, name) not in EVENT_GRAPH_SNAPSHOT_CLASSES:
+            raise pickle.UnpicklingError(
+                "%s.%s is not allowed in an event graph snapshot" % (module, name)
+            )
+        return super().find_class(module, name)
+
+
+def write_event_graph_snapshot(
+    log_dir: str, event_graph: EventGraph, fingerprint: Dict
+):
+    # The header is pickled before the graph so that a stale snapshot
+    # is told apart without loading the graph
+    header = {
+        "version": EVENT_GRAPH_SNAPSHOT_VERSION,
+        "fingerprint": fingerprint,
+    }
+    snapshot_path = os.path.join(log_dir, EVENT_GRAPH_SNAPSHOT)
+    # Write to a temporary file first so that a reader never sees a partial snapshot
+    tmp_snapshot_path = snapshot_path + ".tmp"
+    with open(tmp_snapshot_path, "wb") as snapshot_file:
+        pickle.dump(header, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(
+            event_graph.snapshot(), snapshot_file, protocol=pickle.HIGHEST_PROTOCOL
+        )
+    os.replace(tmp_snapshot_path, snapshot_path)
+
+
+def read_event_graph_snapshot(log_dir: str, fingerprint: Dict) -> Optional[EventGraph]:
+    # The snapshot is only trusted if it is written by the same snapshot version
+    # from the same log, masks and config
+    snapshot_path = os.path.join(log_dir, EVENT_GRAPH_SNAPSHOT)
+    if not os.path.isfile(snapshot_path):
+        return None
+    # Loading the graph creates millions of objects and none of them is garbage,
+    # so the cyclic garbage collector would only rescan them over and over
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        try:
+            with open(snapshot_path, "rb") as snapshot_file:
+                header = EventGraphSnapshotUnpickler(snapshot_file).load()
+                if not isinstance(header, dict):
+                    return None
+                if header.get("version") != EVENT_GRAPH_SNAPSHOT_VERSION:
+                    return None
+                if header.get("fingerprint") != fingerprint:
+                    return None
+                snapshot = EventGraphSnapshotUnpickler(snapshot_file).load()
+        except Exception:
+            return None
+        return restore_event_graph(snapshot)
+    finally:
+        if gc_enabled:
+            gc.enable()
@@ -0,0 +1,142 @@
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+from sieve_common.k8s_event import (
+    APIEvent,
+    SIEVE_API_EVENT_MARK,
+    parse_api_event_tokens,
+)
+from sieve_common.trace_cache import API_SERVER_LOG, load_api_events
+
+
+class APIEventStore:
+    """
+    Holds all the api events recorded in one apiserver log.
+    The events are kept in the order they are logged,
+    and each resource key is mapped to its versions (i.e., its api events) in order.
+    The store is built once per result dir and shared by all the oracle generators
+    so that the log is only parsed (and each payload only decoded) once.
+    """
+
+    def __init__(self, api_events: List[APIEvent], key_index: Dict[str, List[int]]):
+        self.__api_events = api_events
+        self.__key_to_versions = {}
+        for key in key_index:
+            self.__key_to_versions[key] = [api_events[i] for i in key_index[key]]
+
+    @property
+    def api_events(self) -> List[APIEvent]:
+        return self.__api_events
+
+    @property
+    def key_to_versions(self) -> Dict[str, List[APIEvent]]:
+        return self.__key_to_versions
+
+    def add(self, api_event: APIEvent):
+        self.__api_events.append(api_event)
+        if api_event.key not in self.__key_to_versions:
+            self.__key_to_versions[api_event.key] = []
+        self.__key_to_versions[api_event.key].append(api_event)
+
+    def __iter__(self):
+        return iter(self.__api_events)
+
+    def __len__(self):
+        return len(self.__api_events)
+
+    def keys(self):
+        return self.__key_to_versions.keys()
+
+    def versions(self, key: str) -> List[APIEvent]:
+        return self.__key_to_versions.get(key, [])
+
+    def last_version(self, key: str) -> APIEvent:
+        return self.__key_to_versions[key][-1]
+
+
+def build_api_event_store(log_dir: str, persist_cache: bool = False) -> APIEventStore:
+    api_events, key_index = load_api_events(
+        os.path.join(log_dir, API_SERVER_LOG), persist_cache
+    )
+    return APIEventStore(api_events, key_index)
+
+
+class APIEventIngester(threading.Thread):
+    """
+    Tails an apiserver log while it is still being written (e.g., by kubectl logs -f)
+    and adds each api event to an APIEventStore as soon as its line is complete.
+    on_api_event, if given, is called on every ingested api event
+    so that the callers can build their summaries incrementally.
+    The store should only be read after finish() returns.
+    """
+
+    def __init__(
+        self,
+        log_path: str,
+        on_api_event: Optional[Callable[[APIEvent], None]] = None,
+        poll_interval: float = 0.5,
+    ):
+        super().__init__(daemon=True)
+        self.log_path = log_path
+        self.api_event_store = APIEventStore([], {})
+        self.on_api_event = on_api_event
+        self.poll_interval = poll_interval
+        self.__stopped = threading.Event()
+        self.__log_file = None
+        # The chunks read since the last complete line
+        self.__pending = []
+        self.__ingested_size = 0
+        self.__error = None
+
+    def run(self):
+        try:
+            self.__log_file = open(self.log_path, "rb")
+            while not self.__stopped.is_set():
+                self.__ingest()
+                self.__stopped.wait(self.poll_interval)
+        except Exception as e:
+            self.__error = e
+
+    def __ingest(self, final=False):
+        chunk = self.__log_file.read()
+        self.__ingested_size += len(chunk)
+        if chunk:
+            self.__pending.append(chunk)
+        if not final and b"\n" not in chunk:
+            # A long line might be written in many small chunks,
+            # so its chunks are only joined once the line is complete
+            return
+        lines = b"".join(self.__pending).split(b"\n")
+        # The last line is not complete yet unless the log is not written any more
+        self.__pending = [] if final else [lines.pop()]
+        mark = SIEVE_API_EVENT_MARK.encode()
+        for line in lines:
+            mark_start = line.find(mark)
+            if mark_start == -1:
+                continue
+            line = line[mark_start:]
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            api_event = parse_api_event_tokens(line.decode().split("\t"))
+            self.api_event_store.add(api_event)
+            if self.on_api_event is not None:
+                self.on_api_event(api_event)
+
+    def finish(self) -> bool:
+        # Should be called after the log is no longer written.
+        # Returns whether the store covers the whole log;
+        # if not, the caller should parse the log from scratch.
+        self.__stopped.set()
+        self.join()
+        if self.__log_file is None:
+            return False
+        try:
+            if self.__error is None:
+                self.__ingest(final=True)
+        except Exception as e:
+            self.__error = e
+        finally:
+            self.__log_file.close()
+        if self.__error is not None:
+            return False
+        return self.__ingested_size == os.path.getsize(self.log_path)
@@ -0,0 +1,133 @@
+import gzip
+import io
+import json
+import os
+import shutil
+from sieve_common.common import cprint, bcolors
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Logs in the result dir that are stored compressed if artifact_compression is set.
+# Each compressed artifact replaces the plain one and carries the suffix of its compression,
+# e.g., apiserver1.log becomes apiserver1.log.gz.
+COMPRESSIBLE_LOGS = [
+    "apiserver1.log",
+    "streamed-operator.log",
+    "operator.log",
+    "sieve-server.log",
+]
+
+
+class artifact_compressions:
+    NONE = "none"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+
+COMPRESSION_SUFFIX = {
+    artifact_compressions.GZIP: ".gz",
+    artifact_compressions.ZSTD: ".zst",
+}
+
+
+def usable_compression(compression: str):
+    if compression == artifact_compressions.ZSTD and zstandard is None:
+        cprint("zstandard is not installed; falling back to gzip", bcolors.WARNING)
+        return artifact_compressions.GZIP
+    return compression
+
+
+def resolve_artifact_path(path: str):
+    # Returns the path of the stored artifact (plain or compressed) and its compression,
+    # or (None, None) if the artifact does not exist
+    if os.path.isfile(path):
+        return path, artifact_compressions.NONE
+    for compression in COMPRESSION_SUFFIX:
+        compressed_path = path + COMPRESSION_SUFFIX[compression]
+        if os.path.isfile(compressed_path):
+            return compressed_path, compression
+    return None, None
+
+
+def artifact_exists(path: str):
+    return resolve_artifact_path(path)[0] is not None
+
+
+def is_compressed_artifact(path: str):
+    return resolve_artifact_path(path)[1] not in [None, artifact_compressions.NONE]
+
+
+def open_artifact(path: str, mode: str = "r"):
+    """
+    Opens the artifact at path for streaming read, whether it is stored plain or compressed.
+    mode is "r" for text and "rb" for bytes.
+    """
+    assert mode in ["r", "rb"]
+    stored_path, compression = resolve_artifact_path(path)
+    if stored_path is None:
+        raise FileNotFoundError(path)
+    if compression == artifact_compressions.GZIP:
+        return gzip.open(stored_path, "rt" if mode == "r" else "rb")
+    if compression == artifact_compressions.ZSTD:
+        assert zstandard is not None, "zstandard is required to read %s" % stored_path
+        reader = zstandard.ZstdDecompressor().stream_reader(open(stored_path, "rb"))
+        return io.TextIOWrapper(reader) if mode == "r" else io.BufferedReader(reader)
+    return open(stored_path, mode)
+
+
+def remove_artifact(path: str):
+    for stored_path in [path] + [
+        path + suffix for suffix in COMPRESSION_SUFFIX.values()
+    ]:
+        if os.path.isfile(stored_path):
+            os.remove(stored_path)
+
+
+def open_artifact_for_write(path: str, compression: str, mode: str = "w"):
+    assert mode in ["w", "wb"]
+    compression = usable_compression(compression)
+    # Drop the previously stored artifact (if any) so that it does not shadow the new one
+    remove_artifact(path)
+    if compression == artifact_compressions.GZIP:
+        return gzip.open(
+            path + COMPRESSION_SUFFIX[compression], "wt" if mode == "w" else "wb"
+        )
+    if compression == artifact_compressions.ZSTD:
+        writer = zstandard.ZstdCompressor().stream_writer(
+            open(path + COMPRESSION_SUFFIX[compression], "wb")
+        )
+        return io.TextIOWrapper(writer) if mode == "w" else writer
+    return open(path, mode)
+
+
+def compress_artifact(path: str, compression: str):
+    # Compresses the plain artifact at path as a stream and removes the plain one
+    if compression == artifact_compressions.NONE or not os.path.isfile(path):
+        return
+    compression = usable_compression(compression)
+    tmp_path = path + ".tmp"
+    os.replace(path, tmp_path)
+    with open(tmp_path, "rb") as plain_file:
+        with open_artifact_for_write(path, compression, "wb") as compressed_file:
+            shutil.copyfileobj(plain_file, compressed_file)
+    os.remove(tmp_path)
+
+
+def compress_logs(log_dir: str, compression: str):
+    for log in COMPRESSIBLE_LOGS:
+        compress_artifact(os.path.join(log_dir, log), compression)
+
+
+def dump_json_artifact(dir: str, data, json_file_name: str, compression: str):
+    with open_artifact_for_write(
+        os.path.join(dir, json_file_name), compression
+    ) as json_file:
+        json.dump(data, json_file, indent=4, sort_keys=True)
+
+
+def load_json_artifact(path: str):
+    with open_artifact(path) as json_file:
+        return json.load(json_file)
@@ -50,6 +50,7 @@ TIME_REG = "^[0-9]+-[0-9]+-[0-9]+T[0-9]+:[0-9]+:[0-9]+Z$"
 IP_REG = "^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$"
 
 MASK_REGS = [TIME_REG, IP_REG]
+MASK_PATTERNS = [re.compile(reg) for reg in MASK_REGS]
 
 
 class sieve_stages:
@@ -113,6 +114,7 @@ class TestContext:
         self.rate_limiter_enabled = rate_limiter_enabled
         self.test_plan = None
         self.action_types = []
+        self.incremental_ingestion = None
         if self.stage == sieve_stages.TEST and self.mode == sieve_modes.TEST:
             self.test_plan = yaml.safe_load(open(original_test_config))
             if self.test_plan["actions"] is not None:
@@ -152,8 +154,7 @@ class TestResult:
 def match_mask_regex(val):
     # Search for ignore regex
     if type(val) is str:
-        for reg in MASK_REGS:
-            pat = re.compile(reg)
+        for pat in MASK_PATTERNS:
             if pat.match(val):
                 return True
     return False
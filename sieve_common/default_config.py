@@ -23,6 +23,13 @@ class CommonConfig:
         effective_updates_pruning_enabled,
         nondeterministic_pruning_enabled,
         persist_test_plans_enabled,
+        trace_cache_enabled,
+        incremental_ingestion_enabled,
+        artifact_compression,
+        analysis_workers,
+        diff_cache_size,
+        reachability_index_enabled,
+        event_graph_snapshot_enabled,
         field_key_mask,
         field_path_mask,
         state_update_summary_checker_mask,
@@ -50,6 +57,13 @@ class CommonConfig:
         self.effective_updates_pruning_enabled = effective_updates_pruning_enabled
         self.nondeterministic_pruning_enabled = nondeterministic_pruning_enabled
         self.persist_test_plans_enabled = persist_test_plans_enabled
+        self.trace_cache_enabled = trace_cache_enabled
+        self.incremental_ingestion_enabled = incremental_ingestion_enabled
+        self.artifact_compression = artifact_compression
+        self.analysis_workers = analysis_workers
+        self.diff_cache_size = diff_cache_size
+        self.reachability_index_enabled = reachability_index_enabled
+        self.event_graph_snapshot_enabled = event_graph_snapshot_enabled
         self.field_key_mask = field_key_mask
         self.field_path_mask = field_path_mask
         self.state_update_summary_checker_mask = state_update_summary_checker_mask
@@ -96,6 +110,13 @@ def get_common_config():
             "nondeterministic_pruning_enabled"
         ],
         persist_test_plans_enabled=common_config["persist_test_plans_enabled"],
+        trace_cache_enabled=common_config["trace_cache_enabled"],
+        incremental_ingestion_enabled=common_config["incremental_ingestion_enabled"],
+        artifact_compression=common_config["artifact_compression"],
+        analysis_workers=common_config["analysis_workers"],
+        diff_cache_size=common_config["diff_cache_size"],
+        reachability_index_enabled=common_config["reachability_index_enabled"],
+        event_graph_snapshot_enabled=common_config["event_graph_snapshot_enabled"],
         field_key_mask=common_config["field_key_mask"],
         field_path_mask=common_config["field_path_mask"],
         state_update_summary_checker_mask=common_config[
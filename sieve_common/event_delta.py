@@ -1,51 +1,374 @@
-import copy
-from typing import Dict, List, Tuple, Optional, Set
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Tuple, Optional, Set
 from sieve_common.common import *
 
+# The top level fields ignored by diff_event if trim_ka is set
+TRIMMED_KEYS = ("kind", "apiVersion")
+
+
+class MaskPathNode:
+    __slots__ = ("path", "masked", "children")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.masked = False
+        self.children = {}
+
+
+class MaskSpec:
+    """
+    The compiled masks of a resource key, which is built once and reused by
+    every canonicalization of the objects of that key.
+    keys are the field names to mask anywhere in the object.
+    paths are the masked field paths (e.g., "metadata/annotations", "*" for list items),
+    which are also organized as a trie so that canonicalization can follow the object
+    without building the path string of every field.
+    """
+
+    __slots__ = ("keys", "paths", "path_trie")
+
+    def __init__(self, masked_keys: Set[str], masked_paths: Set[str]):
+        self.keys = frozenset(masked_keys)
+        self.paths = frozenset(masked_paths)
+        self.path_trie = MaskPathNode("")
+        for masked_path in self.paths:
+            node = self.path_trie
+            for field in masked_path.split("/"):
+                if field not in node.children:
+                    node.children[field] = MaskPathNode(
+                        join_field_path(node.path, field)
+                    )
+                node = node.children[field]
+            node.masked = True
+
+    def __eq__(self, other):
+        # Specs compiled from the same masks are interchangeable,
+        # e.g., as a part of the key of EventDeltaCache
+        if not isinstance(other, MaskSpec):
+            return NotImplemented
+        return self.keys == other.keys and self.paths == other.paths
+
+    def __hash__(self):
+        return hash((self.keys, self.paths))
+
+
+def join_field_path(parent_path: str, field: str):
+    # Same as os.path.join(parent_path, field) which the field paths are defined by
+    if field.startswith("/"):
+        return field
+    if parent_path == "" or parent_path.endswith("/"):
+        return parent_path + field
+    return parent_path + "/" + field
+
+
+def is_plain_field(field: str):
+    # A plain field adds exactly one level to the field path
+    return field != "" and "/" not in field
+
+
+def locate_field(
+    mask_spec: MaskSpec,
+    node: Optional[MaskPathNode],
+    path: Optional[str],
+    field: str,
+):
+    # Returns (node, path, masked) of the field under (node, path).
+    # The trie node is used as long as the fields are plain and
+    # node being None means no masked path is under the field.
+    # For a field that is not plain we fall back to the path string.
+    if path is None:
+        if is_plain_field(field):
+            child = node.children.get(field) if node is not None else None
+            return child, None, child is not None and child.masked
+        if node is not None:
+            path = node.path
+        elif not field.startswith("/"):
+            # An absolute field resets the path; otherwise nothing below can be masked
+            return None, None, False
+        else:
+            path = ""
+    child_path = join_field_path(path, field)
+    return None, child_path, child_path in mask_spec.paths
+
+
+def canonicalize_value(value: str):
+    if match_mask_regex(value):
+        return SIEVE_VALUE_MASK
+    else:
+        return value
+
+
+def canonicalize_event_as_list(
+    event: List,
+    mask_spec: MaskSpec,
+    node: Optional[MaskPathNode],
+    path: Optional[str],
+):
+    child_node, child_path, masked = locate_field(mask_spec, node, path, "*")
+    for i in range(len(event)):
+        if masked:
+            event[i] = SIEVE_VALUE_MASK
+            continue
+        value = event[i]
+        if isinstance(value, list):
+            canonicalize_event_as_list(value, mask_spec, child_node, child_path)
+        elif isinstance(value, dict):
+            canonicalize_event_as_map(value, mask_spec, child_node, child_path)
+        elif isinstance(value, str):
+            event[i] = canonicalize_value(value)
+
+
+def canonicalize_event_as_map(
+    event: Dict,
+    mask_spec: MaskSpec,
+    node: Optional[MaskPathNode],
+    path: Optional[str],
+):
+    for key in event:
+        if key in mask_spec.keys:
+            event[key] = SIEVE_VALUE_MASK
+            continue
+        child_node, child_path, masked = locate_field(mask_spec, node, path, key)
+        if masked:
+            event[key] = SIEVE_VALUE_MASK
+            continue
+        value = event[key]
+        if isinstance(value, dict):
+            canonicalize_event_as_map(value, mask_spec, child_node, child_path)
+        elif isinstance(value, list):
+            canonicalize_event_as_list(value, mask_spec, child_node, child_path)
+        elif isinstance(value, str):
+            event[key] = canonicalize_value(value)
+
+
+def canonicalize_event(event: Dict, mask_spec: MaskSpec):
+    canonicalize_event_as_map(event, mask_spec, mask_spec.path_trie, None)
+
+
+def locate_map_field(
+    mask_spec: Optional[MaskSpec],
+    node: Optional[MaskPathNode],
+    path: Optional[str],
+    key: str,
+):
+    # Same as locate_field, but the field is a key of a map
+    # so it can also be masked by mask_spec.keys.
+    # mask_spec being None means the event is not canonicalized at all.
+    if mask_spec is None:
+        return None, None, False
+    if key in mask_spec.keys:
+        return None, None, True
+    return locate_field(mask_spec, node, path, key)
+
+
+def locate_list_item(
+    mask_spec: Optional[MaskSpec],
+    node: Optional[MaskPathNode],
+    path: Optional[str],
+):
+    if mask_spec is None:
+        return None, None, False
+    return locate_field(mask_spec, node, path, "*")
+
+
+def canonical_scalar(value, mask_spec: Optional[MaskSpec]):
+    if mask_spec is not None and isinstance(value, str):
+        return canonicalize_value(value)
+    return value
+
+
+def canonical_copy(
+    value,
+    mask_spec: Optional[MaskSpec],
+    node: Optional[MaskPathNode],
+    path: Optional[str],
+):
+    # Returns the canonicalized value as a new object and leaves value untouched
+    if isinstance(value, dict):
+        copied_value = {}
+        for key in value:
+            child_node, child_path, masked = locate_map_field(
+                mask_spec, node, path, key
+            )
+            if masked:
+                copied_value[key] = SIEVE_VALUE_MASK
+            else:
+                copied_value[key] = canonical_copy(
+                    value[key], mask_spec, child_node, child_path
+                )
+        return copied_value
+    elif isinstance(value, list):
+        child_node, child_path, masked = locate_list_item(mask_spec, node, path)
+        if masked:
+            return [SIEVE_VALUE_MASK] * len(value)
+        return [
+            canonical_copy(item, mask_spec, child_node, child_path) for item in value
+        ]
+    return canonical_scalar(value, mask_spec)
+
+
+def same_value(value, other) -> bool:
+    # Unlike ==, tells apart the equal values of different types (e.g., 1, 1.0 and True)
+    if type(value) is not type(other):
+        return False
+    if isinstance(value, dict):
+        if len(value) != len(other):
+            return False
+        for key in value:
+            if key not in other or not same_value(value[key], other[key]):
+                return False
+        return True
+    if isinstance(value, list):
+        if len(value) != len(other):
+            return False
+        for i in range(len(value)):
+            if not same_value(value[i], other[i]):
+                return False
+        return True
+    return value == other
+
+
+def canonical_copy_from_prev(
+    value,
+    prev_value,
+    canonical_prev_value,
+    mask_spec: MaskSpec,
+    node: Optional[MaskPathNode],
+    path: Optional[str],
+):
+    # Same as canonical_copy(value, ...), but every subtree of value equal to
+    # the one at the same field path of prev_value reuses (shares) the subtree of
+    # canonical_prev_value, which is the canonicalized prev_value, instead of being copied.
+    # The subtrees are first compared by the native == and the equal ones are then
+    # checked by same_value, as sharing a subtree that is only equal by == (e.g., 1 and True)
+    # would put the values of prev_value into the canonicalized value.
+    if value == prev_value and same_value(value, prev_value):
+        return canonical_prev_value
+    if isinstance(value, dict) and isinstance(prev_value, dict):
+        copied_value = {}
+        for key in value:
+            child_node, child_path, masked = locate_map_field(
+                mask_spec, node, path, key
+            )
+            if masked:
+                copied_value[key] = SIEVE_VALUE_MASK
+            elif key in prev_value:
+                copied_value[key] = canonical_copy_from_prev(
+                    value[key],
+                    prev_value[key],
+                    canonical_prev_value[key],
+                    mask_spec,
+                    child_node,
+                    child_path,
+                )
+            else:
+                copied_value[key] = canonical_copy(
+                    value[key], mask_spec, child_node, child_path
+                )
+        return copied_value
+    elif isinstance(value, list) and isinstance(prev_value, list):
+        child_node, child_path, masked = locate_list_item(mask_spec, node, path)
+        if masked:
+            return [SIEVE_VALUE_MASK] * len(value)
+        prev_len = len(prev_value)
+        return [
+            canonical_copy_from_prev(
+                value[i],
+                prev_value[i],
+                canonical_prev_value[i],
+                mask_spec,
+                child_node,
+                child_path,
+            )
+            if i < prev_len
+            else canonical_copy(value[i], mask_spec, child_node, child_path)
+            for i in range(len(value))
+        ]
+    return canonical_copy(value, mask_spec, node, path)
+
+
+def diff_value(
+    prev_value,
+    cur_value,
+    mask_spec: Optional[MaskSpec],
+    node: Optional[MaskPathNode],
+    path: Optional[str],
+):
+    # Returns (changed, diff_prev_value, diff_cur_value) of the canonicalized values.
+    # Equal values are canonicalized to equal values, so an identical subtree
+    # is skipped by the equality short-circuit below without being walked here.
+    # The short-circuit is a plain (native) == on every level, not a cached hash:
+    # a changed subtree is compared again on each level above the change,
+    # which is O(depth * size) in the worst case but still far cheaper than the walk.
+    if prev_value == cur_value:
+        return False, None, None
+    if isinstance(cur_value, dict):
+        if isinstance(prev_value, dict):
+            sub_diff_prev_event, sub_diff_cur_event = diff_event_as_map(
+                prev_value, cur_value, mask_spec, node, path
+            )
+            if sub_diff_prev_event is None or sub_diff_cur_event is None:
+                return False, None, None
+            return True, sub_diff_prev_event, sub_diff_cur_event
+    elif isinstance(cur_value, list):
+        if isinstance(prev_value, list):
+            sub_diff_prev_event, sub_diff_cur_event = diff_event_as_list(
+                prev_value, cur_value, mask_spec, node, path
+            )
+            if sub_diff_prev_event is None or sub_diff_cur_event is None:
+                return False, None, None
+            return True, sub_diff_prev_event, sub_diff_cur_event
+    elif not isinstance(prev_value, (dict, list)):
+        canonical_prev_value = canonical_scalar(prev_value, mask_spec)
+        canonical_cur_value = canonical_scalar(cur_value, mask_spec)
+        if canonical_prev_value != canonical_cur_value:
+            return True, canonical_prev_value, canonical_cur_value
+        return False, None, None
+    return (
+        True,
+        canonical_copy(prev_value, mask_spec, node, path),
+        canonical_copy(cur_value, mask_spec, node, path),
+    )
+
 
 def diff_event_as_list(
-    prev_event: List, cur_event: List
+    prev_event: List,
+    cur_event: List,
+    mask_spec: Optional[MaskSpec] = None,
+    node: Optional[MaskPathNode] = None,
+    path: Optional[str] = None,
 ) -> Tuple[Optional[List], Optional[List]]:
     prev_len = len(prev_event)
     cur_len = len(cur_event)
     min_len = min(prev_len, cur_len)
     diff_prev_event = [SIEVE_IDX_SKIP] * prev_len
     diff_cur_event = [SIEVE_IDX_SKIP] * cur_len
-    for i in range(min_len):
-        if isinstance(cur_event[i], dict):
-            if not isinstance(prev_event[i], dict):
-                diff_prev_event[i] = prev_event[i]
-                diff_cur_event[i] = cur_event[i]
-            else:
-                sub_diff_prev_event, sub_diff_cur_event = diff_event_as_map(
-                    prev_event[i], cur_event[i]
-                )
-                if sub_diff_prev_event is None or sub_diff_cur_event is None:
-                    continue
-                diff_prev_event[i] = sub_diff_prev_event
-                diff_cur_event[i] = sub_diff_cur_event
-        elif isinstance(cur_event[i], list):
-            if not isinstance(prev_event[i], list):
-                diff_prev_event[i] = prev_event[i]
-                diff_cur_event[i] = cur_event[i]
-            else:
-                sub_diff_prev_event, sub_diff_cur_event = diff_event_as_list(
-                    prev_event[i], cur_event[i]
-                )
-                if sub_diff_prev_event is None or sub_diff_cur_event is None:
-                    continue
-                diff_prev_event[i] = sub_diff_prev_event
-                diff_cur_event[i] = sub_diff_cur_event
+    child_node, child_path, masked = locate_list_item(mask_spec, node, path)
+    # If the list items are masked, all of them are canonicalized to the same value
+    if not masked:
+        for i in range(min_len):
+            changed, diff_prev_value, diff_cur_value = diff_value(
+                prev_event[i], cur_event[i], mask_spec, child_node, child_path
+            )
+            if changed:
+                diff_prev_event[i] = diff_prev_value
+                diff_cur_event[i] = diff_cur_value
+    for i in range(min_len, prev_len):
+        if masked:
+            diff_prev_event[i] = SIEVE_VALUE_MASK
+        else:
+            diff_prev_event[i] = canonical_copy(
+                prev_event[i], mask_spec, child_node, child_path
+            )
+    for i in range(min_len, cur_len):
+        if masked:
+            diff_cur_event[i] = SIEVE_VALUE_MASK
         else:
-            if prev_event[i] != cur_event[i]:
-                diff_prev_event[i] = prev_event[i]
-                diff_cur_event[i] = cur_event[i]
-    if prev_len > min_len:
-        for i in range(min_len, prev_len):
-            diff_prev_event[i] = prev_event[i]
-    if cur_len > min_len:
-        for i in range(min_len, cur_len):
-            diff_cur_event[i] = cur_event[i]
+            diff_cur_event[i] = canonical_copy(
+                cur_event[i], mask_spec, child_node, child_path
+            )
     if cur_len == prev_len:
         keep = False
         for i in range(cur_len):
@@ -54,125 +377,75 @@ def diff_event_as_list(
                 or not diff_cur_event[i] == SIEVE_IDX_SKIP
             ):
                 keep = True
+                break
         if not keep:
             return None, None
     return diff_prev_event, diff_cur_event
 
 
 def diff_event_as_map(
-    prev_event: Dict, cur_event: Dict
+    prev_event: Dict,
+    cur_event: Dict,
+    mask_spec: Optional[MaskSpec] = None,
+    node: Optional[MaskPathNode] = None,
+    path: Optional[str] = None,
+    ignored_keys=(),
 ) -> Tuple[Optional[Dict], Optional[Dict]]:
     diff_prev_event = {}
     diff_cur_event = {}
-
-    common_keys = set(cur_event.keys()).intersection(prev_event.keys())
-    pdc_keys = set(prev_event.keys()).difference(cur_event.keys())
-    cdp_keys = set(cur_event.keys()).difference(prev_event.keys())
-    for key in common_keys:
-        if isinstance(cur_event[key], dict):
-            if not isinstance(prev_event[key], dict):
-                diff_prev_event[key] = prev_event[key]
-                diff_cur_event[key] = cur_event[key]
-            else:
-                sub_diff_prev_event, sub_diff_cur_event = diff_event_as_map(
-                    prev_event[key], cur_event[key]
-                )
-                if sub_diff_prev_event is None or sub_diff_cur_event is None:
-                    continue
-                diff_prev_event[key] = sub_diff_prev_event
-                diff_cur_event[key] = sub_diff_cur_event
-        elif isinstance(cur_event[key], list):
-            if not isinstance(prev_event[key], list):
-                diff_prev_event[key] = prev_event[key]
-                diff_cur_event[key] = cur_event[key]
+    for key in prev_event:
+        if key in ignored_keys:
+            continue
+        child_node, child_path, masked = locate_map_field(mask_spec, node, path, key)
+        if key not in cur_event:
+            if masked:
+                diff_prev_event[key] = SIEVE_VALUE_MASK
             else:
-                sub_diff_prev_event, sub_diff_cur_event = diff_event_as_list(
-                    prev_event[key], cur_event[key]
+                diff_prev_event[key] = canonical_copy(
+                    prev_event[key], mask_spec, child_node, child_path
                 )
-                if sub_diff_prev_event is None or sub_diff_cur_event is None:
-                    continue
-                diff_prev_event[key] = sub_diff_prev_event
-                diff_cur_event[key] = sub_diff_cur_event
+            continue
+        # A masked field is canonicalized to the same value on both sides
+        if masked:
+            continue
+        changed, diff_prev_value, diff_cur_value = diff_value(
+            prev_event[key], cur_event[key], mask_spec, child_node, child_path
+        )
+        if changed:
+            diff_prev_event[key] = diff_prev_value
+            diff_cur_event[key] = diff_cur_value
+    for key in cur_event:
+        if key in ignored_keys or key in prev_event:
+            continue
+        child_node, child_path, masked = locate_map_field(mask_spec, node, path, key)
+        if masked:
+            diff_cur_event[key] = SIEVE_VALUE_MASK
         else:
-            if prev_event[key] != cur_event[key]:
-                diff_prev_event[key] = prev_event[key]
-                diff_cur_event[key] = cur_event[key]
-    for key in pdc_keys:
-        diff_prev_event[key] = prev_event[key]
-    for key in cdp_keys:
-        diff_cur_event[key] = cur_event[key]
+            diff_cur_event[key] = canonical_copy(
+                cur_event[key], mask_spec, child_node, child_path
+            )
     if len(diff_cur_event) == 0 and len(diff_prev_event) == 0:
         return None, None
     return diff_prev_event, diff_cur_event
 
 
-def canonicalize_value(value: str):
-    if match_mask_regex(value):
-        return SIEVE_VALUE_MASK
-    else:
-        return value
-
-
-def canonicalize_event_as_list(
-    event: List, parent_path: str, masked_keys: Set[str], masked_paths: Set[str]
-):
-    for i in range(len(event)):
-        current_path = os.path.join(parent_path, "*")
-        if current_path in masked_paths:
-            event[i] = SIEVE_VALUE_MASK
-            continue
-        if isinstance(event[i], list):
-            canonicalize_event_as_list(
-                event[i], current_path, masked_keys, masked_paths
-            )
-        elif isinstance(event[i], dict):
-            canonicalize_event_as_map(event[i], current_path, masked_keys, masked_paths)
-        elif isinstance(event[i], str):
-            event[i] = canonicalize_value(event[i])
-
-
-def canonicalize_event_as_map(
-    event: Dict, parent_path: str, masked_keys: Set[str], masked_paths: Set[str]
-):
-    for key in event:
-        current_path = os.path.join(parent_path, key)
-        if key in masked_keys or current_path in masked_paths:
-            event[key] = SIEVE_VALUE_MASK
-            continue
-        if isinstance(event[key], dict):
-            canonicalize_event_as_map(
-                event[key], current_path, masked_keys, masked_paths
-            )
-        elif isinstance(event[key], list):
-            canonicalize_event_as_list(
-                event[key], current_path, masked_keys, masked_paths
-            )
-        elif isinstance(event[key], str):
-            event[key] = canonicalize_value(event[key])
-
-
-def canonicalize_event(event: Dict, masked_keys: Set[str], masked_paths: Set[str]):
-    canonicalize_event_as_map(event, "", masked_keys, masked_paths)
-
-
 def diff_event(
     prev_event: Dict,
     cur_event: Dict,
-    masked_keys: Set[str],
-    masked_paths: Set[str],
+    mask_spec: Optional[MaskSpec],
     trim_ka=False,
     can=True,
 ) -> Tuple[Optional[Dict], Optional[Dict]]:
-    prev_event_copy = copy.deepcopy(prev_event)
-    cur_event_copy = copy.deepcopy(cur_event)
-    if trim_ka:
-        trim_kind_apiversion(prev_event_copy)
-        trim_kind_apiversion(cur_event_copy)
-    if can:
-        canonicalize_event(prev_event_copy, masked_keys, masked_paths)
-        canonicalize_event(cur_event_copy, masked_keys, masked_paths)
-    diff_prev_event, diff_cur_event = diff_event_as_map(prev_event_copy, cur_event_copy)
-    return diff_prev_event, diff_cur_event
+    # The events are canonicalized on the fly while being diffed,
+    # so neither of them is copied or modified and only the slim diff is allocated.
+    # The result is the same as diffing the canonicalized copies of the events.
+    if prev_event == cur_event:
+        return None, None
+    if not can:
+        mask_spec = None
+    root = mask_spec.path_trie if mask_spec is not None else None
+    ignored_keys = TRIMMED_KEYS if trim_ka else ()
+    return diff_event_as_map(prev_event, cur_event, mask_spec, root, None, ignored_keys)
 
 
 def part_of_event_as_list(small_event: List, large_event: List) -> bool:
@@ -181,7 +454,7 @@ def part_of_event_as_list(small_event: List, large_event: List) -> bool:
     for i in range(len(small_event)):
         small_val = small_event[i]
         large_val = large_event[i]
-        if small_val == SIEVE_IDX_SKIP:
+        if small_val == SIEVE_IDX_SKIP or small_val == large_val:
             continue
         if isinstance(small_val, dict):
             if isinstance(large_val, dict):
@@ -208,6 +481,8 @@ def part_of_event_as_map(small_event: Dict, large_event: Dict) -> bool:
     for key in small_event:
         small_val = small_event[key]
         large_val = large_event[key]
+        if small_val == large_val:
+            continue
         if isinstance(small_val, dict):
             if isinstance(large_val, dict):
                 if not part_of_event_as_map(small_val, large_val):
@@ -226,20 +501,253 @@ def part_of_event_as_map(small_event: Dict, large_event: Dict) -> bool:
     return True
 
 
+EVENT_SIGNATURE_DIGEST_SIZE = 16
+
+
+def canonical_event_str(event: Optional[Dict]) -> str:
+    # The canonical serialization of a (slim) event
+    # shared by the event signatures and the generated test plans
+    return json.dumps(event, sort_keys=True)
+
+
+def event_signature_digest(
+    etype: str, slim_prev_event: Optional[Dict], slim_cur_event: Optional[Dict]
+) -> bytes:
+    # A fixed-size digest of the etype and the canonical slim events,
+    # so two signatures are equal iff the etypes and the slim events are equal
+    signature_hash = hashlib.blake2b(digest_size=EVENT_SIGNATURE_DIGEST_SIZE)
+    signature_hash.update(
+        "\t".join(
+            [
+                etype,
+                canonical_event_str(slim_prev_event),
+                canonical_event_str(slim_cur_event),
+            ]
+        ).encode()
+    )
+    return signature_hash.digest()
+
+
+# The markers standing for the structure at a field path (see part_of_event_conditions).
+# They never equal a JSON value.
+EVENT_MAP_MARK = ("SIEVE-MAP",)
+EVENT_MISSING_MARK = ("SIEVE-MISSING",)
+
+
+def event_list_mark(length: int):
+    return ("SIEVE-LIST", length)
+
+
+def collect_part_of_event_conditions(small_val, path: Tuple, conditions: List):
+    if isinstance(small_val, dict):
+        conditions.append((path, EVENT_MAP_MARK))
+        for key in small_val:
+            collect_part_of_event_conditions(small_val[key], path + (key,), conditions)
+    elif isinstance(small_val, list):
+        conditions.append((path, event_list_mark(len(small_val))))
+        for i in range(len(small_val)):
+            if small_val[i] == SIEVE_IDX_SKIP:
+                continue
+            collect_part_of_event_conditions(small_val[i], path + (i,), conditions)
+    else:
+        conditions.append((path, small_val))
+
+
+def part_of_event_conditions(small_event: Dict) -> List[Tuple[Tuple, object]]:
+    """
+    Turns small_event into the (field path, value) conditions such that
+    part_of_event_as_map(small_event, large_event) holds iff
+    event_value_at(large_event, path) == value for all the conditions.
+    A field path is a tuple of map keys (str) and list indexes (int).
+    """
+    conditions = []
+    collect_part_of_event_conditions(small_event, (), conditions)
+    return conditions
+
+
+def event_value_at(event: Dict, path: Tuple):
+    # Returns the value at path, where a map or a list is represented by its marker
+    value = event
+    for field in path:
+        if isinstance(field, int):
+            if not isinstance(value, list) or field >= len(value):
+                return EVENT_MISSING_MARK
+        elif not isinstance(value, dict) or field not in value:
+            return EVENT_MISSING_MARK
+        value = value[field]
+    if isinstance(value, dict):
+        return EVENT_MAP_MARK
+    if isinstance(value, list):
+        return event_list_mark(len(value))
+    return value
+
+
+def canonical_event(event: Dict, mask_spec: MaskSpec) -> Dict:
+    # Same as canonicalize_event, but on a copy of the event
+    return canonical_copy(event, mask_spec, mask_spec.path_trie, None)
+
+
 def conflicting_event_payload(
     small_event: Optional[Dict],
     large_event: Dict,
-    masked_keys: Set[str],
-    masked_paths: Set[str],
+    mask_spec: MaskSpec,
+) -> bool:
+    if small_event is None:
+        return False
+    return conflicting_canonical_event_payload(
+        small_event, canonical_event(large_event, mask_spec)
+    )
+
+
+def conflicting_canonical_event_payload(
+    small_event: Optional[Dict],
+    canonical_large_event: Dict,
 ) -> bool:
     if small_event is None:
         return False
-    large_event_copy = copy.deepcopy(large_event)
-    canonicalize_event(large_event_copy, masked_keys, masked_paths)
-    return not part_of_event_as_map(small_event, large_event_copy)
+    return not part_of_event_as_map(small_event, canonical_large_event)
+
+
+class EventDeltaCache:
+    """
+    A bounded LRU cache of the slim diffs and the canonicalized events.
+    The same object versions are diffed and canonicalized over and over
+    (e.g., when a controller resyncs), so each result is keyed by
+    the payloads of the events and the mask spec.
+    A payload is any hashable value identifying the content of an event (e.g., its obj_str)
+    and None stands for the empty event.
+    The events are only loaded (by calling load_event) on a miss.
+    A cached result is shared by all the hits, so it should never be modified.
+    """
+
+    def __init__(self, capacity: int):
+        self.__capacity = capacity
+        self.__entries = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def count(self, hits: int, misses: int):
+        # Merges the counters of another cache (e.g., of a worker process)
+        self.__hits += hits
+        self.__misses += misses
+
+    def __lookup(self, entry_key):
+        if entry_key in self.__entries:
+            self.__hits += 1
+            self.__entries.move_to_end(entry_key)
+            return True, self.__entries[entry_key]
+        self.__misses += 1
+        return False, None
+
+    def __store(self, entry_key, entry):
+        if self.__capacity <= 0:
+            return
+        self.__entries[entry_key] = entry
+        if len(self.__entries) > self.__capacity:
+            self.__entries.popitem(last=False)
+
+    def diff_event(
+        self,
+        prev_payload,
+        cur_payload,
+        mask_spec: MaskSpec,
+        trim_ka: bool,
+        load_prev_event: Callable[[], Dict],
+        load_cur_event: Callable[[], Dict],
+    ) -> Tuple[Optional[Dict], Optional[Dict]]:
+        entry_key = ("diff", prev_payload, cur_payload, mask_spec, trim_ka)
+        found, entry = self.__lookup(entry_key)
+        if not found:
+            entry = diff_event(load_prev_event(), load_cur_event(), mask_spec, trim_ka)
+            self.__store(entry_key, entry)
+        return entry
+
+    def canonical_event(
+        self,
+        payload,
+        mask_spec: MaskSpec,
+        load_event: Callable[[], Dict],
+    ) -> Dict:
+        entry_key = ("canonical", payload, mask_spec)
+        found, entry = self.__lookup(entry_key)
+        if not found:
+            entry = canonical_event(load_event(), mask_spec)
+            self.__store(entry_key, entry)
+        return entry
+
+    def diff_event_chain(
+        self,
+        payloads: List,
+        mask_spec: MaskSpec,
+        trim_ka: bool,
+        load_event: Callable[[int], Dict],
+    ) -> Iterator[Tuple[Optional[Dict], Optional[Dict], Dict]]:
+        """
+        Yields the slim diffs of the consecutive versions of one resource key in order,
+        i.e., the diff of version i - 1 and version i for each i
+        where the first version is diffed against the empty event,
+        together with the canonicalized version i.
+        Each version is canonicalized once and used for both of its diffs.
+        Version i is canonicalized from version i - 1 so that its unchanged fields
+        share the canonicalized fields of version i - 1 (see canonical_copy_from_prev),
+        which also makes the diff of the canonicalized versions skip them quickly.
+        The diffs are the same as calling diff_event for each pair.
+        load_event(i) loads version i, which is only called on a miss.
+        The canonicalized versions are shared, so they should never be modified.
+        """
+        prev_payload = None
+        prev_event = {}
+        canonical_prev_event = {}
+        for i in range(len(payloads)):
+            cur_event = None
+            found, canonical_cur_event = self.__lookup(
+                ("canonical", payloads[i], mask_spec)
+            )
+            if not found:
+                if prev_event is None:
+                    prev_event = load_event(i - 1)
+                cur_event = load_event(i)
+                canonical_cur_event = canonical_copy_from_prev(
+                    cur_event,
+                    prev_event,
+                    canonical_prev_event,
+                    mask_spec,
+                    mask_spec.path_trie,
+                    None,
+                )
+                self.__store(("canonical", payloads[i], mask_spec), canonical_cur_event)
+            entry_key = ("diff", prev_payload, payloads[i], mask_spec, trim_ka)
+            found, entry = self.__lookup(entry_key)
+            if not found:
+                entry = diff_event(
+                    canonical_prev_event, canonical_cur_event, None, trim_ka
+                )
+                self.__store(entry_key, entry)
+            yield entry[0], entry[1], canonical_cur_event
+            prev_payload = payloads[i]
+            # The raw version is only loaded again if the next version misses
+            prev_event = cur_event
+            canonical_prev_event = canonical_cur_event
 
 
 def same_key(prev_event: Dict, cur_event: Dict) -> bool:
+    if prev_event == cur_event:
+        return True
     diff_keys = set(prev_event.keys()).symmetric_difference(set(cur_event.keys()))
     if not len(diff_keys) == 0:
         return False
@@ -251,8 +759,3 @@ def same_key(prev_event: Dict, cur_event: Dict) -> bool:
             if not same_key(prev_event[key], cur_event[key]):
                 return False
     return True
-
-
-def trim_kind_apiversion(event: Dict):
-    event.pop("kind", None)
-    event.pop("apiVersion", None)
@@ -0,0 +1,423 @@
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+from sieve_common.k8s_event import APIEvent
+from sieve_common.artifact_storage import (
+    artifact_exists,
+    is_compressed_artifact,
+    open_artifact,
+    open_artifact_for_write,
+    remove_artifact,
+)
+
+# The history is stored in history.jsonl as JSON lines:
+# a header line followed by one line per api event.
+# The first version of each resource key (and every HISTORY_CHECKPOINT_INTERVAL-th version,
+# or whenever the delta is not smaller) carries the full object,
+# and the other versions only carry a JSON-patch-style delta against the previous version.
+HISTORY_FORMAT = "sieve-history-delta"
+HISTORY_FORMAT_VERSION = 2
+# The versions that can still be read: the entries of version 1 carry no state string
+# and their state is always rebuilt in the compact encoding
+READABLE_HISTORY_FORMAT_VERSIONS = [1, 2]
+HISTORY_CHECKPOINT_INTERVAL = 64
+HISTORY_FILE = "history.jsonl"
+# The history written by an older Sieve, i.e., a JSON list of full events
+LEGACY_HISTORY_FILE = "history.json"
+
+# The state of an event is the original obj_str logged by the apiserver.
+# It is rebuilt by encoding the object with one of these separators
+# (compact as Go encodes it, or spaced as Python does by default):
+# an entry carries "separators" (the index here, if not 0) when that rebuilds obj_str,
+# or the obj_str itself as "state" if no encoding rebuilds it (e.g., escaped characters)
+STATE_SEPARATORS = [(",", ":"), (", ", ": ")]
+
+history_decoder = json.JSONDecoder()
+
+
+def decode_history_line(line: bytes) -> Dict:
+    # Skips the encoding detection of json.loads, which is paid by every line otherwise
+    return history_decoder.decode(line.decode("utf-8"))
+
+
+def escape_pointer_token(token) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def unescape_pointer_token(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff_json_patch(prev_obj, cur_obj, path: str = "") -> List[Dict]:
+    """
+    Returns the add/remove/replace operations (as in RFC 6902) turning prev_obj into cur_obj.
+    Equal subtrees are skipped without being walked.
+    """
+    if prev_obj == cur_obj:
+        return []
+    if isinstance(prev_obj, dict) and isinstance(cur_obj, dict):
+        patch = []
+        for key in prev_obj:
+            if key not in cur_obj:
+                patch.append(
+                    {"op": "remove", "path": path + "/" + escape_pointer_token(key)}
+                )
+        for key in cur_obj:
+            key_path = path + "/" + escape_pointer_token(key)
+            if key not in prev_obj:
+                patch.append({"op": "add", "path": key_path, "value": cur_obj[key]})
+            else:
+                patch.extend(diff_json_patch(prev_obj[key], cur_obj[key], key_path))
+        return patch
+    if isinstance(prev_obj, list) and isinstance(cur_obj, list):
+        patch = []
+        min_len = min(len(prev_obj), len(cur_obj))
+        for i in range(min_len):
+            patch.extend(diff_json_patch(prev_obj[i], cur_obj[i], path + "/" + str(i)))
+        for i in range(min_len, len(cur_obj)):
+            patch.append(
+                {"op": "add", "path": path + "/" + str(i), "value": cur_obj[i]}
+            )
+        # Remove from the tail so that the indexes of the remaining items stay valid
+        for i in reversed(range(min_len, len(prev_obj))):
+            patch.append({"op": "remove", "path": path + "/" + str(i)})
+        return patch
+    return [{"op": "replace", "path": path, "value": cur_obj}]
+
+
+def apply_json_patch(obj, patch: List[Dict]):
+    """
+    Returns the object after applying patch to obj.
+    obj is not modified: only the containers on the patched paths are copied
+    and the untouched subtrees are shared with obj.
+    """
+    # The containers copied for this patch (by id), which can be updated in place
+    copied = {}
+
+    def writable(container):
+        if id(container) in copied:
+            return container
+        container = dict(container) if isinstance(container, dict) else list(container)
+        copied[id(container)] = container
+        return container
+
+    for operation in patch:
+        if operation["path"] == "":
+            assert operation["op"] == "replace"
+            obj = operation["value"]
+            continue
+        tokens = [
+            unescape_pointer_token(token) for token in operation["path"].split("/")[1:]
+        ]
+        obj = writable(obj)
+        parent = obj
+        for token in tokens[:-1]:
+            index = token if isinstance(parent, dict) else int(token)
+            child = writable(parent[index])
+            parent[index] = child
+            parent = child
+        last = tokens[-1]
+        if isinstance(parent, dict):
+            if operation["op"] == "remove":
+                del parent[last]
+            else:
+                parent[last] = operation["value"]
+        else:
+            index = int(last)
+            if operation["op"] == "remove":
+                del parent[index]
+            elif operation["op"] == "add":
+                parent.insert(index, operation["value"])
+            else:
+                parent[index] = operation["value"]
+    return obj
+
+
+def encode_history(api_events: Iterable[APIEvent]) -> Iterator[Dict]:
+    # Turns the api events into history entries in order
+    key_to_obj_map = {}
+    # The objects as HistoryReader rebuilds them, whose key order might differ
+    # from the logged objects after a patch
+    key_to_rebuilt_obj_map = {}
+    key_to_version = {}
+    key_to_delta_cnt = {}
+    # The separators are tried starting from the last matched one,
+    # as all the objects in a log are usually encoded the same way
+    separators_order = list(range(len(STATE_SEPARATORS)))
+    for api_event in api_events:
+        key = api_event.key
+        obj_map = api_event.obj_map
+        version = key_to_version.get(key, -1) + 1
+        key_to_version[key] = version
+        entry = {"etype": api_event.etype, "key": key, "version": version}
+        patch = None
+        if (
+            key in key_to_obj_map
+            and key_to_delta_cnt[key] < HISTORY_CHECKPOINT_INTERVAL
+        ):
+            patch = diff_json_patch(key_to_obj_map[key], obj_map)
+            if len(json.dumps(patch)) >= len(api_event.obj_str):
+                patch = None
+        if patch is None:
+            entry["object"] = obj_map
+            key_to_delta_cnt[key] = 0
+            rebuilt_obj_map = obj_map
+        else:
+            entry["patch"] = patch
+            key_to_delta_cnt[key] += 1
+            rebuilt_obj_map = apply_json_patch(key_to_rebuilt_obj_map[key], patch)
+        key_to_obj_map[key] = obj_map
+        key_to_rebuilt_obj_map[key] = rebuilt_obj_map
+        for i in separators_order:
+            if (
+                json.dumps(rebuilt_obj_map, separators=STATE_SEPARATORS[i])
+                == api_event.obj_str
+            ):
+                if i != 0:
+                    entry["separators"] = i
+                separators_order.remove(i)
+                separators_order.insert(0, i)
+                break
+        else:
+            entry["state"] = api_event.obj_str
+        yield entry
+
+
+def dump_history(dir: str, history: Iterable[Dict], compression: str):
+    # history is the entries generated by encode_history
+    # Drop the legacy history (if any) so that it is not read instead of the new one
+    remove_artifact(os.path.join(dir, LEGACY_HISTORY_FILE))
+    with open_artifact_for_write(os.path.join(dir, HISTORY_FILE), compression) as f:
+        header = {
+            "format": HISTORY_FORMAT,
+            "version": HISTORY_FORMAT_VERSION,
+            "checkpoint_interval": HISTORY_CHECKPOINT_INTERVAL,
+        }
+        f.write(json.dumps(header) + "\n")
+        for entry in history:
+            f.write(json.dumps(entry) + "\n")
+
+
+class HistoryEvent:
+    """
+    One api event in the history.
+    It can be used as the dict of the legacy history format,
+    i.e., event["etype"], event["key"] and event["state"] (the object as a JSON string).
+    The object is shared with the later versions of the key, so it should not be modified.
+    """
+
+    __slots__ = ("etype", "key", "version", "obj_map", "__state", "__separators")
+
+    def __init__(
+        self,
+        etype: str,
+        key: str,
+        version: int,
+        obj_map,
+        state=None,
+        separators=STATE_SEPARATORS[0],
+    ):
+        self.etype = etype
+        self.key = key
+        self.version = version
+        self.obj_map = obj_map
+        self.__state = state
+        self.__separators = separators
+
+    @property
+    def state(self) -> str:
+        # The obj_str logged by the apiserver (see STATE_SEPARATORS)
+        if self.__state is None:
+            self.__state = json.dumps(self.obj_map, separators=self.__separators)
+        return self.__state
+
+    def __getitem__(self, field: str):
+        if field not in ["etype", "key", "version", "state", "obj_map"]:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field: str, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+
+def history_event_of(entry: Dict, obj_map) -> HistoryEvent:
+    return HistoryEvent(
+        entry["etype"],
+        entry["key"],
+        entry["version"],
+        obj_map,
+        entry.get("state"),
+        STATE_SEPARATORS[entry.get("separators", 0)],
+    )
+
+
+class HistoryReader:
+    """
+    Reads a history.jsonl (plain or compressed) without loading it as a whole.
+    Iterating over the reader rebuilds the full object of each event lazily, in order.
+    get(key, version) rebuilds one version of a key by replaying only the lines of that key
+    from its last full version, using an index of the line offsets built on first use.
+    The legacy history.json (a JSON list of full events) is also accepted.
+    """
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__legacy = None
+        self.__index = None
+        self.__event_cnt = None
+        # get keeps the history open and the last version it rebuilt of each key,
+        # so that reading the versions of a key in order replays each line once
+        # and (for a compressed history) never restarts the decompression
+        self.__file = None
+        self.__compressed = is_compressed_artifact(path)
+        self.__key_to_last_rebuilt = {}
+        with open_artifact(path, "rb") as f:
+            first_line = f.readline().strip()
+        if not first_line.startswith(b"{"):
+            with open_artifact(path) as f:
+                self.__legacy = json.load(f)
+        else:
+            header = json.loads(first_line)
+            assert header.get("format") == HISTORY_FORMAT, "unknown history format"
+            assert header.get("version") in READABLE_HISTORY_FORMAT_VERSIONS
+
+    def __entries(self) -> Iterator[Dict]:
+        with open_artifact(self.__path, "rb") as f:
+            f.readline()
+            for line in f:
+                yield decode_history_line(line)
+
+    def __iter__(self) -> Iterator[HistoryEvent]:
+        if self.__legacy is not None:
+            for version, event in self.__legacy_events():
+                yield event
+            return
+        key_to_obj_map = {}
+        for entry in self.__entries():
+            key = entry["key"]
+            if "object" in entry:
+                obj_map = entry["object"]
+            else:
+                obj_map = apply_json_patch(key_to_obj_map[key], entry["patch"])
+            key_to_obj_map[key] = obj_map
+            yield history_event_of(entry, obj_map)
+
+    def __legacy_events(self):
+        key_to_version = {}
+        for event in self.__legacy:
+            version = key_to_version.get(event["key"], -1) + 1
+            key_to_version[event["key"]] = version
+            yield version, HistoryEvent(
+                event["etype"],
+                event["key"],
+                version,
+                json.loads(event["state"]),
+                event["state"],
+            )
+
+    def __build_index(self):
+        # Maps each key to the (offset, is_full) of its versions in order
+        self.__index = {}
+        self.__event_cnt = 0
+        if self.__legacy is not None:
+            for version, event in self.__legacy_events():
+                self.__index.setdefault(event.key, []).append((self.__event_cnt, True))
+                self.__event_cnt += 1
+            return
+        with open_artifact(self.__path, "rb") as f:
+            f.readline()
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                entry = decode_history_line(line)
+                self.__index.setdefault(entry["key"], []).append(
+                    (offset, "object" in entry)
+                )
+                self.__event_cnt += 1
+
+    @property
+    def index(self) -> Dict[str, List]:
+        if self.__index is None:
+            self.__build_index()
+        return self.__index
+
+    def __len__(self):
+        if self.__event_cnt is None:
+            self.__build_index()
+        return self.__event_cnt
+
+    def keys(self):
+        return self.index.keys()
+
+    def version_cnt(self, key: str) -> int:
+        return len(self.index.get(key, []))
+
+    def get(self, key: str, version: int) -> Optional[HistoryEvent]:
+        # Returns the given version (starting from 0) of the key, or None if there is no such version
+        versions = self.index.get(key, [])
+        if version < 0 or version >= len(versions):
+            return None
+        if self.__legacy is not None:
+            event = self.__legacy[versions[version][0]]
+            return HistoryEvent(
+                event["etype"], key, version, json.loads(event["state"]), event["state"]
+            )
+        first = version
+        while not versions[first][1]:
+            first -= 1
+        entry = None
+        obj_map = None
+        if key in self.__key_to_last_rebuilt:
+            last_version, last_entry, last_obj_map = self.__key_to_last_rebuilt[key]
+            if first <= last_version <= version:
+                first = last_version + 1
+                entry = last_entry
+                obj_map = last_obj_map
+        for i in range(first, version + 1):
+            entry = decode_history_line(self.__read_line_at(versions[i][0]))
+            if "object" in entry:
+                obj_map = entry["object"]
+            else:
+                obj_map = apply_json_patch(obj_map, entry["patch"])
+        self.__key_to_last_rebuilt[key] = (version, entry, obj_map)
+        return history_event_of(entry, obj_map)
+
+    def __read_line_at(self, offset: int) -> bytes:
+        # A compressed stream can only seek forward cheaply (or at all, for zstd),
+        # so it is reopened to read backward
+        if (
+            self.__file is not None
+            and self.__compressed
+            and offset < self.__file.tell()
+        ):
+            self.close()
+        if self.__file is None:
+            self.__file = open_artifact(self.__path, "rb")
+        self.__file.seek(offset)
+        return self.__file.readline()
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __del__(self):
+        self.close()
+
+
+def history_path(dir: str) -> str:
+    # Falls back to the legacy history.json for the results written by an older Sieve
+    path = os.path.join(dir, HISTORY_FILE)
+    legacy_path = os.path.join(dir, LEGACY_HISTORY_FILE)
+    if not artifact_exists(path) and artifact_exists(legacy_path):
+        return legacy_path
+    return path
+
+
+def open_history(path: str) -> HistoryReader:
+    return HistoryReader(path)
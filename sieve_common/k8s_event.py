@@ -1,11 +1,22 @@
 import json
 import resource
-from typing import Dict, List, Set, Union
+from typing import Dict, List, Optional, Set, Union
 from pathlib import PurePath
-from sieve_common.event_delta import conflicting_event_payload
+from sieve_common.event_delta import (
+    EventDeltaCache,
+    MaskSpec,
+    conflicting_canonical_event_payload,
+    conflicting_event_payload,
+    event_signature_digest,
+)
+from sieve_common.artifact_storage import open_artifact
 
 HEAR_READ_FILTER_FLAG = True
 ERROR_MSG_FILTER_FLAG = True
+# The json payload of each event is decoded lazily on first access and then cached.
+# When KEEP_RAW_PAYLOAD_FLAG is set, only the raw payload string is kept in memory
+# and it is decoded again on every access, trading analysis time for memory.
+KEEP_RAW_PAYLOAD_FLAG = False
 
 
 ALLOWED_ERROR_TYPE = ["NoError"]
@@ -22,6 +33,20 @@ SIEVE_AFTER_RECONCILE_MARK = "[SIEVE-AFTER-RECONCILE]"
 
 SIEVE_API_EVENT_MARK = "[SIEVE-API-EVENT]"
 
+SIEVE_MARK_PREFIX = "[SIEVE-"
+
+SIEVE_LEARN_MARKS = {
+    SIEVE_BEFORE_HEAR_MARK,
+    SIEVE_AFTER_HEAR_MARK,
+    SIEVE_BEFORE_WRITE_MARK,
+    SIEVE_AFTER_WRITE_MARK,
+    SIEVE_BEFORE_ANNOTATED_API_INVOCATION_MARK,
+    SIEVE_AFTER_ANNOTATED_API_INVOCATION_MARK,
+    SIEVE_AFTER_READ_MARK,
+    SIEVE_BEFORE_RECONCILE_MARK,
+    SIEVE_AFTER_RECONCILE_MARK,
+}
+
 EVENT_NONE_TYPE = "NONE_TYPE"
 NON_K8S_WRITE = "NON_K8S_WRITE"
 
@@ -167,6 +192,58 @@ def parse_key(key: str):
     return tokens[0], tokens[1], tokens[2]
 
 
+class ResourceKeyTable:
+    """
+    Interns resource keys (rtype/namespace/name) as small integer ids
+    so that the analysis can index and compare keys as ints,
+    and store a set of keys as a bitset (bit i is set iff the key with id i is in the set).
+    """
+
+    __slots__ = ("__key_to_id", "__keys")
+
+    def __init__(self):
+        self.__key_to_id = {}
+        self.__keys = []
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def intern(self, key: str) -> int:
+        key_id = self.__key_to_id.get(key)
+        if key_id is None:
+            key_id = len(self.__keys)
+            self.__key_to_id[key] = key_id
+            self.__keys.append(key)
+        return key_id
+
+    def id_of(self, key: str) -> int:
+        # Returns -1 if the key has never been interned
+        return self.__key_to_id.get(key, -1)
+
+    def key_of(self, key_id: int) -> str:
+        return self.__keys[key_id]
+
+    def intern_bitset(self, keys) -> int:
+        bitset = 0
+        for key in keys:
+            bitset |= 1 << self.intern(key)
+        return bitset
+
+    def keys_of_bitset(self, bitset: int) -> Set[str]:
+        keys = set()
+        key_id = 0
+        while bitset:
+            if bitset & 1:
+                keys.add(self.__keys[key_id])
+            bitset >>= 1
+            key_id += 1
+        return keys
+
+
+def bitset_contains(bitset: int, key_id: int) -> bool:
+    return key_id >= 0 and (bitset >> key_id) & 1 == 1
+
+
 def get_mask_by_resource_key(key_mask_map, resource_key):
     # TODO: converting the list to a string may lead to ambiguity
     # consider two lists: ["a", "b", "c"] and ["a/b", "c"]
@@ -184,7 +261,37 @@ def get_mask_by_resource_key(key_mask_map, resource_key):
     return masked_keys
 
 
+def get_slots_state(event, cached_slots: List[str]) -> Dict:
+    # Returns the state of an event with __slots__ to be pickled,
+    # where the slots caching the decoded payload are reset
+    # so that the payload is decoded again on demand after unpickling
+    state = {}
+    for slot in type(event).__slots__:
+        if slot.startswith("__"):
+            attr = "_" + type(event).__name__ + slot
+        else:
+            attr = slot
+        state[attr] = None if slot in cached_slots else getattr(event, attr)
+    return state
+
+
+def set_slots_state(event, state: Dict):
+    for attr, value in state.items():
+        setattr(event, attr, value)
+
+
 class APIEvent:
+    __slots__ = (
+        "etype",
+        "original_key",
+        "key",
+        "rtype",
+        "namespace",
+        "name",
+        "obj_str",
+        "__obj_map",
+    )
+
     def __init__(
         self,
         etype: str,
@@ -194,159 +301,131 @@ class APIEvent:
         name: str,
         obj_str: str,
     ):
-        self.__etype = etype
-        self.__original_key = orignal_key
-        self.__key = generate_key(rtype, namespace, name)
-        self.__rtype = rtype
-        self.__namespace = namespace
-        self.__name = name
-        self.__obj_str = obj_str
-        self.__obj_map = json.loads(obj_str)
-
-    @property
-    def etype(self):
-        return self.__etype
-
-    @property
-    def key(self):
-        return self.__key
-
-    @property
-    def rtype(self):
-        return self.__rtype
-
-    @property
-    def namespace(self):
-        return self.__namespace
-
-    @property
-    def name(self):
-        return self.__name
-
-    @property
-    def obj_str(self):
-        return self.__obj_str
+        self.etype = etype
+        self.original_key = orignal_key
+        self.key = generate_key(rtype, namespace, name)
+        self.rtype = rtype
+        self.namespace = namespace
+        self.name = name
+        self.obj_str = obj_str
+        self.__obj_map = None
 
     @property
     def obj_map(self):
-        return self.__obj_map
+        if self.__obj_map is not None:
+            return self.__obj_map
+        obj_map = json.loads(self.obj_str)
+        if not KEEP_RAW_PAYLOAD_FLAG:
+            self.__obj_map = obj_map
+        return obj_map
 
     def get_metadata_value(self, mkey):
-        if mkey in self.obj_map:
-            return self.obj_map[mkey]
-        elif "metadata" in self.obj_map and mkey in self.obj_map["metadata"]:
-            return self.obj_map["metadata"][mkey]
+        obj_map = self.obj_map
+        if mkey in obj_map:
+            return obj_map[mkey]
+        elif "metadata" in obj_map and mkey in obj_map["metadata"]:
+            return obj_map["metadata"][mkey]
         else:
             return None
 
 
 class OperatorHear:
-    def __init__(self, id: str, etype: str, rtype: str, obj_str: str):
-        self.__id = int(id)
-        self.__etype = etype
-        self.__rtype = rtype
-        self.__obj_str = obj_str
-        self.__obj_map = json.loads(obj_str)
-        self.__namespace, self.__name = extract_namespace_name(self.obj_map)
-        self.__start_timestamp = -1
-        self.__end_timestamp = -1
-        self.__key = generate_key(self.rtype, self.namespace, self.name)
-        self.__slim_prev_obj_map = None
-        self.__slim_cur_obj_map = None
-        self.__prev_etype = EVENT_NONE_TYPE
-        self.__cancelled_by = set()
-        self.__signature_counter = 1
-
-    @property
-    def id(self):
-        return self.__id
-
-    @property
-    def etype(self):
-        return self.__etype
-
-    @property
-    def rtype(self):
-        return self.__rtype
+    __slots__ = (
+        "id",
+        "etype",
+        "rtype",
+        "obj_str",
+        "start_timestamp",
+        "end_timestamp",
+        "slim_prev_obj_map",
+        "slim_cur_obj_map",
+        "prev_etype",
+        "cancelled_by",
+        "signature",
+        "signature_counter",
+        "key_id",
+        "__obj_map",
+        "__namespace",
+        "__name",
+        "__key",
+    )
 
-    @property
-    def obj_str(self):
-        return self.__obj_str
+    def __init__(self, id: str, etype: str, rtype: str, obj_str: str):
+        self.id = int(id)
+        self.etype = etype
+        self.rtype = rtype
+        self.obj_str = obj_str
+        self.start_timestamp = -1
+        self.end_timestamp = -1
+        self.slim_prev_obj_map = None
+        self.slim_cur_obj_map = None
+        self.prev_etype = EVENT_NONE_TYPE
+        self.cancelled_by = set()
+        # Set by get_event_signature once the slim objects are computed
+        self.signature = None
+        self.signature_counter = 1
+        self.key_id = -1
+        self.__obj_map = None
+        self.__namespace = None
+        self.__name = None
+        self.__key = None
+
+    def __getstate__(self):
+        return get_slots_state(self, ["__obj_map"])
+
+    def __setstate__(self, state):
+        set_slots_state(self, state)
+
+    def __decode_obj_str(self):
+        obj_map = json.loads(self.obj_str)
+        if self.__key is None:
+            self.__namespace, self.__name = extract_namespace_name(obj_map)
+            self.__key = generate_key(self.rtype, self.__namespace, self.__name)
+        if not KEEP_RAW_PAYLOAD_FLAG:
+            self.__obj_map = obj_map
+        return obj_map
 
     @property
     def obj_map(self):
-        return self.__obj_map
+        if self.__obj_map is not None:
+            return self.__obj_map
+        return self.__decode_obj_str()
 
     @property
     def namespace(self):
+        if self.__key is None:
+            self.__decode_obj_str()
         return self.__namespace
 
     @property
     def name(self):
+        if self.__key is None:
+            self.__decode_obj_str()
         return self.__name
 
-    @property
-    def start_timestamp(self):
-        return self.__start_timestamp
-
-    @property
-    def end_timestamp(self):
-        return self.__end_timestamp
-
     @property
     def key(self):
+        if self.__key is None:
+            self.__decode_obj_str()
         return self.__key
 
-    @property
-    def slim_prev_obj_map(self):
-        return self.__slim_prev_obj_map
-
-    @property
-    def slim_cur_obj_map(self):
-        return self.__slim_cur_obj_map
-
-    @property
-    def prev_etype(self):
-        return self.__prev_etype
-
-    @property
-    def cancelled_by(self):
-        return self.__cancelled_by
-
-    @property
-    def signature_counter(self):
-        return self.__signature_counter
-
-    @start_timestamp.setter
-    def start_timestamp(self, start_timestamp: int):
-        self.__start_timestamp = start_timestamp
-
-    @end_timestamp.setter
-    def end_timestamp(self, end_timestamp: int):
-        self.__end_timestamp = end_timestamp
-
-    @slim_prev_obj_map.setter
-    def slim_prev_obj_map(self, slim_prev_obj_map: Dict):
-        self.__slim_prev_obj_map = slim_prev_obj_map
-
-    @slim_cur_obj_map.setter
-    def slim_cur_obj_map(self, slim_cur_obj_map: Dict):
-        self.__slim_cur_obj_map = slim_cur_obj_map
-
-    @prev_etype.setter
-    def prev_etype(self, prev_etype: str):
-        self.__prev_etype = prev_etype
-
-    @cancelled_by.setter
-    def cancelled_by(self, cancelled_by: Set):
-        self.__cancelled_by = cancelled_by
-
-    @signature_counter.setter
-    def signature_counter(self, signature_counter: int):
-        self.__signature_counter = signature_counter
-
 
 class OperatorNonK8sWrite:
+    __slots__ = (
+        "id",
+        "module",
+        "file_path",
+        "recv_type",
+        "fun_name",
+        "reconciler_type",
+        "reconcile_id",
+        "start_timestamp",
+        "end_timestamp",
+        "range_start_timestamp",
+        "range_end_timestamp",
+        "signature_counter",
+    )
+
     def __init__(
         self,
         id: str,
@@ -356,97 +435,48 @@ class OperatorNonK8sWrite:
         fun_name: str,
         reconciler_type: str,
     ):
-        self.__id = int(id)
-        self.__module = module
-        self.__file_path = file_path
-        self.__recv_type = recv_type
-        self.__fun_name = fun_name
-        self.__reconciler_type = reconciler_type
-        self.__reconcile_id = -1
-        self.__start_timestamp = -1
-        self.__end_timestamp = -1
-        self.__range_start_timestamp = -1
-        self.__range_end_timestamp = -1
-        self.__signature_counter = 1
-
-    @property
-    def id(self):
-        return self.__id
-
-    @property
-    def module(self):
-        return self.__module
-
-    @property
-    def file_path(self):
-        return self.__file_path
-
-    @property
-    def recv_type(self):
-        return self.__recv_type
-
-    @property
-    def fun_name(self):
-        return self.__fun_name
-
-    @property
-    def reconciler_type(self):
-        return self.__reconciler_type
-
-    @property
-    def reconcile_id(self):
-        return self.__reconcile_id
-
-    @property
-    def start_timestamp(self):
-        return self.__start_timestamp
-
-    @property
-    def end_timestamp(self):
-        return self.__end_timestamp
-
-    @property
-    def range_start_timestamp(self):
-        return self.__range_start_timestamp
-
-    @property
-    def range_end_timestamp(self):
-        return self.__range_end_timestamp
-
-    @property
-    def signature_counter(self):
-        return self.__signature_counter
-
-    @reconciler_type.setter
-    def reconciler_type(self, reconciler_type: str):
-        self.__reconciler_type = reconciler_type
-
-    @reconcile_id.setter
-    def reconcile_id(self, reconcile_id: int):
-        self.__reconcile_id = reconcile_id
-
-    @start_timestamp.setter
-    def start_timestamp(self, start_timestamp: int):
-        self.__start_timestamp = start_timestamp
-
-    @end_timestamp.setter
-    def end_timestamp(self, end_timestamp: int):
-        self.__end_timestamp = end_timestamp
-
-    @range_start_timestamp.setter
-    def range_start_timestamp(self, range_start_timestamp: int):
-        self.__range_start_timestamp = range_start_timestamp
-
-    @range_end_timestamp.setter
-    def range_end_timestamp(self, range_end_timestamp: int):
-        self.__range_end_timestamp = range_end_timestamp
-
-    @signature_counter.setter
-    def signature_counter(self, signature_counter: int):
-        self.__signature_counter = signature_counter
+        self.id = int(id)
+        self.module = module
+        self.file_path = file_path
+        self.recv_type = recv_type
+        self.fun_name = fun_name
+        self.reconciler_type = reconciler_type
+        self.reconcile_id = -1
+        self.start_timestamp = -1
+        self.end_timestamp = -1
+        self.range_start_timestamp = -1
+        self.range_end_timestamp = -1
+        self.signature_counter = 1
 
 
 class OperatorWrite:
+    __slots__ = (
+        "id",
+        "etype",
+        "rtype",
+        "reconciler_type",
+        "reconcile_id",
+        "error",
+        "obj_str",
+        "start_timestamp",
+        "end_timestamp",
+        "range_start_timestamp",
+        "range_end_timestamp",
+        "read_types",
+        "read_key_ids",
+        "prev_obj_map",
+        "slim_prev_obj_map",
+        "slim_cur_obj_map",
+        "prev_etype",
+        "signature",
+        "signature_counter",
+        "key_id",
+        "__obj_map",
+        "__namespace",
+        "__name",
+        "__key",
+    )
+
     def __init__(
         self,
         id: str,
@@ -456,169 +486,95 @@ class OperatorWrite:
         error: str,
         obj_str: str,
     ):
-        self.__id = int(id)
+        self.id = int(id)
         # do not handle DELETEALLOF for now
         assert etype != OperatorWriteTypes.DELETEALLOF
-        self.__etype = etype
-        self.__rtype = rtype
-        self.__reconciler_type = reconciler_type
-        self.__reconcile_id = -1
-        self.__error = error
-        self.__obj_str = obj_str
-        self.__obj_map = json.loads(obj_str)
-        self.__namespace, self.__name = extract_namespace_name(self.obj_map)
-        self.__start_timestamp = -1
-        self.__end_timestamp = -1
-        self.__range_start_timestamp = -1
-        self.__range_end_timestamp = -1
-        self.__read_types = set()
-        self.__read_keys = set()
-        self.__key = generate_key(self.rtype, self.namespace, self.name)
-        self.__prev_obj_map = None
-        self.__slim_prev_obj_map = None
-        self.__slim_cur_obj_map = None
-        self.__prev_etype = EVENT_NONE_TYPE
-        self.__signature_counter = 1
-
-    @property
-    def id(self):
-        return self.__id
-
-    @property
-    def etype(self):
-        return self.__etype
-
-    @property
-    def rtype(self):
-        return self.__rtype
-
-    @property
-    def reconciler_type(self):
-        return self.__reconciler_type
-
-    @property
-    def reconcile_id(self):
-        return self.__reconcile_id
-
-    @property
-    def error(self):
-        return self.__error
-
-    @property
-    def obj_str(self):
-        return self.__obj_str
+        self.etype = etype
+        self.rtype = rtype
+        self.reconciler_type = reconciler_type
+        self.reconcile_id = -1
+        self.error = error
+        self.obj_str = obj_str
+        self.start_timestamp = -1
+        self.end_timestamp = -1
+        self.range_start_timestamp = -1
+        self.range_end_timestamp = -1
+        self.read_types = set()
+        # The keys read before this write, as a bitset of ResourceKeyTable ids
+        self.read_key_ids = 0
+        self.prev_obj_map = None
+        self.slim_prev_obj_map = None
+        self.slim_cur_obj_map = None
+        self.prev_etype = EVENT_NONE_TYPE
+        # Set by get_event_signature once the slim objects are computed
+        self.signature = None
+        self.signature_counter = 1
+        self.key_id = -1
+        self.__obj_map = None
+        self.__namespace = None
+        self.__name = None
+        self.__key = None
+
+    def __getstate__(self):
+        return get_slots_state(self, ["__obj_map"])
+
+    def __setstate__(self, state):
+        set_slots_state(self, state)
+
+    def __decode_obj_str(self):
+        obj_map = json.loads(self.obj_str)
+        if self.__key is None:
+            self.__namespace, self.__name = extract_namespace_name(obj_map)
+            self.__key = generate_key(self.rtype, self.__namespace, self.__name)
+        if not KEEP_RAW_PAYLOAD_FLAG:
+            self.__obj_map = obj_map
+        return obj_map
 
     @property
     def obj_map(self):
-        return self.__obj_map
+        if self.__obj_map is not None:
+            return self.__obj_map
+        return self.__decode_obj_str()
 
     @property
     def namespace(self):
+        if self.__key is None:
+            self.__decode_obj_str()
         return self.__namespace
 
     @property
     def name(self):
+        if self.__key is None:
+            self.__decode_obj_str()
         return self.__name
 
-    @property
-    def read_types(self):
-        return self.__read_types
-
-    @property
-    def read_keys(self):
-        return self.__read_keys
-
-    @property
-    def start_timestamp(self):
-        return self.__start_timestamp
-
-    @property
-    def end_timestamp(self):
-        return self.__end_timestamp
-
-    @property
-    def range_start_timestamp(self):
-        return self.__range_start_timestamp
-
-    @property
-    def range_end_timestamp(self):
-        return self.__range_end_timestamp
-
     @property
     def key(self):
+        if self.__key is None:
+            self.__decode_obj_str()
         return self.__key
 
-    @property
-    def prev_obj_map(self):
-        return self.__prev_obj_map
-
-    @property
-    def slim_prev_obj_map(self):
-        return self.__slim_prev_obj_map
-
-    @property
-    def slim_cur_obj_map(self):
-        return self.__slim_cur_obj_map
-
-    @property
-    def prev_etype(self):
-        return self.__prev_etype
-
-    @property
-    def signature_counter(self):
-        return self.__signature_counter
-
-    @reconciler_type.setter
-    def reconciler_type(self, reconciler_type: str):
-        self.__reconciler_type = reconciler_type
-
-    @reconcile_id.setter
-    def reconcile_id(self, reconcile_id: int):
-        self.__reconcile_id = reconcile_id
-
-    @start_timestamp.setter
-    def start_timestamp(self, start_timestamp: int):
-        self.__start_timestamp = start_timestamp
-
-    @end_timestamp.setter
-    def end_timestamp(self, end_timestamp: int):
-        self.__end_timestamp = end_timestamp
-
-    @read_types.setter
-    def read_types(self, read_types: Set[str]):
-        self.__read_types = read_types
-
-    @read_keys.setter
-    def read_keys(self, read_keys: Set[str]):
-        self.__read_keys = read_keys
-
-    @prev_obj_map.setter
-    def prev_obj_map(self, prev_obj_map: Dict):
-        self.__prev_obj_map = prev_obj_map
-
-    @slim_prev_obj_map.setter
-    def slim_prev_obj_map(self, slim_prev_obj_map: Dict):
-        self.__slim_prev_obj_map = slim_prev_obj_map
-
-    @slim_cur_obj_map.setter
-    def slim_cur_obj_map(self, slim_cur_obj_map: Dict):
-        self.__slim_cur_obj_map = slim_cur_obj_map
-
-    @prev_etype.setter
-    def prev_etype(self, prev_etype: str):
-        self.__prev_etype = prev_etype
-
-    @signature_counter.setter
-    def signature_counter(self, signature_counter: int):
-        self.__signature_counter = signature_counter
-
     def set_range(self, start_timestamp: int, end_timestamp: int):
         assert start_timestamp < end_timestamp
-        self.__range_start_timestamp = start_timestamp
-        self.__range_end_timestamp = end_timestamp
+        self.range_start_timestamp = start_timestamp
+        self.range_end_timestamp = end_timestamp
 
 
 class OperatorRead:
+    __slots__ = (
+        "etype",
+        "from_cache",
+        "rtype",
+        "reconciler_type",
+        "reconcile_id",
+        "error",
+        "obj_str",
+        "end_timestamp",
+        "key_ids",
+        "__key_to_obj",
+        "__key_set",
+    )
+
     def __init__(
         self,
         etype: str,
@@ -630,21 +586,35 @@ class OperatorRead:
         error: str,
         obj_str: str,
     ):
-        self.__etype = etype
-        self.__from_cache = True if from_cache == "true" else False
-        self.__rtype = rtype
-        self.__reconciler_type = reconciler_type
-        self.__reconcile_id = -1
-        self.__error = error
-        self.__key_to_obj = {}
-        self.__key_set = set()
-        self.__end_timestamp = -1
+        self.etype = etype
+        self.from_cache = True if from_cache == "true" else False
+        self.rtype = rtype
+        self.reconciler_type = reconciler_type
+        self.reconcile_id = -1
+        self.error = error
+        self.obj_str = obj_str
+        self.end_timestamp = -1
+        # ResourceKeyTable ids of key_set, assigned when the read is added to the event graph
+        self.key_ids = []
+        self.__key_to_obj = None
+        self.__key_set = None
         if etype == "Get":
-            key = generate_key(self.rtype, namespace, name)
-            self.key_set.add(key)
-            self.key_to_obj[key] = json.loads(obj_str)
+            # For Get the key is known without decoding the payload
+            self.__key_set = {generate_key(self.rtype, namespace, name)}
+
+    def __getstate__(self):
+        return get_slots_state(self, ["__key_to_obj"])
+
+    def __setstate__(self, state):
+        set_slots_state(self, state)
+
+    def __decode_obj_str(self):
+        key_to_obj = {}
+        if self.etype == "Get":
+            for key in self.__key_set:
+                key_to_obj[key] = json.loads(self.obj_str)
         else:
-            objs = json.loads(obj_str)["items"]
+            objs = json.loads(self.obj_str)["items"]
             if objs is not None:
                 for obj in objs:
                     key = generate_key(
@@ -654,138 +624,85 @@ class OperatorRead:
                         else DEFAULT_NS,
                         obj["metadata"]["name"],
                     )
-                    assert key not in self.key_set
-                    assert key not in self.key_to_obj
-                    self.key_set.add(key)
-                    self.key_to_obj[key] = obj
-
-    @property
-    def etype(self):
-        return self.__etype
-
-    @property
-    def from_cache(self):
-        return self.__from_cache
-
-    @property
-    def rtype(self):
-        return self.__rtype
-
-    @property
-    def reconciler_type(self):
-        return self.__reconciler_type
-
-    @property
-    def reconcile_id(self):
-        return self.__reconcile_id
-
-    @property
-    def error(self):
-        return self.__error
+                    assert key not in key_to_obj
+                    key_to_obj[key] = obj
+            if self.__key_set is None:
+                self.__key_set = set(key_to_obj.keys())
+        if not KEEP_RAW_PAYLOAD_FLAG:
+            self.__key_to_obj = key_to_obj
+        return key_to_obj
 
     @property
     def key_set(self):
+        if self.__key_set is None:
+            self.__decode_obj_str()
         return self.__key_set
 
     @property
     def key_to_obj(self):
-        return self.__key_to_obj
-
-    @property
-    def end_timestamp(self):
-        return self.__end_timestamp
-
-    @end_timestamp.setter
-    def end_timestamp(self, end_timestamp: int):
-        self.__end_timestamp = end_timestamp
-
-    @reconcile_id.setter
-    def reconcile_id(self, reconcile_id: int):
-        self.__reconcile_id = reconcile_id
+        if self.__key_to_obj is not None:
+            return self.__key_to_obj
+        return self.__decode_obj_str()
 
 
 class OperatorHearIDOnly:
-    def __init__(self, id: str):
-        self.__id = int(id)
+    __slots__ = ("id",)
 
-    @property
-    def id(self):
-        return self.__id
+    def __init__(self, id: str):
+        self.id = int(id)
 
 
 class OperatorWriteIDOnly:
-    def __init__(self, id: str):
-        self.__id = int(id)
+    __slots__ = ("id",)
 
-    @property
-    def id(self):
-        return self.__id
+    def __init__(self, id: str):
+        self.id = int(id)
 
 
 class OperatorNonK8sWriteIDOnly:
-    def __init__(self, id: str):
-        self.__id = int(id)
+    __slots__ = ("id",)
 
-    @property
-    def id(self):
-        return self.__id
+    def __init__(self, id: str):
+        self.id = int(id)
 
 
 class ReconcileBegin:
-    def __init__(self, reconciler_type: str, reconcile_id: str):
-        self.__reconciler_type = reconciler_type
-        self.__reconcile_id = reconcile_id
-        self.__end_timestamp = -1
+    __slots__ = ("reconciler_type", "reconcile_id", "end_timestamp")
 
-    @property
-    def reconciler_type(self):
-        return self.__reconciler_type
-
-    @property
-    def reconcile_id(self):
-        return self.__reconcile_id
-
-    @property
-    def end_timestamp(self):
-        return self.__end_timestamp
-
-    @end_timestamp.setter
-    def end_timestamp(self, end_timestamp: int):
-        self.__end_timestamp = end_timestamp
+    def __init__(self, reconciler_type: str, reconcile_id: str):
+        self.reconciler_type = reconciler_type
+        self.reconcile_id = reconcile_id
+        self.end_timestamp = -1
 
 
 class ReconcileEnd:
-    def __init__(self, reconciler_type: str, reconcile_id: str):
-        self.__reconciler_type = reconciler_type
-        self.__reconcile_id = reconcile_id
-        self.__end_timestamp = -1
+    __slots__ = ("reconciler_type", "reconcile_id", "end_timestamp")
 
-    @property
-    def reconciler_type(self):
-        return self.__reconciler_type
+    def __init__(self, reconciler_type: str, reconcile_id: str):
+        self.reconciler_type = reconciler_type
+        self.reconcile_id = reconcile_id
+        self.end_timestamp = -1
 
-    @property
-    def reconcile_id(self):
-        return self.__reconcile_id
 
-    @property
-    def end_timestamp(self):
-        return self.__end_timestamp
-
-    @end_timestamp.setter
-    def end_timestamp(self, end_timestamp: int):
-        self.__end_timestamp = end_timestamp
+def split_marked_line(line: str, mark: str) -> List[str]:
+    return line[line.find(mark) :].strip("\n").split("\t")
 
 
 def parse_operator_hear(line: str) -> OperatorHear:
     assert SIEVE_BEFORE_HEAR_MARK in line
-    tokens = line[line.find(SIEVE_BEFORE_HEAR_MARK) :].strip("\n").split("\t")
+    return parse_operator_hear_tokens(split_marked_line(line, SIEVE_BEFORE_HEAR_MARK))
+
+
+def parse_operator_hear_tokens(tokens: List[str]) -> OperatorHear:
     return OperatorHear(tokens[1], tokens[2], tokens[3], tokens[4])
 
 
 def parse_operator_write(line: str) -> OperatorWrite:
     assert SIEVE_AFTER_WRITE_MARK in line
-    tokens = line[line.find(SIEVE_AFTER_WRITE_MARK) :].strip("\n").split("\t")
+    return parse_operator_write_tokens(split_marked_line(line, SIEVE_AFTER_WRITE_MARK))
+
+
+def parse_operator_write_tokens(tokens: List[str]) -> OperatorWrite:
     return OperatorWrite(
         tokens[1], tokens[2], tokens[3], tokens[4], tokens[5], tokens[6]
     )
@@ -793,11 +710,12 @@ def parse_operator_write(line: str) -> OperatorWrite:
 
 def parse_operator_non_k8s_write(line: str) -> OperatorNonK8sWrite:
     assert SIEVE_AFTER_ANNOTATED_API_INVOCATION_MARK in line
-    tokens = (
-        line[line.find(SIEVE_AFTER_ANNOTATED_API_INVOCATION_MARK) :]
-        .strip("\n")
-        .split("\t")
+    return parse_operator_non_k8s_write_tokens(
+        split_marked_line(line, SIEVE_AFTER_ANNOTATED_API_INVOCATION_MARK)
     )
+
+
+def parse_operator_non_k8s_write_tokens(tokens: List[str]) -> OperatorNonK8sWrite:
     return OperatorNonK8sWrite(
         tokens[1], tokens[2], tokens[3], tokens[4], tokens[5], tokens[6]
     )
@@ -805,7 +723,10 @@ def parse_operator_non_k8s_write(line: str) -> OperatorNonK8sWrite:
 
 def parse_operator_read(line: str) -> OperatorRead:
     assert SIEVE_AFTER_READ_MARK in line
-    tokens = line[line.find(SIEVE_AFTER_READ_MARK) :].strip("\n").split("\t")
+    return parse_operator_read_tokens(split_marked_line(line, SIEVE_AFTER_READ_MARK))
+
+
+def parse_operator_read_tokens(tokens: List[str]) -> OperatorRead:
     if tokens[1] == "Get":
         return OperatorRead(
             tokens[1],
@@ -837,20 +758,20 @@ def parse_operator_read(line: str) -> OperatorRead:
 def parse_operator_hear_id_only(line: str) -> OperatorHearIDOnly:
     assert SIEVE_AFTER_HEAR_MARK in line or SIEVE_BEFORE_HEAR_MARK in line
     if SIEVE_AFTER_HEAR_MARK in line:
-        tokens = line[line.find(SIEVE_AFTER_HEAR_MARK) :].strip("\n").split("\t")
+        tokens = split_marked_line(line, SIEVE_AFTER_HEAR_MARK)
         return OperatorHearIDOnly(tokens[1])
     else:
-        tokens = line[line.find(SIEVE_BEFORE_HEAR_MARK) :].strip("\n").split("\t")
+        tokens = split_marked_line(line, SIEVE_BEFORE_HEAR_MARK)
         return OperatorHearIDOnly(tokens[1])
 
 
 def parse_operator_write_id_only(line: str) -> OperatorWriteIDOnly:
     assert SIEVE_AFTER_WRITE_MARK in line or SIEVE_BEFORE_WRITE_MARK in line
     if SIEVE_AFTER_WRITE_MARK in line:
-        tokens = line[line.find(SIEVE_AFTER_WRITE_MARK) :].strip("\n").split("\t")
+        tokens = split_marked_line(line, SIEVE_AFTER_WRITE_MARK)
         return OperatorWriteIDOnly(tokens[1])
     else:
-        tokens = line[line.find(SIEVE_BEFORE_WRITE_MARK) :].strip("\n").split("\t")
+        tokens = split_marked_line(line, SIEVE_BEFORE_WRITE_MARK)
         return OperatorWriteIDOnly(tokens[1])
 
 
@@ -860,56 +781,120 @@ def parse_operator_non_k8s_write_id_only(line: str) -> OperatorNonK8sWriteIDOnly
         or SIEVE_BEFORE_ANNOTATED_API_INVOCATION_MARK in line
     )
     if SIEVE_AFTER_ANNOTATED_API_INVOCATION_MARK in line:
-        tokens = (
-            line[line.find(SIEVE_AFTER_ANNOTATED_API_INVOCATION_MARK) :]
-            .strip("\n")
-            .split("\t")
-        )
+        tokens = split_marked_line(line, SIEVE_AFTER_ANNOTATED_API_INVOCATION_MARK)
         return OperatorNonK8sWriteIDOnly(tokens[1])
     else:
-        tokens = (
-            line[line.find(SIEVE_BEFORE_ANNOTATED_API_INVOCATION_MARK) :]
-            .strip("\n")
-            .split("\t")
-        )
+        tokens = split_marked_line(line, SIEVE_BEFORE_ANNOTATED_API_INVOCATION_MARK)
         return OperatorNonK8sWriteIDOnly(tokens[1])
 
 
 def parse_reconcile(line: str) -> Union[ReconcileBegin, ReconcileEnd]:
     assert SIEVE_BEFORE_RECONCILE_MARK in line or SIEVE_AFTER_RECONCILE_MARK in line
     if SIEVE_BEFORE_RECONCILE_MARK in line:
-        tokens = line[line.find(SIEVE_BEFORE_RECONCILE_MARK) :].strip("\n").split("\t")
+        return parse_reconcile_tokens(
+            split_marked_line(line, SIEVE_BEFORE_RECONCILE_MARK)
+        )
+    else:
+        return parse_reconcile_tokens(
+            split_marked_line(line, SIEVE_AFTER_RECONCILE_MARK)
+        )
+
+
+def parse_reconcile_tokens(tokens: List[str]) -> Union[ReconcileBegin, ReconcileEnd]:
+    if tokens[0] == SIEVE_BEFORE_RECONCILE_MARK:
         return ReconcileBegin(tokens[1], tokens[2])
     else:
-        tokens = line[line.find(SIEVE_AFTER_RECONCILE_MARK) :].strip("\n").split("\t")
+        assert tokens[0] == SIEVE_AFTER_RECONCILE_MARK
         return ReconcileEnd(tokens[1], tokens[2])
 
 
 def parse_api_event(line: str) -> APIEvent:
     assert SIEVE_API_EVENT_MARK in line
-    tokens = line[line.find(SIEVE_API_EVENT_MARK) :].strip("\n").split("\t")
+    return parse_api_event_tokens(split_marked_line(line, SIEVE_API_EVENT_MARK))
+
+
+def parse_api_event_tokens(tokens: List[str]) -> APIEvent:
     return APIEvent(tokens[1], tokens[2], tokens[3], tokens[4], tokens[5], tokens[6])
 
 
+class SieveLogRecord:
+    __slots__ = ("timestamp", "tokens")
+
+    def __init__(self, timestamp: int, tokens: List[str]):
+        self.timestamp = timestamp
+        self.tokens = tokens
+
+    @property
+    def mark(self):
+        return self.tokens[0]
+
+    @property
+    def id(self):
+        return int(self.tokens[1])
+
+
+class SieveLogTokenizer:
+    """
+    Streams the sieve server log once and yields a SieveLogRecord for each line
+    carrying one of the given marks. The mark is located once per line, and the
+    timestamp of a record is its line number, as used by the analyzer.
+    line_cnt holds the number of lines in the log once the iteration is done.
+    """
+
+    def __init__(self, path: str, marks: Set[str] = SIEVE_LEARN_MARKS):
+        self.__path = path
+        self.__marks = marks
+        self.__line_cnt = 0
+
+    @property
+    def line_cnt(self):
+        return self.__line_cnt
+
+    def __iter__(self):
+        self.__line_cnt = 0
+        with open_artifact(self.__path) as log_file:
+            for line in log_file:
+                timestamp = self.__line_cnt
+                self.__line_cnt += 1
+                mark_start = line.find(SIEVE_MARK_PREFIX)
+                if mark_start == -1:
+                    continue
+                mark_end = line.find("]", mark_start)
+                if line[mark_start : mark_end + 1] not in self.__marks:
+                    continue
+                yield SieveLogRecord(
+                    timestamp, line[mark_start:].strip("\n").split("\t")
+                )
+
+
 def conflicting_event(
     prev_operator_hear: OperatorHear,
     cur_operator_hear: OperatorHear,
-    masked_keys: Set[str],
-    masked_paths: Set[str],
+    mask_spec: MaskSpec,
+    delta_cache: Optional[EventDeltaCache] = None,
 ) -> bool:
     if conflicting_event_type(prev_operator_hear.etype, cur_operator_hear.etype):
         return True
     elif (
         prev_operator_hear.etype != OperatorHearTypes.DELETED
         and cur_operator_hear.etype != OperatorHearTypes.DELETED
-        and conflicting_event_payload(
+    ):
+        if delta_cache is None:
+            return conflicting_event_payload(
+                prev_operator_hear.slim_cur_obj_map,
+                cur_operator_hear.obj_map,
+                mask_spec,
+            )
+        if prev_operator_hear.slim_cur_obj_map is None:
+            return False
+        return conflicting_canonical_event_payload(
             prev_operator_hear.slim_cur_obj_map,
-            cur_operator_hear.obj_map,
-            masked_keys,
-            masked_paths,
+            delta_cache.canonical_event(
+                cur_operator_hear.obj_str,
+                mask_spec,
+                lambda: cur_operator_hear.obj_map,
+            ),
         )
-    ):
-        return True
     return False
 
 
@@ -924,16 +909,15 @@ def is_creation_or_deletion(etype: str):
 
 
 def get_event_signature(event: Union[OperatorHear, OperatorWrite]):
+    # The signature of a creation or deletion is its etype,
+    # otherwise it is the digest of the etype and the slim objects
+    # and it is computed only once per event
     assert isinstance(event, OperatorHear) or isinstance(event, OperatorWrite)
-    signature = (
-        event.etype
-        if is_creation_or_deletion(event.etype)
-        else "\t".join(
-            [
-                event.etype,
-                json.dumps(event.slim_prev_obj_map, sort_keys=True),
-                json.dumps(event.slim_cur_obj_map, sort_keys=True),
-            ]
-        )
-    )
-    return signature
+    if event.signature is None:
+        if is_creation_or_deletion(event.etype):
+            event.signature = event.etype
+        else:
+            event.signature = event_signature_digest(
+                event.etype, event.slim_prev_obj_map, event.slim_cur_obj_map
+            )
+    return event.signature
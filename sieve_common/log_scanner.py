@@ -0,0 +1,53 @@
+import mmap
+import os
+from sieve_common.artifact_storage import (
+    open_artifact,
+    is_compressed_artifact,
+)
+
+
+def scan_marked_lines(log_path: str, mark: str):
+    """
+    Yields the content of each line in the log starting from the first occurrence of mark,
+    without the trailing line break (LF or CRLF).
+    The log is memory-mapped and searched for the mark at bytes level,
+    so only the marked lines are decoded and the memory usage does not grow with the log size.
+    A compressed log cannot be memory-mapped, so it is decompressed and scanned as a stream.
+    """
+    if is_compressed_artifact(log_path):
+        yield from scan_marked_lines_in_stream(log_path, mark)
+        return
+    if os.path.getsize(log_path) == 0:
+        # mmap cannot map an empty file
+        return
+    mark_bytes = mark.encode()
+    with open(log_path, "rb") as log_file:
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            pos = log_map.find(mark_bytes)
+            while pos != -1:
+                line_end = log_map.find(b"\n", pos)
+                if line_end == -1:
+                    line_end = len(log_map)
+                yield decode_marked_line(log_map[pos:line_end])
+                pos = log_map.find(mark_bytes, line_end)
+
+
+def scan_marked_lines_in_stream(log_path: str, mark: str):
+    # The stream is read as bytes so that, as in the mmap scan,
+    # lines are only split at "\n" and not at a lone "\r"
+    mark_bytes = mark.encode()
+    with open_artifact(log_path, "rb") as log_file:
+        for line in log_file:
+            mark_start = line.find(mark_bytes)
+            if mark_start == -1:
+                continue
+            yield decode_marked_line(line[mark_start:])
+
+
+def decode_marked_line(line: bytes) -> str:
+    # Both scans drop the line break, either "\n" or "\r\n"
+    if line.endswith(b"\n"):
+        line = line[:-1]
+    if line.endswith(b"\r"):
+        line = line[:-1]
+    return line.decode()
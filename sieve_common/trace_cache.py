@@ -0,0 +1,195 @@
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+from sieve_common.k8s_event import (
+    APIEvent,
+    SieveLogRecord,
+    SieveLogTokenizer,
+    SIEVE_API_EVENT_MARK,
+    parse_api_event_tokens,
+)
+from sieve_common.log_scanner import scan_marked_lines
+from sieve_common.artifact_storage import artifact_exists, resolve_artifact_path
+
+# Bump the version whenever the layout of the cached payload changes
+# so that the caches written by an older Sieve are treated as stale.
+TRACE_CACHE_VERSION = 2
+TRACE_CACHE_SUFFIX = ".cache"
+
+SIEVE_SERVER_LOG = "sieve-server.log"
+API_SERVER_LOG = "apiserver1.log"
+
+# A trace cache is a text file holding a JSON header line
+# followed by one line per record with the tab-separated tokens of the record.
+# The tokens are split from the log lines by tabs, so they never contain a tab
+# or a line feed, but they might contain a carriage return, so the cache is
+# split on line feeds only (no universal newlines). Result dirs are shared and copied between machines,
+# so the cache only holds plain data and reading it never runs code.
+
+
+def trace_cache_path(log_path: str):
+    return log_path + TRACE_CACHE_SUFFIX
+
+
+def log_fingerprint(log_path: str):
+    # The log might be stored compressed
+    log_stat = os.stat(resolve_artifact_path(log_path)[0])
+    return [log_stat.st_size, log_stat.st_mtime_ns]
+
+
+def write_trace_cache(log_path: str, header: Dict, records: List[List[str]]):
+    header["version"] = TRACE_CACHE_VERSION
+    header["fingerprint"] = log_fingerprint(log_path)
+    header["record_cnt"] = len(records)
+    cache_path = trace_cache_path(log_path)
+    # Write to a temporary file first so that a reader never sees a partial cache
+    tmp_cache_path = cache_path + ".tmp"
+    with open(tmp_cache_path, "w", encoding="utf-8", newline="\n") as cache_file:
+        cache_file.write(json.dumps(header))
+        cache_file.write("\n")
+        for tokens in records:
+            cache_file.write("\t".join(tokens))
+            cache_file.write("\n")
+    os.replace(tmp_cache_path, cache_path)
+
+
+def read_trace_cache(log_path: str) -> Optional[Tuple[Dict, List[List[str]]]]:
+    # Returns the header and the records of the cache.
+    # The cache is only trusted if it is written by the same cache version
+    # and the log has not changed since the cache was written
+    cache_path = trace_cache_path(log_path)
+    if not os.path.isfile(cache_path) or not artifact_exists(log_path):
+        return None
+    try:
+        with open(cache_path, encoding="utf-8", newline="\n") as cache_file:
+            header = json.loads(cache_file.readline())
+            if not isinstance(header, dict):
+                return None
+            if header.get("version") != TRACE_CACHE_VERSION:
+                return None
+            if header.get("fingerprint") != log_fingerprint(log_path):
+                return None
+            records = [line[:-1].split("\t") for line in cache_file]
+    except (OSError, ValueError):
+        return None
+    if len(records) != header.get("record_cnt"):
+        # The cache is truncated
+        return None
+    return header, records
+
+
+class CachedSieveLog:
+    """
+    Replays the records of a sieve server log from its trace cache.
+    It can be iterated like a SieveLogTokenizer.
+    """
+
+    def __init__(self, records: List[List[str]], line_cnt: int):
+        self.__records = records
+        self.__line_cnt = line_cnt
+
+    @property
+    def line_cnt(self):
+        return self.__line_cnt
+
+    def __iter__(self):
+        # The first token of each cached record is its timestamp
+        for tokens in self.__records:
+            yield SieveLogRecord(int(tokens[0]), tokens[1:])
+
+
+class CachingSieveLogTokenizer:
+    """
+    Tokenizes a sieve server log like a SieveLogTokenizer
+    and writes the trace cache from the yielded records once the log is consumed,
+    so that the first run does not tokenize the log a second time for the cache.
+    """
+
+    def __init__(self, log_path: str):
+        self.__log_path = log_path
+        self.__tokenizer = SieveLogTokenizer(log_path)
+
+    @property
+    def line_cnt(self):
+        return self.__tokenizer.line_cnt
+
+    def __iter__(self):
+        records = []
+        for record in self.__tokenizer:
+            records.append([str(record.timestamp)] + record.tokens)
+            yield record
+        write_trace_cache(
+            self.__log_path, {"line_cnt": self.__tokenizer.line_cnt}, records
+        )
+
+
+def open_sieve_log(log_path: str, persist_cache: bool = False):
+    # If persist_cache is set and there is no usable cache,
+    # the cache is written once the returned records are consumed
+    cache = read_trace_cache(log_path)
+    if cache is not None:
+        header, records = cache
+        return CachedSieveLog(records, header["line_cnt"])
+    if persist_cache:
+        return CachingSieveLogTokenizer(log_path)
+    return SieveLogTokenizer(log_path)
+
+
+def tokenize_api_log(log_path: str) -> List[List[str]]:
+    return [
+        marked_line.split("\t")
+        for marked_line in scan_marked_lines(log_path, SIEVE_API_EVENT_MARK)
+    ]
+
+
+def build_key_index(api_events: List[APIEvent]) -> Dict[str, List[int]]:
+    key_index = {}
+    for i in range(len(api_events)):
+        key = api_events[i].key
+        if key not in key_index:
+            key_index[key] = []
+        key_index[key].append(i)
+    return key_index
+
+
+def api_event_tokens(api_event: APIEvent) -> List[str]:
+    # The inverse of parse_api_event_tokens
+    return [
+        SIEVE_API_EVENT_MARK,
+        api_event.etype,
+        api_event.original_key,
+        api_event.rtype,
+        api_event.namespace,
+        api_event.name,
+        api_event.obj_str,
+    ]
+
+
+def persist_api_log_cache(log_path: str, api_events: List[APIEvent]):
+    # For the api events that are not parsed from the log here,
+    # e.g., ingested while the log was written
+    write_trace_cache(
+        log_path,
+        {"key_index": build_key_index(api_events)},
+        [api_event_tokens(api_event) for api_event in api_events],
+    )
+
+
+def load_api_events(
+    log_path: str, persist_cache: bool = False
+) -> Tuple[List[APIEvent], Dict[str, List[int]]]:
+    # Returns all the api events in the apiserver log in order
+    # and an index from each resource key to the positions of its events.
+    # If persist_cache is set and there is no usable cache,
+    # the cache is written from the tokens parsed here
+    cache = read_trace_cache(log_path)
+    if cache is not None:
+        header, api_event_tokens = cache
+        api_events = [parse_api_event_tokens(tokens) for tokens in api_event_tokens]
+        return api_events, header["key_index"]
+    api_event_tokens = tokenize_api_log(log_path)
+    api_events = [parse_api_event_tokens(tokens) for tokens in api_event_tokens]
+    key_index = build_key_index(api_events)
+    if persist_cache:
+        write_trace_cache(log_path, {"key_index": key_index}, api_event_tokens)
+    return api_events, key_index
@@ -8,6 +8,8 @@ from sieve_common.k8s_event import (
     parse_api_event,
     parse_key,
 )
+from sieve_common.api_event_store import APIEventStore
+from sieve_common.artifact_storage import open_artifact, load_json_artifact
 
 
 def kind_native_objects(key: str):
@@ -37,17 +39,12 @@ def get_current_controller_related_list(test_context: TestContext):
     )
 
 
-def generate_controller_related_list(test_context: TestContext):
-    log_dir = test_context.result_dir
-    api_log_path = os.path.join(log_dir, "apiserver1.log")
-    api_event_list = []
+def generate_controller_related_list(
+    test_context: TestContext, api_event_store: APIEventStore
+):
     controller_related_list = []
     controller_related_uid_set = set()
-    for line in open(api_log_path).readlines():
-        if SIEVE_API_EVENT_MARK not in line:
-            continue
-        api_event = parse_api_event(line)
-        api_event_list.append(api_event)
+    api_event_list = api_event_store.api_events
     for api_event in api_event_list:
         if api_event.rtype == "pod":
             pod_as_map = api_event.obj_map
@@ -132,7 +129,7 @@ def generate_fatal(msg):
 
 
 def is_injection_finished(server_log):
-    with open(server_log) as f:
+    with open_artifact(server_log) as f:
         return "Sieve test coordinator finishes all actions" in f.read()
 
 
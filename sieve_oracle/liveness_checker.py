@@ -2,6 +2,8 @@ from sieve_common.common import *
 import json
 from sieve_oracle.checker_common import *
 from sieve_common.k8s_event import get_mask_by_resource_key, parse_key
+from sieve_common.event_delta import MaskSpec
+from sieve_common.api_event_store import APIEventStore
 from deepdiff import DeepDiff
 from pathlib import PurePath
 
@@ -35,22 +37,13 @@ def get_crd(crd):
     return data
 
 
-def generate_state(test_context: TestContext):
+def generate_state(test_context: TestContext, api_event_store: APIEventStore):
     end_state = {}
-    deleted = set()
-    api_log_path = os.path.join(test_context.result_dir, "apiserver1.log")
-    lines = open(api_log_path).readlines()
-    lines.reverse()
-    for line in lines:
-        if SIEVE_API_EVENT_MARK not in line:
-            continue
-        api_event = parse_api_event(line)
-        if api_event.key in deleted or api_event.key in end_state:
-            continue
-        if api_event.etype == APIEventTypes.DELETED:
-            deleted.add(api_event.key)
-        else:
-            end_state[api_event.key] = api_event.obj_map
+    # The end state of each resource is decided by the last api event of that resource
+    for key in api_event_store.keys():
+        api_event = api_event_store.last_version(key)
+        if api_event.etype != APIEventTypes.DELETED:
+            end_state[key] = api_event.obj_map
     return end_state
 
 
@@ -402,6 +395,8 @@ def compare_states(test_context: TestContext):
 
     tdiff = DeepDiff(reference_state, testing_state, ignore_order=False, view="tree")
     resource_map = {}
+    # The masks of a resource key are only compiled once
+    resource_key_to_mask_spec = {}
 
     for delta_type in tdiff:
         for key in tdiff[delta_type]:
@@ -416,18 +411,18 @@ def compare_states(test_context: TestContext):
                 not in test_context.controller_config.custom_resource_definitions
             ):
                 path = tranlate_apiserver_shape_to_controller_shape(untranslated_path)
-            mask_keys = set(
-                get_mask_by_resource_key(
-                    test_context.common_config.field_key_mask,
-                    resource_key,
-                )
-            )
-            mask_paths = set(
-                get_mask_by_resource_key(
-                    test_context.common_config.field_path_mask,
-                    resource_key,
+            if resource_key not in resource_key_to_mask_spec:
+                resource_key_to_mask_spec[resource_key] = MaskSpec(
+                    get_mask_by_resource_key(
+                        test_context.common_config.field_key_mask,
+                        resource_key,
+                    ),
+                    get_mask_by_resource_key(
+                        test_context.common_config.field_path_mask,
+                        resource_key,
+                    ),
                 )
-            )
+            mask_spec = resource_key_to_mask_spec[resource_key]
 
             # Handle for resource size diff
             if len(path) == 1:
@@ -450,12 +445,12 @@ def compare_states(test_context: TestContext):
             should_be_masked = False
             # Search for boring keys
             for kp in path:
-                if kp in mask_keys:
+                if kp in mask_spec.keys:
                     should_be_masked = True
                     break
             # Search for boring paths
             if len(path) > 2:
-                for rule in mask_paths:
+                for rule in mask_spec.paths:
                     if equal_path(rule, "/".join([str(x) for x in path[1:]])):
                         should_be_masked = True
                         break
@@ -4,25 +4,120 @@ from sieve_common.common import *
 from sieve_oracle.checker_common import *
 from sieve_oracle.safety_checker import *
 from sieve_oracle.liveness_checker import *
+from sieve_common.trace_cache import API_SERVER_LOG, persist_api_log_cache
+from sieve_common.artifact_storage import (
+    artifact_compressions,
+    compress_logs,
+    open_artifact,
+)
+from sieve_common.api_event_store import (
+    APIEventStore,
+    APIEventIngester,
+    build_api_event_store,
+)
+from sieve_common.history_store import dump_history
 
 
-def persist_history(test_context: TestContext):
+def compress_result_logs(test_context: TestContext):
+    if test_context.common_config.artifact_compression == artifact_compressions.NONE:
+        return
+    cprint("Compressing logs...", bcolors.OKGREEN)
+    compress_logs(
+        test_context.result_dir, test_context.common_config.artifact_compression
+    )
+
+
+class IncrementalIngestion:
+    """
+    Builds the api event store and the history digest
+    while the workload is still running.
+    """
+
+    def __init__(self, test_context: TestContext):
+        self.test_context = test_context
+        self.history_digest = {}
+        self.completed = False
+        self.ingester = APIEventIngester(
+            os.path.join(test_context.result_dir, API_SERVER_LOG),
+            self.on_api_event,
+        )
+
+    def on_api_event(self, api_event):
+        update_history_digest(self.test_context, self.history_digest, api_event)
+
+    def start(self):
+        self.ingester.start()
+
+    def finish(self):
+        self.completed = self.ingester.finish()
+
+
+def start_incremental_ingestion(test_context: TestContext):
+    if not test_context.common_config.incremental_ingestion_enabled:
+        return
+    cprint("Starting incremental ingestion of api events...", bcolors.OKGREEN)
+    test_context.incremental_ingestion = IncrementalIngestion(test_context)
+    test_context.incremental_ingestion.start()
+
+
+def finish_incremental_ingestion(test_context: TestContext):
+    if test_context.incremental_ingestion is None:
+        return
+    test_context.incremental_ingestion.finish()
+
+
+def load_api_event_store(test_context: TestContext):
+    # Returns the api event store and the history digest if they have been built
+    # by the incremental ingestion; otherwise parses the apiserver log
+    incremental_ingestion = test_context.incremental_ingestion
+    if incremental_ingestion is not None and incremental_ingestion.completed:
+        if test_context.common_config.trace_cache_enabled:
+            # The log is not parsed again just for the trace cache
+            persist_api_log_cache(
+                os.path.join(test_context.result_dir, API_SERVER_LOG),
+                incremental_ingestion.ingester.api_event_store.api_events,
+            )
+        return (
+            incremental_ingestion.ingester.api_event_store,
+            incremental_ingestion.history_digest,
+        )
+    cprint("Loading api events...", bcolors.OKGREEN)
+    return (
+        build_api_event_store(
+            test_context.result_dir, test_context.common_config.trace_cache_enabled
+        ),
+        None,
+    )
+
+
+def persist_history(
+    test_context: TestContext, api_event_store: APIEventStore, history_digest=None
+):
     cprint("Generating state update summary...", bcolors.OKGREEN)
-    history = generate_history(test_context)
-    history_digest = generate_history_digest(test_context)
-    dump_json_file(test_context.result_dir, history, "history.json")
+    history = generate_history(test_context, api_event_store)
+    if history_digest is None:
+        history_digest = generate_history_digest(test_context, api_event_store)
+    dump_history(
+        test_context.result_dir,
+        history,
+        test_context.common_config.artifact_compression,
+    )
     dump_json_file(test_context.result_dir, history_digest, "event.json")
 
 
-def persist_state(test_context: TestContext):
+def persist_state(test_context: TestContext, api_event_store: APIEventStore):
     cprint("Generating end state...", bcolors.OKGREEN)
-    state = generate_state(test_context)
+    state = generate_state(test_context, api_event_store)
     dump_json_file(test_context.result_dir, state, "state.json")
 
 
-def generate_controller_family(test_context: TestContext):
+def generate_controller_family(
+    test_context: TestContext, api_event_store: APIEventStore
+):
     cprint("Generating controller family list...", bcolors.OKGREEN)
-    controller_related_list = generate_controller_related_list(test_context)
+    controller_related_list = generate_controller_related_list(
+        test_context, api_event_store
+    )
     dump_json_file(
         test_context.result_dir, controller_related_list, "controller_family.json"
     )
@@ -58,8 +153,8 @@ def operator_panic_checker(test_context: TestContext):
     operator_log = os.path.join(test_context.result_dir, "streamed-operator.log")
     ret_val = 0
     messages = []
-    file = open(operator_log)
-    for line in file.readlines():
+    file = open_artifact(operator_log)
+    for line in file:
         if "Observed a panic" in line:
             panic_in_file = line[line.find("Observed a panic") :]
             messages.append(
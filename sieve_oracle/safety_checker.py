@@ -3,12 +3,15 @@ import json
 from pathlib import PurePath
 from sieve_oracle.checker_common import *
 from sieve_common.k8s_event import (
+    APIEvent,
     APIEventTypes,
     SIEVE_API_EVENT_MARK,
     parse_api_event,
     extract_generate_name,
     is_generated_random_name,
 )
+from sieve_common.api_event_store import APIEventStore
+from sieve_common.history_store import encode_history, history_path, open_history
 
 
 def masked_resource_key_for_state_update_summary_checker(
@@ -40,42 +43,33 @@ api_event_empty_entry = {
 }
 
 
-def generate_history(test_context: TestContext):
-    api_log_path = os.path.join(test_context.result_dir, "apiserver1.log")
-    history = []
-    for line in open(api_log_path).readlines():
-        if SIEVE_API_EVENT_MARK not in line:
-            continue
-        api_event = parse_api_event(line)
-        api_event_dict = {}
-        api_event_dict["etype"] = api_event.etype
-        api_event_dict["key"] = api_event.key
-        api_event_dict["state"] = api_event.obj_str
-        history.append(api_event_dict)
-    return history
-
-
-def generate_history_digest(test_context: TestContext):
-    log_dir = test_context.result_dir
-    api_log_path = os.path.join(log_dir, "apiserver1.log")
+def generate_history(test_context: TestContext, api_event_store: APIEventStore):
+    # The history entries are delta encoded and generated lazily (see history_store)
+    return encode_history(api_event_store)
+
+
+def update_history_digest(
+    test_context: TestContext, state_update_summary, api_event: APIEvent
+):
+    key = api_event.key
+    if (
+        api_event.etype
+        not in test_context.common_config.state_update_summary_check_event_list
+    ):
+        return
+    generate_name = extract_generate_name(api_event.obj_map)
+    if generate_name is not None:
+        if is_generated_random_name(api_event.name, generate_name):
+            key = key[:-5] + "*"
+    if key not in state_update_summary:
+        state_update_summary[key] = copy.deepcopy(api_event_empty_entry)
+    state_update_summary[key][api_event.etype] += 1
+
+
+def generate_history_digest(test_context: TestContext, api_event_store: APIEventStore):
     state_update_summary = {}
-    for line in open(api_log_path).readlines():
-        if SIEVE_API_EVENT_MARK not in line:
-            continue
-        api_event = parse_api_event(line)
-        key = api_event.key
-        if (
-            api_event.etype
-            not in test_context.common_config.state_update_summary_check_event_list
-        ):
-            continue
-        generate_name = extract_generate_name(api_event.obj_map)
-        if generate_name is not None:
-            if is_generated_random_name(api_event.name, generate_name):
-                key = key[:-5] + "*"
-        if key not in state_update_summary:
-            state_update_summary[key] = copy.deepcopy(api_event_empty_entry)
-        state_update_summary[key][api_event.etype] += 1
+    for api_event in api_event_store:
+        update_history_digest(test_context, state_update_summary, api_event)
     return state_update_summary
 
 
@@ -163,9 +157,7 @@ def get_learning_once_history(test_context: TestContext):
         "learn-once",
         "learn.yaml",
     )
-    learning_once_history = json.load(
-        open(os.path.join(learn_once_dir, "history.json"))
-    )
+    learning_once_history = open_history(history_path(learn_once_dir))
     return learning_once_history
 
 
@@ -175,16 +167,12 @@ def get_learning_twice_history(test_context: TestContext):
         "learn-twice",
         "learn.yaml",
     )
-    learning_twice_history = json.load(
-        open(os.path.join(learn_twice_dir, "history.json"))
-    )
+    learning_twice_history = open_history(history_path(learn_twice_dir))
     return learning_twice_history
 
 
 def get_testing_history(test_context: TestContext):
-    testing_history = json.load(
-        open(os.path.join(test_context.result_dir, "history.json"))
-    )
+    testing_history = open_history(history_path(test_context.result_dir))
     return testing_history
 
 
@@ -193,6 +181,8 @@ def get_event_mask(test_context: TestContext):
 
 
 def check_single_history(history, resource_keys, checker_name, customized_checker):
+    # history can be a HistoryReader (see get_testing_history),
+    # which rebuilds the state of each event only when it is read
     ret_val = 0
     messages = []
     current_state = {}
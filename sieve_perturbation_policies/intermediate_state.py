@@ -22,6 +22,10 @@ def intermediate_state_detectable_pass(
     for vertex in event_vertices:
         assert vertex.is_operator_write()
         operator_write = vertex.content
+        # detectable_event_diff rejects any event seen more than 3 times first,
+        # so nondeterministic_key (which loads state.json) is skipped for them
+        if operator_write.signature_counter > 3:
+            continue
         if nondeterministic_key(
             test_context,
             operator_write,
@@ -52,7 +56,6 @@ def effective_write_filtering_pass(event_vertices: List[EventVertex]):
                 vertex.content.prev_obj_map,
                 vertex.content.obj_map,
                 None,
-                None,
                 True,
                 False,
             )
@@ -111,12 +114,10 @@ def generate_intermediate_state_test_plan_for_controller_write(
     else:
         condition["conditionType"] = "onObjectUpdate"
         condition["resourceKey"] = resource_key
-        condition["prevStateDiff"] = json.dumps(
-            operator_write.slim_prev_obj_map, sort_keys=True
-        )
-        condition["curStateDiff"] = json.dumps(
-            operator_write.slim_cur_obj_map, sort_keys=True
+        condition["prevStateDiff"] = canonical_event_str(
+            operator_write.slim_prev_obj_map
         )
+        condition["curStateDiff"] = canonical_event_str(operator_write.slim_cur_obj_map)
         condition["occurrence"] = operator_write.signature_counter
     return {
         "workload": test_context.test_name,
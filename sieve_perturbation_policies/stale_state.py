@@ -1,13 +1,13 @@
+import bisect
 import json
 import os
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Tuple
 from sieve_common.event_delta import *
 from sieve_common.common import *
 from sieve_common.k8s_event import *
 from sieve_analyzer.event_graph import (
     EventGraph,
     EventVertex,
-    event_vertices_connected,
 )
 from sieve_perturbation_policies.common import (
     nondeterministic_key,
@@ -17,11 +17,13 @@ from sieve_perturbation_policies.common import (
 
 def stale_state_detectable_pass(
     test_context: TestContext,
-    event_pairs: List[Tuple[EventVertex, EventVertex]],
+    event_pairs: Iterable[Tuple[EventVertex, EventVertex]],
 ):
     print("Running stale state detectable pass...")
+    event_pair_cnt = 0
     candidate_pairs = []
     for pair in event_pairs:
+        event_pair_cnt += 1
         operator_hear = pair[0].content
         operator_write = pair[1].content
         if nondeterministic_key(test_context, operator_hear) or nondeterministic_key(
@@ -37,66 +39,107 @@ def stale_state_detectable_pass(
             operator_hear.signature_counter,
         ):
             candidate_pairs.append(pair)
-    print("%d -> %d edges" % (len(event_pairs), len(candidate_pairs)))
+    print("%d -> %d edges" % (event_pair_cnt, len(candidate_pairs)))
     return candidate_pairs
 
 
-def get_stale_state_baseline(event_graph: EventGraph):
+def get_delete_write_vertices(event_graph: EventGraph) -> List[EventVertex]:
+    # Only the DELETE operator_writes can be the sink of a stale state test plan
+    return [
+        operator_write_vertex
+        for operator_write_vertex in event_graph.operator_write_vertices
+        if operator_write_vertex.content.etype == OperatorWriteTypes.DELETE
+    ]
+
+
+def get_stale_state_baseline(
+    event_graph: EventGraph, delete_write_vertices: List[EventVertex]
+) -> Iterator[Tuple[EventVertex, EventVertex]]:
+    # Yields each pair of an operator_hear and a DELETE operator_write starting after it,
+    # write by write and the operator_hears in order.
+    # The operator_hears are sorted by start_timestamp,
+    # so the ones of each operator_write are a prefix found by bisect.
     operator_hear_vertices = event_graph.operator_hear_vertices
-    operator_write_vertices = event_graph.operator_write_vertices
-    candidate_pairs = []
-    for operator_write_vertex in operator_write_vertices:
-        for operator_hear_vertex in operator_hear_vertices:
-            operator_write = operator_write_vertex.content
-            operator_hear = operator_hear_vertex.content
-            if not operator_write.etype == OperatorWriteTypes.DELETE:
-                continue
-            write_after_hear = (
-                operator_write.start_timestamp > operator_hear.start_timestamp
-            )
+    hear_start_timestamps = [
+        operator_hear_vertex.content.start_timestamp
+        for operator_hear_vertex in operator_hear_vertices
+    ]
+    for operator_write_vertex in delete_write_vertices:
+        hear_cnt = bisect.bisect_left(
+            hear_start_timestamps, operator_write_vertex.content.start_timestamp
+        )
+        for i in range(hear_cnt):
+            yield (operator_hear_vertices[i], operator_write_vertex)
 
-            if write_after_hear:
-                pair = (operator_hear_vertex, operator_write_vertex)
-                candidate_pairs.append(pair)
-    return candidate_pairs
 
+def get_stale_state_baseline_cnt(
+    event_graph: EventGraph, delete_write_vertices: List[EventVertex]
+) -> int:
+    # Same as the number of pairs yielded by get_stale_state_baseline
+    hear_start_timestamps = [
+        operator_hear_vertex.content.start_timestamp
+        for operator_hear_vertex in event_graph.operator_hear_vertices
+    ]
+    return sum(
+        bisect.bisect_left(
+            hear_start_timestamps, operator_write_vertex.content.start_timestamp
+        )
+        for operator_write_vertex in delete_write_vertices
+    )
 
-def causality_pair_filtering_pass(
-    event_pairs: List[Tuple[EventVertex, EventVertex]],
-):
+
+def causality_pair_filtering_pass(event_graph: EventGraph, baseline_cnt: int):
+    # Keeps the baseline pairs connected by an operator_hear -> operator_write edge.
+    # Every such edge connects an operator_hear to an operator_write starting after it,
+    # and the edges are added write by write with the operator_hears in order (see base_pass),
+    # so the pairs are taken from the edges in the same order as the baseline
+    # instead of checking every baseline pair.
     print("Running optional pass: causality-filtering...")
     candidate_pairs = []
-    for pair in event_pairs:
-        source = pair[0]
-        sink = pair[1]
-        if event_vertices_connected(source, sink):
-            candidate_pairs.append(pair)
-    print("%d -> %d edges" % (len(event_pairs), len(candidate_pairs)))
+    for edge in event_graph.operator_hear_operator_write_edges:
+        if (
+            edge.sink.is_operator_write()
+            and edge.sink.content.etype == OperatorWriteTypes.DELETE
+        ):
+            candidate_pairs.append((edge.source, edge.sink))
+    print("%d -> %d edges" % (baseline_cnt, len(candidate_pairs)))
     return candidate_pairs
 
 
 def reversed_effect_filtering_pass(
-    event_pairs: List[Tuple[EventVertex, EventVertex]],
+    event_pairs: Iterable[Tuple[EventVertex, EventVertex]],
     event_graph: EventGraph,
 ):
     print("Running optional pass: reversed-effect-filtering...")
+    event_pair_cnt = 0
     candidate_pairs = []
     hear_key_to_vertices = event_graph.operator_hear_key_to_vertices
     for pair in event_pairs:
+        event_pair_cnt += 1
         operator_write = pair[1].content
         assert operator_write.etype == OperatorWriteTypes.DELETE
         if operator_write.error not in ALLOWED_ERROR_TYPE:
             continue
         reversed_effect = False
-        if operator_write.key in hear_key_to_vertices:
-            for operator_hear_vertex in hear_key_to_vertices[operator_write.key]:
+        if operator_write.key_id in hear_key_to_vertices:
+            # Look for any ADDED or UPDATED operator_hear of the key after the write,
+            # walking back from the last one
+            operator_hear_vertex = hear_key_to_vertices[operator_write.key_id][-1]
+            while (
+                operator_hear_vertex is not None
+                and operator_hear_vertex.content.start_timestamp
+                > operator_write.end_timestamp
+            ):
                 operator_hear = operator_hear_vertex.content
-                if operator_hear.start_timestamp <= operator_write.end_timestamp:
-                    continue
                 if operator_hear.etype == OperatorHearTypes.ADDED:
                     reversed_effect = True
+                    break
                 if operator_hear.etype == OperatorHearTypes.UPDATED:
                     reversed_effect = True
+                    break
+                operator_hear_vertex = event_graph.get_prev_operator_hear(
+                    operator_hear_vertex
+                )
         else:
             # if the operator_write key never appears in the operator_hear_key_map
             # it means the operator does not watch on the resource
@@ -104,7 +147,7 @@ def reversed_effect_filtering_pass(
             reversed_effect = True
         if reversed_effect:
             candidate_pairs.append(pair)
-    print("%d -> %d edges" % (len(event_pairs), len(candidate_pairs)))
+    print("%d -> %d edges" % (event_pair_cnt, len(candidate_pairs)))
     return candidate_pairs
 
 
@@ -169,11 +212,11 @@ def generate_stale_state_test_plan(
     else:
         condition_for_trigger1["conditionType"] = "onObjectUpdate"
         condition_for_trigger1["resourceKey"] = resource_key1
-        condition_for_trigger1["prevStateDiff"] = json.dumps(
-            operator_hear.slim_prev_obj_map, sort_keys=True
+        condition_for_trigger1["prevStateDiff"] = canonical_event_str(
+            operator_hear.slim_prev_obj_map
         )
-        condition_for_trigger1["curStateDiff"] = json.dumps(
-            operator_hear.slim_cur_obj_map, sort_keys=True
+        condition_for_trigger1["curStateDiff"] = canonical_event_str(
+            operator_hear.slim_cur_obj_map
         )
         if (
             operator_hear.rtype
@@ -250,22 +293,29 @@ def generate_stale_state_test_plan(
 
 
 def stale_state_analysis(event_graph: EventGraph, path: str, test_context: TestContext):
-    candidate_pairs = get_stale_state_baseline(event_graph)
-    baseline_spec_number = len(candidate_pairs)
+    # The baseline is only counted here and enumerated lazily if no pass prunes it
+    delete_write_vertices = get_delete_write_vertices(event_graph)
+    baseline_spec_number = get_stale_state_baseline_cnt(
+        event_graph, delete_write_vertices
+    )
     after_p1_spec_number = -1
     after_p2_spec_number = -1
-    final_spec_number = -1
+    final_spec_number = 0
     if test_context.common_config.causality_pruning_enabled:
-        candidate_pairs = causality_pair_filtering_pass(candidate_pairs)
+        candidate_pairs = causality_pair_filtering_pass(
+            event_graph, baseline_spec_number
+        )
         after_p1_spec_number = len(candidate_pairs)
+    else:
+        candidate_pairs = get_stale_state_baseline(event_graph, delete_write_vertices)
     if test_context.common_config.effective_updates_pruning_enabled:
         candidate_pairs = reversed_effect_filtering_pass(candidate_pairs, event_graph)
         after_p2_spec_number = len(candidate_pairs)
     if test_context.common_config.nondeterministic_pruning_enabled:
         candidate_pairs = stale_state_detectable_pass(test_context, candidate_pairs)
-    final_spec_number = len(candidate_pairs)
     i = 0
     for pair in candidate_pairs:
+        final_spec_number += 1
         source = pair[0]
         sink = pair[1]
         operator_hear = source.content
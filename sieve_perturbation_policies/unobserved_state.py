@@ -21,6 +21,10 @@ def unobserved_state_detectable_pass(
     candidate_vertices = []
     for vertex in event_vertices:
         operator_hear = vertex.content
+        # detectable_event_diff rejects any event seen more than 3 times first,
+        # so nondeterministic_key (which loads state.json) is skipped for them
+        if operator_hear.signature_counter > 3:
+            continue
         if nondeterministic_key(
             test_context,
             operator_hear,
@@ -151,11 +155,11 @@ def generate_unobserved_state_test_plan(
     else:
         condition_for_trigger1["conditionType"] = "onObjectUpdate"
         condition_for_trigger1["resourceKey"] = resource_key
-        condition_for_trigger1["prevStateDiff"] = json.dumps(
-            operator_hear.slim_prev_obj_map, sort_keys=True
+        condition_for_trigger1["prevStateDiff"] = canonical_event_str(
+            operator_hear.slim_prev_obj_map
         )
-        condition_for_trigger1["curStateDiff"] = json.dumps(
-            operator_hear.slim_cur_obj_map, sort_keys=True
+        condition_for_trigger1["curStateDiff"] = canonical_event_str(
+            operator_hear.slim_cur_obj_map
         )
         condition_for_trigger1["occurrence"] = operator_hear.signature_counter
         trigger_for_action2["definitions"] = [
@@ -164,8 +168,8 @@ def generate_unobserved_state_test_plan(
                 "condition": {
                     "conditionType": "onAnyFieldModification",
                     "resourceKey": resource_key,
-                    "prevStateDiff": json.dumps(
-                        operator_hear.slim_cur_obj_map, sort_keys=True
+                    "prevStateDiff": canonical_event_str(
+                        operator_hear.slim_cur_obj_map
                     ),
                     "occurrence": 1,
                 },
@@ -0,0 +1,144 @@
+import copy
+import json
+import random
+from sieve_common.common import TestContext, sieve_modes, sieve_stages
+from sieve_common.default_config import get_common_config, get_controller_config
+
+
+def make_test_context(result_dir: str) -> TestContext:
+    # A learn-once context of cass-operator writing to result_dir,
+    # with the trace cache off so that no cache file is left next to the logs
+    test_context = TestContext(
+        "cass-operator",
+        "test",
+        sieve_stages.LEARN,
+        sieve_modes.LEARN_ONCE,
+        "all",
+        "learn.yaml",
+        "learn.yaml",
+        result_dir,
+        result_dir,
+        "docker_repo",
+        "docker_tag",
+        1,
+        2,
+        False,
+        get_common_config(),
+        get_controller_config("examples", "cass-operator"),
+        False,
+    )
+    test_context.common_config.trace_cache_enabled = False
+    return test_context
+
+
+def make_object(rnd: random.Random, rtype: str, name: str):
+    return {
+        "apiVersion": "v1",
+        "kind": rtype,
+        "metadata": {
+            "name": name,
+            "namespace": "default",
+            "uid": "uid-%s-%d" % (name, rnd.randint(0, 1)),
+            "resourceVersion": str(rnd.randint(1, 10**6)),
+            "labels": {"app": "x"},
+        },
+        "spec": {"replicas": rnd.randint(1, 3), "args": ["a"] * rnd.randint(1, 2)},
+        "status": {"phase": rnd.choice(["Pending", "Running"])},
+    }
+
+
+def generate_sieve_log(path: str, seed: int, reconcile_cnt: int):
+    """
+    Writes a synthetic sieve server log: each step is one operator_hear of a random key
+    followed by one reconcile reading and writing random keys.
+    Updates often leave the object unchanged or revert it,
+    so that the hears cancel each other and the signatures repeat.
+    """
+    rnd = random.Random(seed)
+    keys = [("pod", "pod-%d" % i) for i in range(4)] + [("configmap", "cm-0")]
+    state = {}
+    ids = {"hear": 0, "write": 0}
+    reconcile_ids = {"rt1": 0, "rt2": 0}
+    pending_hears = []
+    with open(path, "w") as log:
+
+        def log_line(*tokens):
+            log.write("2021/10/10 12:00:00 " + "\t".join(map(str, tokens)) + "\n")
+
+        def finish_hears():
+            while pending_hears and rnd.random() < 0.7:
+                log_line("[SIEVE-AFTER-HEAR]", pending_hears.pop(0))
+
+        for _ in range(reconcile_cnt):
+            rtype, name = rnd.choice(keys)
+            if (rtype, name) not in state:
+                etype = "Added"
+                state[(rtype, name)] = make_object(rnd, rtype, name)
+            elif rnd.random() < 0.15:
+                etype = "Deleted"
+            else:
+                etype = "Updated"
+                obj = copy.deepcopy(state[(rtype, name)])
+                if rnd.random() < 0.5:
+                    obj["spec"]["replicas"] = rnd.randint(1, 3)
+                if rnd.random() < 0.3:
+                    obj["status"]["phase"] = rnd.choice(["Pending", "Running"])
+                state[(rtype, name)] = obj
+            ids["hear"] += 1
+            log_line(
+                "[SIEVE-BEFORE-HEAR]",
+                ids["hear"],
+                etype,
+                rtype,
+                json.dumps(state[(rtype, name)]),
+            )
+            if etype == "Deleted":
+                del state[(rtype, name)]
+            pending_hears.append(ids["hear"])
+            finish_hears()
+            reconciler_type = rnd.choice(["rt1", "rt2"])
+            reconcile_ids[reconciler_type] += 1
+            log_line(
+                "[SIEVE-BEFORE-RECONCILE]",
+                reconciler_type,
+                reconcile_ids[reconciler_type],
+            )
+            for _ in range(rnd.randint(0, 4)):
+                rtype, name = rnd.choice(keys)
+                obj = state.get((rtype, name)) or make_object(rnd, rtype, name)
+                action = rnd.random()
+                if action < 0.4:
+                    log_line(
+                        "[SIEVE-AFTER-READ]",
+                        "Get",
+                        "true",
+                        rtype,
+                        "default",
+                        name,
+                        reconciler_type,
+                        "NoError",
+                        json.dumps(obj),
+                    )
+                else:
+                    obj = copy.deepcopy(obj)
+                    if rnd.random() < 0.5:
+                        obj["spec"]["replicas"] = rnd.randint(1, 3)
+                    ids["write"] += 1
+                    log_line("[SIEVE-BEFORE-WRITE]", ids["write"])
+                    finish_hears()
+                    log_line(
+                        "[SIEVE-AFTER-WRITE]",
+                        ids["write"],
+                        rnd.choice(["Create", "Update", "Delete", "Patch"]),
+                        rtype,
+                        reconciler_type,
+                        "NoError" if rnd.random() < 0.8 else "NotFound",
+                        json.dumps(obj),
+                    )
+            log_line(
+                "[SIEVE-AFTER-RECONCILE]",
+                reconciler_type,
+                reconcile_ids[reconciler_type],
+            )
+        while pending_hears:
+            log_line("[SIEVE-AFTER-HEAR]", pending_hears.pop(0))
@@ -0,0 +1,174 @@
+import json
+import random
+import unittest
+from sieve_common.k8s_event import (
+    OperatorHear,
+    OperatorHearTypes,
+    OperatorNonK8sWrite,
+    OperatorWrite,
+    OperatorWriteTypes,
+    ResourceKeyTable,
+)
+from sieve_analyzer.analyze import HEAR_INTERVAL_INDEX_SCAN_SIZE, base_pass
+from sieve_analyzer.event_graph import EventVertex
+
+RTYPES = ["pod", "service", "configmap"]
+NAMES = ["obj-%d" % i for i in range(6)]
+
+# The pairing that base_pass replaced: every operator_write is checked against
+# every operator_hear in order, and the optional hear-read-overlap filtering
+# is a second pass over the pairs comparing the keys as strings.
+
+
+def reference_base_pass(
+    operator_hear_vertices, operator_write_vertices, operator_non_k8s_write_vertices
+):
+    vertex_pairs = []
+    write_vertices = operator_write_vertices + operator_non_k8s_write_vertices
+    for operator_write_vertex in write_vertices:
+        for operator_hear_vertex in operator_hear_vertices:
+            if operator_write_vertex.content.reconcile_id == -1:
+                continue
+            hear_within_reconcile_scope = (
+                operator_write_vertex.content.range_start_timestamp
+                < operator_hear_vertex.content.end_timestamp
+            )
+            write_after_hear = (
+                operator_write_vertex.content.start_timestamp
+                > operator_hear_vertex.content.start_timestamp
+            )
+            if hear_within_reconcile_scope and write_after_hear:
+                vertex_pairs.append([operator_hear_vertex, operator_write_vertex])
+    return vertex_pairs
+
+
+def reference_hear_read_overlap_filtering_pass(vertex_pairs, key_table):
+    pruned_vertex_pairs = []
+    for pair in vertex_pairs:
+        operator_hear_vertex = pair[0]
+        operator_write_vertex = pair[1]
+        if operator_write_vertex.is_operator_write():
+            read_keys = key_table.keys_of_bitset(
+                operator_write_vertex.content.read_key_ids
+            )
+            key_match = operator_hear_vertex.content.key in read_keys
+            type_match = (
+                operator_hear_vertex.content.rtype
+                in operator_write_vertex.content.read_types
+            )
+            if key_match or type_match:
+                pruned_vertex_pairs.append(pair)
+        else:
+            pruned_vertex_pairs.append(pair)
+    return pruned_vertex_pairs
+
+
+def random_timestamp(rnd: random.Random, timestamps, max_timestamp):
+    # Mostly reuses the timestamp of another event, so that the ties are common
+    if timestamps and rnd.random() < 0.6:
+        return rnd.choice(timestamps)
+    return rnd.randint(0, max_timestamp)
+
+
+def random_events(rnd: random.Random, key_table: ResourceKeyTable, hear_cnt: int):
+    max_timestamp = 4 * hear_cnt
+    gid = 0
+    operator_hear_vertices = []
+    starts = sorted(rnd.sample(range(max_timestamp), hear_cnt))
+    ends = []
+    for start in starts:
+        end = start + 1 + int(rnd.expovariate(0.2))
+        if ends and rnd.random() < 0.2:
+            # Another operator_hear ending at the same time
+            end = max(start + 1, rnd.choice(ends))
+        ends.append(end)
+        rtype = rnd.choice(RTYPES)
+        obj_str = json.dumps({"metadata": {"name": rnd.choice(NAMES)}})
+        operator_hear = OperatorHear(
+            str(gid), OperatorHearTypes.UPDATED, rtype, obj_str
+        )
+        operator_hear.start_timestamp = start
+        operator_hear.end_timestamp = end
+        operator_hear.key_id = key_table.intern(operator_hear.key)
+        operator_hear_vertices.append(EventVertex(gid, operator_hear))
+        gid += 1
+    # Some keys are read but never heard
+    key_table.intern("pod/default/unheard")
+    timestamps = starts + ends
+    write_vertices = []
+    non_k8s_write_vertices = []
+    for _ in range(rnd.randint(1, hear_cnt)):
+        start = random_timestamp(rnd, timestamps, max_timestamp)
+        choice = rnd.random()
+        if choice < 0.6:
+            range_start = random_timestamp(rnd, timestamps, start)
+        elif choice < 0.8:
+            range_start = start
+        else:
+            # Not expected in a trace, but the pairing is still defined
+            range_start = random_timestamp(rnd, timestamps, max_timestamp)
+        if rnd.random() < 0.85:
+            operator_write = OperatorWrite(
+                str(gid),
+                OperatorWriteTypes.UPDATE,
+                rnd.choice(RTYPES),
+                "reconciler",
+                "NoError",
+                "{}",
+            )
+            operator_write.read_types = set(rnd.sample(RTYPES, rnd.randint(0, 2)))
+            read_keys = rnd.sample(range(len(key_table)), rnd.randint(0, 4))
+            for key_id in read_keys:
+                operator_write.read_key_ids |= 1 << key_id
+            write_vertices.append(EventVertex(gid, operator_write))
+        else:
+            operator_write = OperatorNonK8sWrite(
+                str(gid), "module", "file", "recv", "fun", "reconciler"
+            )
+            non_k8s_write_vertices.append(EventVertex(gid, operator_write))
+        operator_write.start_timestamp = start
+        operator_write.range_start_timestamp = range_start
+        operator_write.reconcile_id = -1 if rnd.random() < 0.05 else 1
+        gid += 1
+    return operator_hear_vertices, write_vertices, non_k8s_write_vertices
+
+
+def gid_pairs(vertex_pairs):
+    return [(pair[0].gid, pair[1].gid) for pair in vertex_pairs]
+
+
+class TestBasePass(unittest.TestCase):
+    def test_base_pass_matches_pairwise_check(self):
+        rnd = random.Random(0)
+        pair_cnt = 0
+        pruned_pair_cnt = 0
+        for trial in range(300):
+            # Both the scan of the few operator_hears and the segment tree are used
+            hear_cnt = rnd.randint(1, 4 * HEAR_INTERVAL_INDEX_SCAN_SIZE)
+            key_table = ResourceKeyTable()
+            (
+                operator_hear_vertices,
+                write_vertices,
+                non_k8s_write_vertices,
+            ) = random_events(rnd, key_table, hear_cnt)
+            expected = reference_base_pass(
+                operator_hear_vertices, write_vertices, non_k8s_write_vertices
+            )
+            actual = base_pass(
+                operator_hear_vertices, write_vertices, non_k8s_write_vertices
+            )
+            # Both the pairs and their order are the same
+            self.assertEqual(gid_pairs(actual), gid_pairs(expected), trial)
+            pair_cnt += len(expected)
+            expected = reference_hear_read_overlap_filtering_pass(expected, key_table)
+            actual = base_pass(
+                operator_hear_vertices, write_vertices, non_k8s_write_vertices, True
+            )
+            self.assertEqual(gid_pairs(actual), gid_pairs(expected), trial)
+            pruned_pair_cnt += len(expected)
+        self.assertGreater(pruned_pair_cnt, 0)
+        self.assertLess(pruned_pair_cnt, pair_cnt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from sieve_analyzer import analyze
+from sieve_perturbation_policies.common import (
+    detectable_event_diff,
+    nondeterministic_key,
+)
+from sieve_perturbation_policies.intermediate_state import (
+    intermediate_state_detectable_pass,
+)
+from sieve_perturbation_policies.unobserved_state import (
+    unobserved_state_detectable_pass,
+)
+from tests.common import generate_sieve_log, make_test_context
+
+LEARNED_MASKED_PATHS = {"pod/default/pod-1": [["spec", "replicas"]]}
+
+
+def reference_detectable_pass(test_context, event_vertices, recv_event: bool):
+    # The detectable passes before the signature_counter check was moved first
+    candidate_vertices = []
+    for vertex in event_vertices:
+        event = vertex.content
+        if nondeterministic_key(test_context, event):
+            continue
+        if detectable_event_diff(
+            recv_event,
+            event.slim_prev_obj_map,
+            event.slim_cur_obj_map,
+            event.prev_etype,
+            event.etype,
+            event.signature_counter,
+        ):
+            candidate_vertices.append(vertex)
+    return candidate_vertices
+
+
+class TestDetectablePass(unittest.TestCase):
+    def setUp(self):
+        self.result_dir = tempfile.mkdtemp()
+        self.test_context = make_test_context(self.result_dir)
+        self.log_path = os.path.join(self.result_dir, "sieve-server.log")
+        self.oracle_dir = os.path.join(self.result_dir, "oracle")
+        os.makedirs(self.oracle_dir)
+        with open(os.path.join(self.oracle_dir, "mask.json"), "w") as f:
+            json.dump(LEARNED_MASKED_PATHS, f)
+        with open(os.path.join(self.test_context.oracle_dir, "state.json"), "w") as f:
+            json.dump({"pod/default/pod-3": "SIEVE-IGNORE"}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.result_dir)
+
+    def test_detectable_passes_match_reference(self):
+        frequent_cnt = 0
+        kept_cnt = 0
+        for seed in range(3):
+            generate_sieve_log(self.log_path, seed, 300)
+            event_graph = analyze.build_event_graph(
+                self.test_context, self.log_path, self.oracle_dir
+            )
+            for detectable_pass, event_vertices, recv_event in [
+                (
+                    unobserved_state_detectable_pass,
+                    event_graph.operator_hear_vertices,
+                    True,
+                ),
+                (
+                    intermediate_state_detectable_pass,
+                    event_graph.operator_write_vertices,
+                    False,
+                ),
+            ]:
+                expected = reference_detectable_pass(
+                    self.test_context, event_vertices, recv_event
+                )
+                actual = detectable_pass(self.test_context, event_vertices)
+                # The same vertices are kept in the same order
+                self.assertEqual(
+                    [vertex.gid for vertex in actual],
+                    [vertex.gid for vertex in expected],
+                )
+                kept_cnt += len(actual)
+                frequent_cnt += sum(
+                    vertex.content.signature_counter > 3 for vertex in event_vertices
+                )
+        # The log should have both the events skipped early and the kept ones
+        self.assertGreater(frequent_cnt, 0)
+        self.assertGreater(kept_cnt, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
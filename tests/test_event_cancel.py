@@ -0,0 +1,181 @@
+import copy
+import json
+import random
+import unittest
+from sieve_common.common import SIEVE_IDX_SKIP
+from sieve_common.k8s_event import OperatorHear, OperatorHearTypes
+from sieve_common.event_delta import EventDeltaCache, MaskSpec
+from sieve_analyzer.event_graph import diff_and_cancel_operator_hears
+from tests.test_event_delta import (
+    mutate,
+    random_map,
+    random_masks,
+    reference_canonicalize_event_as_map,
+    reference_diff_event,
+)
+
+# The pairwise cancel that diff_and_cancel_operator_hears replaced:
+# operator_hears[j] cancels operator_hears[i] (i < j) if exactly one of them is DELETED
+# or if the slim_cur_obj_map of operator_hears[i] is not part of
+# the canonicalized obj_map of operator_hears[j].
+
+
+def reference_part_of_event_as_list(small_event, large_event):
+    if len(small_event) != len(large_event):
+        return False
+    for i in range(len(small_event)):
+        small_val = small_event[i]
+        large_val = large_event[i]
+        if small_val == SIEVE_IDX_SKIP:
+            continue
+        if isinstance(small_val, dict):
+            if not isinstance(large_val, dict):
+                return False
+            if not reference_part_of_event_as_map(small_val, large_val):
+                return False
+        elif isinstance(small_val, list):
+            if not isinstance(large_val, list):
+                return False
+            if not reference_part_of_event_as_list(small_val, large_val):
+                return False
+        elif small_val != large_val:
+            return False
+    return True
+
+
+def reference_part_of_event_as_map(small_event, large_event):
+    for key in small_event:
+        if key not in large_event:
+            return False
+    for key in small_event:
+        small_val = small_event[key]
+        large_val = large_event[key]
+        if isinstance(small_val, dict):
+            if not isinstance(large_val, dict):
+                return False
+            if not reference_part_of_event_as_map(small_val, large_val):
+                return False
+        elif isinstance(small_val, list):
+            if not isinstance(large_val, list):
+                return False
+            if not reference_part_of_event_as_list(small_val, large_val):
+                return False
+        elif small_val != large_val:
+            return False
+    return True
+
+
+def reference_cancel(obj_maps, etypes, masked_keys, masked_paths):
+    # Returns the cancelled_by positions of each operator_hear
+    slim_cur_obj_maps = []
+    prev_obj_map = {}
+    for obj_map in obj_maps:
+        slim_cur_obj_maps.append(
+            reference_diff_event(prev_obj_map, obj_map, masked_keys, masked_paths)[1]
+        )
+        prev_obj_map = obj_map
+    cancelled_by = []
+    for i in range(len(obj_maps) - 1):
+        cancelled_by.append(set())
+        for j in range(i + 1, len(obj_maps)):
+            if i == 0:
+                cancelled_by[i].add(j)
+                continue
+            if (etypes[i] == OperatorHearTypes.DELETED) != (
+                etypes[j] == OperatorHearTypes.DELETED
+            ):
+                cancelled_by[i].add(j)
+            elif (
+                etypes[i] != OperatorHearTypes.DELETED
+                and slim_cur_obj_maps[i] is not None
+            ):
+                canonical_obj_map = copy.deepcopy(obj_maps[j])
+                reference_canonicalize_event_as_map(
+                    canonical_obj_map, "", masked_keys, masked_paths
+                )
+                if not reference_part_of_event_as_map(
+                    slim_cur_obj_maps[i], canonical_obj_map
+                ):
+                    cancelled_by[i].add(j)
+    # The last operator_hear is never cancelled
+    cancelled_by.append(set())
+    return cancelled_by
+
+
+def with_metadata(obj_map):
+    # Every object needs a name to get its key
+    obj_map = dict(obj_map)
+    metadata = obj_map.get("metadata")
+    metadata = dict(metadata) if isinstance(metadata, dict) else {}
+    metadata["name"] = "pod-1"
+    obj_map["metadata"] = metadata
+    return obj_map
+
+
+def random_version_chain(rnd: random.Random, length: int):
+    # Most versions change a few fields of the previous one
+    # and some go back to an earlier one, so that both the cancelled
+    # and the not cancelled pairs are common
+    obj_maps = [with_metadata(random_map(rnd, 1, rnd.randint(1, 5)))]
+    etypes = [OperatorHearTypes.ADDED]
+    for _ in range(length - 1):
+        choice = rnd.random()
+        if choice < 0.2:
+            obj_map = copy.deepcopy(rnd.choice(obj_maps))
+        elif choice < 0.9:
+            obj_map = mutate(rnd, obj_maps[-1])
+            if not isinstance(obj_map, dict):
+                obj_map = {"a": obj_map}
+        else:
+            obj_map = random_map(rnd, 1, rnd.randint(1, 5))
+        obj_maps.append(with_metadata(obj_map))
+        etypes.append(
+            rnd.choice(
+                [
+                    OperatorHearTypes.ADDED,
+                    OperatorHearTypes.UPDATED,
+                    OperatorHearTypes.UPDATED,
+                    OperatorHearTypes.UPDATED,
+                    OperatorHearTypes.DELETED,
+                ]
+            )
+        )
+    return obj_maps, etypes
+
+
+class TestEventCancel(unittest.TestCase):
+    def test_cancel_matches_pairwise_check(self):
+        rnd = random.Random(0)
+        cancelled_cnt = 0
+        not_cancelled_cnt = 0
+        for _ in range(2000):
+            obj_maps, etypes = random_version_chain(rnd, rnd.randint(1, 12))
+            masked_keys, masked_paths = random_masks(rnd)
+            operator_hears = [
+                OperatorHear(str(i), etypes[i], "pod", json.dumps(obj_maps[i]))
+                for i in range(len(obj_maps))
+            ]
+            expected = reference_cancel(obj_maps, etypes, masked_keys, masked_paths)
+            diff_and_cancel_operator_hears(
+                operator_hears, MaskSpec(masked_keys, masked_paths), EventDeltaCache(0)
+            )
+            actual = [operator_hear.cancelled_by for operator_hear in operator_hears]
+            self.assertEqual(
+                actual, expected, (obj_maps, etypes, masked_keys, masked_paths)
+            )
+            for i in range(1, len(obj_maps)):
+                for j in range(i + 1, len(obj_maps)):
+                    if OperatorHearTypes.DELETED in [etypes[i], etypes[j]]:
+                        continue
+                    if j in expected[i]:
+                        cancelled_cnt += 1
+                    else:
+                        not_cancelled_cnt += 1
+        # Both outcomes of the payload check should be common,
+        # so that the conditions are compared
+        self.assertGreater(cancelled_cnt, 5000)
+        self.assertGreater(not_cancelled_cnt, 5000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,401 @@
+import copy
+import json
+import os
+import random
+import unittest
+from sieve_common.common import SIEVE_IDX_SKIP, SIEVE_VALUE_MASK, match_mask_regex
+from sieve_common.event_delta import (
+    EventDeltaCache,
+    MaskSpec,
+    canonical_event,
+    diff_event,
+)
+
+# The multi-pass differ that diff_event replaced: it deep-copies both events,
+# canonicalizes the copies in place (building the path string of every field)
+# and then diffs the copies. diff_event must return exactly what it returns.
+
+
+def reference_diff_event_as_list(prev_event, cur_event):
+    prev_len = len(prev_event)
+    cur_len = len(cur_event)
+    min_len = min(prev_len, cur_len)
+    diff_prev_event = [SIEVE_IDX_SKIP] * prev_len
+    diff_cur_event = [SIEVE_IDX_SKIP] * cur_len
+    for i in range(min_len):
+        if isinstance(cur_event[i], dict):
+            if not isinstance(prev_event[i], dict):
+                diff_prev_event[i] = prev_event[i]
+                diff_cur_event[i] = cur_event[i]
+            else:
+                sub_diff_prev_event, sub_diff_cur_event = reference_diff_event_as_map(
+                    prev_event[i], cur_event[i]
+                )
+                if sub_diff_prev_event is None or sub_diff_cur_event is None:
+                    continue
+                diff_prev_event[i] = sub_diff_prev_event
+                diff_cur_event[i] = sub_diff_cur_event
+        elif isinstance(cur_event[i], list):
+            if not isinstance(prev_event[i], list):
+                diff_prev_event[i] = prev_event[i]
+                diff_cur_event[i] = cur_event[i]
+            else:
+                sub_diff_prev_event, sub_diff_cur_event = reference_diff_event_as_list(
+                    prev_event[i], cur_event[i]
+                )
+                if sub_diff_prev_event is None or sub_diff_cur_event is None:
+                    continue
+                diff_prev_event[i] = sub_diff_prev_event
+                diff_cur_event[i] = sub_diff_cur_event
+        else:
+            if prev_event[i] != cur_event[i]:
+                diff_prev_event[i] = prev_event[i]
+                diff_cur_event[i] = cur_event[i]
+    for i in range(min_len, prev_len):
+        diff_prev_event[i] = prev_event[i]
+    for i in range(min_len, cur_len):
+        diff_cur_event[i] = cur_event[i]
+    if cur_len == prev_len:
+        keep = False
+        for i in range(cur_len):
+            if (
+                not diff_prev_event[i] == SIEVE_IDX_SKIP
+                or not diff_cur_event[i] == SIEVE_IDX_SKIP
+            ):
+                keep = True
+        if not keep:
+            return None, None
+    return diff_prev_event, diff_cur_event
+
+
+def reference_diff_event_as_map(prev_event, cur_event):
+    diff_prev_event = {}
+    diff_cur_event = {}
+    common_keys = set(cur_event.keys()).intersection(prev_event.keys())
+    pdc_keys = set(prev_event.keys()).difference(cur_event.keys())
+    cdp_keys = set(cur_event.keys()).difference(prev_event.keys())
+    for key in common_keys:
+        if isinstance(cur_event[key], dict):
+            if not isinstance(prev_event[key], dict):
+                diff_prev_event[key] = prev_event[key]
+                diff_cur_event[key] = cur_event[key]
+            else:
+                sub_diff_prev_event, sub_diff_cur_event = reference_diff_event_as_map(
+                    prev_event[key], cur_event[key]
+                )
+                if sub_diff_prev_event is None or sub_diff_cur_event is None:
+                    continue
+                diff_prev_event[key] = sub_diff_prev_event
+                diff_cur_event[key] = sub_diff_cur_event
+        elif isinstance(cur_event[key], list):
+            if not isinstance(prev_event[key], list):
+                diff_prev_event[key] = prev_event[key]
+                diff_cur_event[key] = cur_event[key]
+            else:
+                sub_diff_prev_event, sub_diff_cur_event = reference_diff_event_as_list(
+                    prev_event[key], cur_event[key]
+                )
+                if sub_diff_prev_event is None or sub_diff_cur_event is None:
+                    continue
+                diff_prev_event[key] = sub_diff_prev_event
+                diff_cur_event[key] = sub_diff_cur_event
+        else:
+            if prev_event[key] != cur_event[key]:
+                diff_prev_event[key] = prev_event[key]
+                diff_cur_event[key] = cur_event[key]
+    for key in pdc_keys:
+        diff_prev_event[key] = prev_event[key]
+    for key in cdp_keys:
+        diff_cur_event[key] = cur_event[key]
+    if len(diff_cur_event) == 0 and len(diff_prev_event) == 0:
+        return None, None
+    return diff_prev_event, diff_cur_event
+
+
+def reference_canonicalize_value(value):
+    if match_mask_regex(value):
+        return SIEVE_VALUE_MASK
+    return value
+
+
+def reference_canonicalize_event_as_list(event, parent_path, masked_keys, masked_paths):
+    for i in range(len(event)):
+        current_path = os.path.join(parent_path, "*")
+        if current_path in masked_paths:
+            event[i] = SIEVE_VALUE_MASK
+            continue
+        if isinstance(event[i], list):
+            reference_canonicalize_event_as_list(
+                event[i], current_path, masked_keys, masked_paths
+            )
+        elif isinstance(event[i], dict):
+            reference_canonicalize_event_as_map(
+                event[i], current_path, masked_keys, masked_paths
+            )
+        elif isinstance(event[i], str):
+            event[i] = reference_canonicalize_value(event[i])
+
+
+def reference_canonicalize_event_as_map(event, parent_path, masked_keys, masked_paths):
+    for key in event:
+        current_path = os.path.join(parent_path, key)
+        if key in masked_keys or current_path in masked_paths:
+            event[key] = SIEVE_VALUE_MASK
+            continue
+        if isinstance(event[key], dict):
+            reference_canonicalize_event_as_map(
+                event[key], current_path, masked_keys, masked_paths
+            )
+        elif isinstance(event[key], list):
+            reference_canonicalize_event_as_list(
+                event[key], current_path, masked_keys, masked_paths
+            )
+        elif isinstance(event[key], str):
+            event[key] = reference_canonicalize_value(event[key])
+
+
+def reference_diff_event(
+    prev_event, cur_event, masked_keys, masked_paths, trim_ka=False, can=True
+):
+    prev_event_copy = copy.deepcopy(prev_event)
+    cur_event_copy = copy.deepcopy(cur_event)
+    if trim_ka:
+        for event in [prev_event_copy, cur_event_copy]:
+            event.pop("kind", None)
+            event.pop("apiVersion", None)
+    if can:
+        for event in [prev_event_copy, cur_event_copy]:
+            reference_canonicalize_event_as_map(event, "", masked_keys, masked_paths)
+    return reference_diff_event_as_map(prev_event_copy, cur_event_copy)
+
+
+# Field names and masked paths include the ones that are not plain segments
+# (empty, containing "/" or absolute), whose paths are joined as by os.path.join
+FIELDS = [
+    "a",
+    "b",
+    "c",
+    "kind",
+    "apiVersion",
+    "metadata",
+    "spec",
+    "resourceVersion",
+    "x/y",
+    "",
+    "/abs",
+]
+MASKED_PATHS = [
+    "a",
+    "a/b",
+    "a/*",
+    "a/*/b",
+    "*",
+    "spec/c",
+    "x/y",
+    "x/y/a",
+    "/abs",
+    "a//b",
+    "/abs/a",
+    "metadata/*/*",
+    "a/",
+    "b/x/y",
+]
+# Including the values matched by the mask regexes and the sieve markers
+SCALARS = [
+    "foo",
+    "bar",
+    "2021-01-01T00:00:00Z",
+    "10.0.0.1",
+    SIEVE_IDX_SKIP,
+    SIEVE_VALUE_MASK,
+    0,
+    1,
+    1.0,
+    2,
+    True,
+    False,
+    None,
+]
+
+
+def random_value(rnd: random.Random, depth: int):
+    choice = rnd.random()
+    if depth > 3 or choice < 0.4:
+        return rnd.choice(SCALARS)
+    if choice < 0.7:
+        return random_map(rnd, depth + 1, rnd.randint(0, 4))
+    return [random_value(rnd, depth + 1) for _ in range(rnd.randint(0, 4))]
+
+
+def random_map(rnd: random.Random, depth: int, size: int):
+    return {rnd.choice(FIELDS): random_value(rnd, depth) for _ in range(size)}
+
+
+def mutate(rnd: random.Random, value, depth: int = 0):
+    # Returns a new version of value sharing the unchanged subtrees with it
+    if rnd.random() < 0.25:
+        return random_value(rnd, depth)
+    if isinstance(value, dict):
+        value = dict(value)
+        for key in list(value):
+            if rnd.random() < 0.3:
+                value[key] = mutate(rnd, value[key], depth + 1)
+            elif rnd.random() < 0.1:
+                del value[key]
+        if rnd.random() < 0.2:
+            value[rnd.choice(FIELDS)] = random_value(rnd, depth + 1)
+        return value
+    if isinstance(value, list):
+        value = [
+            mutate(rnd, item, depth + 1) if rnd.random() < 0.3 else item
+            for item in value
+        ]
+        if rnd.random() < 0.2:
+            value.append(random_value(rnd, depth + 1))
+        if value and rnd.random() < 0.1:
+            value.pop()
+        return value
+    return value
+
+
+def random_event_pair(rnd: random.Random):
+    prev_event = random_map(rnd, 1, rnd.randint(0, 6))
+    if rnd.random() < 0.8:
+        cur_event = mutate(rnd, prev_event)
+        if not isinstance(cur_event, dict):
+            cur_event = {"a": cur_event}
+    else:
+        cur_event = random_map(rnd, 1, 4)
+    return prev_event, cur_event
+
+
+def random_masks(rnd: random.Random):
+    return (
+        set(rnd.sample(FIELDS, rnd.randint(0, 2))),
+        set(rnd.sample(MASKED_PATHS, rnd.randint(0, 4))),
+    )
+
+
+def strict_json(value):
+    # Tells apart the values that are equal in python but not in JSON (e.g., 1 and True)
+    return json.dumps(value, sort_keys=True)
+
+
+def container_ids(value, ids):
+    if isinstance(value, dict):
+        ids.add(id(value))
+        for item in value.values():
+            container_ids(item, ids)
+    elif isinstance(value, list):
+        ids.add(id(value))
+        for item in value:
+            container_ids(item, ids)
+    return ids
+
+
+class TestDiffEvent(unittest.TestCase):
+    def test_diff_event_matches_multi_pass_differ(self):
+        rnd = random.Random(0)
+        changed_cnt = 0
+        for _ in range(20000):
+            prev_event, cur_event = random_event_pair(rnd)
+            masked_keys, masked_paths = random_masks(rnd)
+            trim_ka = rnd.random() < 0.5
+            can = rnd.random() < 0.8
+            mask_spec = MaskSpec(masked_keys, masked_paths) if can else None
+            prev_event_copy = copy.deepcopy(prev_event)
+            cur_event_copy = copy.deepcopy(cur_event)
+            expected = reference_diff_event(
+                prev_event, cur_event, masked_keys, masked_paths, trim_ka, can
+            )
+            actual = diff_event(prev_event, cur_event, mask_spec, trim_ka, can)
+            self.assertEqual(
+                strict_json(actual),
+                strict_json(expected),
+                (prev_event, cur_event, masked_keys, masked_paths, trim_ka, can),
+            )
+            # The events are neither modified nor shared with the slim diff
+            self.assertEqual(strict_json(prev_event), strict_json(prev_event_copy))
+            self.assertEqual(strict_json(cur_event), strict_json(cur_event_copy))
+            input_ids = container_ids(prev_event, set())
+            container_ids(cur_event, input_ids)
+            for slim_event in actual:
+                self.assertFalse(container_ids(slim_event, set()) & input_ids)
+            if actual != (None, None):
+                changed_cnt += 1
+        # Most pairs should differ, so that the slim diffs are compared
+        self.assertGreater(changed_cnt, 10000)
+
+    def test_canonical_event_matches_canonicalization_in_place(self):
+        rnd = random.Random(1)
+        for _ in range(5000):
+            event = random_map(rnd, 1, rnd.randint(0, 6))
+            masked_keys, masked_paths = random_masks(rnd)
+            expected = copy.deepcopy(event)
+            reference_canonicalize_event_as_map(expected, "", masked_keys, masked_paths)
+            event_copy = copy.deepcopy(event)
+            actual = canonical_event(event, MaskSpec(masked_keys, masked_paths))
+            self.assertEqual(strict_json(actual), strict_json(expected))
+            self.assertEqual(strict_json(event), strict_json(event_copy))
+
+    def check_diff_event_chain(self, events, masked_keys, masked_paths, trim_ka):
+        # Each diff and canonicalized version of the chain is compared
+        # with the ones computed by the multi-pass differ for each pair on its own
+        events_copy = copy.deepcopy(events)
+        version_chain = EventDeltaCache(0).diff_event_chain(
+            list(range(len(events))),
+            MaskSpec(masked_keys, masked_paths),
+            trim_ka,
+            lambda i: events[i],
+        )
+        prev_event = {}
+        for i, (slim_prev_event, slim_cur_event, canonical_cur_event) in enumerate(
+            version_chain
+        ):
+            expected = reference_diff_event(
+                prev_event, events[i], masked_keys, masked_paths, trim_ka
+            )
+            self.assertEqual(
+                strict_json((slim_prev_event, slim_cur_event)),
+                strict_json(expected),
+                (events, masked_keys, masked_paths, trim_ka, i),
+            )
+            expected = copy.deepcopy(events[i])
+            reference_canonicalize_event_as_map(expected, "", masked_keys, masked_paths)
+            self.assertEqual(
+                strict_json(canonical_cur_event),
+                strict_json(expected),
+                (events, masked_keys, masked_paths, trim_ka, i),
+            )
+            prev_event = events[i]
+        self.assertEqual(strict_json(events), strict_json(events_copy))
+
+    def test_diff_event_chain_matches_multi_pass_differ(self):
+        rnd = random.Random(2)
+        for _ in range(3000):
+            events = [random_map(rnd, 1, rnd.randint(0, 6))]
+            for _ in range(rnd.randint(0, 6)):
+                event = mutate(rnd, events[-1])
+                events.append(event if isinstance(event, dict) else {"a": event})
+            masked_keys, masked_paths = random_masks(rnd)
+            self.check_diff_event_chain(
+                events, masked_keys, masked_paths, rnd.random() < 0.5
+            )
+
+    def test_diff_event_chain_tells_apart_equal_values_of_different_types(self):
+        # 1, 1.0 and True (and 0 and False) are equal in python but not in JSON,
+        # so an unchanged field is never shared with a version holding another type
+        events = [
+            {"a": 1, "b": {"c": 0}, "d": [1, 0]},
+            {"a": True, "b": {"c": False}, "d": [True, False]},
+            {"a": 1.0, "b": {"c": 0}, "d": [1.0, 0]},
+            {"a": [1], "b": {"c": False, "e": 1}, "d": {"a": 1}},
+            {"a": [True], "b": {"c": 0, "e": True}, "d": {"a": True}},
+            {"a": "x", "b": "x", "d": "x"},
+        ]
+        self.check_diff_event_chain(events, set(), set(), False)
+        self.check_diff_event_chain(events, {"e"}, {"a/*"}, True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from sieve_common.k8s_event import ResourceKeyTable
+from sieve_analyzer import analyze
+from sieve_analyzer.event_graph import EventGraph
+from sieve_analyzer.event_graph_snapshot import (
+    EVENT_GRAPH_SNAPSHOT,
+    event_graph_fingerprint,
+    read_event_graph_snapshot,
+    write_event_graph_snapshot,
+)
+from tests.common import generate_sieve_log, make_test_context
+
+LEARNED_MASKED_PATHS = {"pod/default/pod-1": [["spec", "replicas"]]}
+
+unpickled_calls = []
+
+
+def record_unpickled_call():
+    unpickled_calls.append(True)
+    return {}
+
+
+class CallOnLoad:
+    def __reduce__(self):
+        return (record_unpickled_call, ())
+
+
+class TestEventGraphSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.result_dir = tempfile.mkdtemp()
+        self.test_context = make_test_context(self.result_dir)
+        self.log_path = os.path.join(self.result_dir, "sieve-server.log")
+        generate_sieve_log(self.log_path, 0, 50)
+        self.oracle_dir = os.path.join(self.result_dir, "oracle")
+        os.makedirs(self.oracle_dir)
+        with open(os.path.join(self.oracle_dir, "mask.json"), "w") as f:
+            json.dump(LEARNED_MASKED_PATHS, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.result_dir)
+
+    def build_event_graph(self):
+        key_table = ResourceKeyTable()
+        operator_hear_list, reconciler_event_list = analyze.parse_sieve_log(
+            self.test_context, self.log_path, key_table
+        )
+        event_graph = EventGraph(
+            LEARNED_MASKED_PATHS,
+            self.test_context.common_config.field_key_mask,
+            self.test_context.common_config.field_path_mask,
+            key_table,
+        )
+        event_graph.add_sorted_operator_hears(operator_hear_list)
+        event_graph.add_sorted_reconciler_events(reconciler_event_list)
+        event_graph.finalize()
+        return event_graph
+
+    def fingerprint(self):
+        return event_graph_fingerprint(
+            self.test_context, self.log_path, self.oracle_dir
+        )
+
+    def test_snapshot_restores_the_graph(self):
+        event_graph = self.build_event_graph()
+        write_event_graph_snapshot(self.result_dir, event_graph, self.fingerprint())
+        restored_event_graph = read_event_graph_snapshot(
+            self.result_dir, self.fingerprint()
+        )
+        self.assertIsNotNone(restored_event_graph)
+        for vertices, restored_vertices in [
+            (
+                event_graph.operator_hear_vertices,
+                restored_event_graph.operator_hear_vertices,
+            ),
+            (
+                event_graph.operator_write_vertices,
+                restored_event_graph.operator_write_vertices,
+            ),
+        ]:
+            self.assertEqual(
+                [(vertex.gid, vertex.content.signature_counter) for vertex in vertices],
+                [
+                    (vertex.gid, vertex.content.signature_counter)
+                    for vertex in restored_vertices
+                ],
+            )
+        self.assertEqual(
+            len(event_graph.operator_hear_operator_write_edges),
+            len(restored_event_graph.operator_hear_operator_write_edges),
+        )
+
+    def test_snapshot_is_stale_when_a_flag_changes(self):
+        write_event_graph_snapshot(
+            self.result_dir, self.build_event_graph(), self.fingerprint()
+        )
+        hear_read_filter_flag = analyze.HEAR_READ_FILTER_FLAG
+        analyze.HEAR_READ_FILTER_FLAG = not hear_read_filter_flag
+        try:
+            self.assertIsNone(
+                read_event_graph_snapshot(self.result_dir, self.fingerprint())
+            )
+        finally:
+            analyze.HEAR_READ_FILTER_FLAG = hear_read_filter_flag
+        self.assertIsNotNone(
+            read_event_graph_snapshot(self.result_dir, self.fingerprint())
+        )
+
+    def test_snapshot_cannot_call_code_on_load(self):
+        with open(os.path.join(self.result_dir, EVENT_GRAPH_SNAPSHOT), "wb") as f:
+            pickle.dump(CallOnLoad(), f)
+        self.assertIsNone(
+            read_event_graph_snapshot(self.result_dir, self.fingerprint())
+        )
+        self.assertEqual(unpickled_calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
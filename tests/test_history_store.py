@@ -0,0 +1,157 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from sieve_common.artifact_storage import artifact_compressions
+from sieve_common.history_store import (
+    HISTORY_FILE,
+    LEGACY_HISTORY_FILE,
+    dump_history,
+    encode_history,
+    history_path,
+    open_history,
+)
+from sieve_common.k8s_event import APIEvent
+
+
+def make_api_events():
+    api_events = []
+    for i in range(10):
+        obj_map = {"metadata": {"name": "pod-%d" % (i % 3)}, "spec": {"replicas": i}}
+        api_events.append(
+            APIEvent(
+                "ADDED" if i < 3 else "MODIFIED",
+                "/pods/default/pod-%d" % (i % 3),
+                "pod",
+                "default",
+                "pod-%d" % (i % 3),
+                json.dumps(obj_map),
+            )
+        )
+    return api_events
+
+
+def read_history(path):
+    return [
+        (event["etype"], event["key"], event.obj_map) for event in open_history(path)
+    ]
+
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.result_dir = tempfile.mkdtemp()
+        self.api_events = make_api_events()
+        self.expected_history = [
+            (api_event.etype, api_event.key, json.loads(api_event.obj_str))
+            for api_event in self.api_events
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.result_dir)
+
+    def dump_legacy_history(self):
+        legacy_history = [
+            {"etype": etype, "key": key, "state": json.dumps(obj_map)}
+            for etype, key, obj_map in self.expected_history
+        ]
+        with open(os.path.join(self.result_dir, LEGACY_HISTORY_FILE), "w") as f:
+            json.dump(legacy_history, f)
+
+    def test_history_is_stored_as_json_lines(self):
+        dump_history(
+            self.result_dir,
+            encode_history(self.api_events),
+            artifact_compressions.NONE,
+        )
+        path = history_path(self.result_dir)
+        self.assertEqual(path, os.path.join(self.result_dir, HISTORY_FILE))
+        self.assertEqual(read_history(path), self.expected_history)
+
+    def test_state_is_the_logged_string(self):
+        # The objects of one key logged in different encodings:
+        # Go's compact one, Python's spaced one, escaped characters and reordered keys
+        obj_strs = [
+            '{"metadata":{"name":"pod-0"},"spec":{"replicas":1}}',
+            '{"metadata":{"name":"pod-0"},"spec":{"replicas":2}}',
+            '{"metadata": {"name": "pod-0"}, "spec": {"replicas": 3}}',
+            '{"metadata":{"name":"pod-0"},"spec":{"replicas":3,"cmd":"a \\u003c b"}}',
+            '{"metadata":{"name":"pod-0"},"spec":{"cmd":"caf\u00e9","replicas":3}}',
+            '{"spec":{"replicas":4},"metadata":{"name":"pod-0"}}',
+            '{"metadata":{"name":"pod-0"},"spec":{"replicas":4,"x":1.0}}',
+        ]
+        api_events = [
+            APIEvent(
+                "ADDED" if i == 0 else "MODIFIED",
+                "/pods/default/pod-0",
+                "pod",
+                "default",
+                "pod-0",
+                obj_str,
+            )
+            for i, obj_str in enumerate(obj_strs)
+        ]
+        entries = list(encode_history(api_events))
+        # Only the objects that no encoding rebuilds carry their string:
+        # the escaped characters, and the last object whose patch against
+        # the reordered object before it cannot restore the logged key order
+        self.assertEqual(
+            ["state" in entry for entry in entries],
+            [False, False, False, True, True, False, True],
+        )
+        dump_history(self.result_dir, entries, artifact_compressions.NONE)
+        history = open_history(history_path(self.result_dir))
+        self.assertEqual([event["state"] for event in history], obj_strs)
+        key = api_events[0].key
+        self.assertEqual(
+            [history.get(key, version).state for version in range(len(obj_strs))],
+            obj_strs,
+        )
+
+    def test_get_rebuilds_every_version(self):
+        # In order (replaying from the last version read) and in random order
+        # (reopening the compressed history to read backward)
+        dump_history(
+            self.result_dir,
+            encode_history(self.api_events),
+            artifact_compressions.GZIP,
+        )
+        history = open_history(history_path(self.result_dir))
+        versions = [
+            (key, version)
+            for key in sorted(history.keys())
+            for version in range(history.version_cnt(key))
+        ]
+        expected = {}
+        for event in open_history(history_path(self.result_dir)):
+            expected[(event.key, event.version)] = (event.etype, event.obj_map)
+        random.Random(0).shuffle(versions)
+        for key, version in sorted(versions) + versions:
+            event = history.get(key, version)
+            self.assertEqual((event.etype, event.obj_map), expected[(key, version)])
+        history.close()
+
+    def test_legacy_history_is_read(self):
+        self.dump_legacy_history()
+        path = history_path(self.result_dir)
+        self.assertEqual(path, os.path.join(self.result_dir, LEGACY_HISTORY_FILE))
+        self.assertEqual(read_history(path), self.expected_history)
+
+    def test_new_history_replaces_legacy_history(self):
+        self.dump_legacy_history()
+        dump_history(
+            self.result_dir,
+            encode_history(self.api_events[:5]),
+            artifact_compressions.GZIP,
+        )
+        self.assertFalse(
+            os.path.exists(os.path.join(self.result_dir, LEGACY_HISTORY_FILE))
+        )
+        path = history_path(self.result_dir)
+        self.assertEqual(path, os.path.join(self.result_dir, HISTORY_FILE))
+        self.assertEqual(read_history(path), self.expected_history[:5])
+
+
+if __name__ == "__main__":
+    unittest.main()
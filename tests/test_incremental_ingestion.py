@@ -0,0 +1,156 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+from sieve_common.api_event_store import build_api_event_store
+from sieve_common.trace_cache import (
+    API_SERVER_LOG,
+    build_key_index,
+    load_api_events,
+    read_trace_cache,
+)
+from sieve_oracle.oracle import (
+    IncrementalIngestion,
+    load_api_event_store,
+)
+from sieve_oracle.safety_checker import generate_history, generate_history_digest
+from sieve_oracle.liveness_checker import generate_state
+from tests.common import make_test_context
+
+
+def generate_api_log(seed: int, api_event_cnt: int) -> bytes:
+    # An apiserver log with noise lines around the api events,
+    # including resources with randomly generated names
+    rnd = random.Random(seed)
+    names = ["pod-%d" % i for i in range(5)] + [
+        "pod-%05d" % rnd.randint(0, 99999) for i in range(3)
+    ]
+    exists = {}
+    lines = []
+    for i in range(api_event_cnt):
+        for _ in range(rnd.randint(0, 3)):
+            lines.append("I1010 12:00:00.000000 1 httplog.go:89] GET /api/v1/pods 200")
+        name = rnd.choice(names)
+        if not exists.get(name):
+            etype = "ADDED"
+        else:
+            etype = rnd.choice(["MODIFIED", "MODIFIED", "DELETED"])
+        exists[name] = etype != "DELETED"
+        obj = {
+            "metadata": {"name": name, "namespace": "default"},
+            "spec": {"replicas": rnd.randint(1, 3), "step": i},
+        }
+        if len(name) == 9:
+            obj["metadata"]["generateName"] = "pod-"
+        lines.append(
+            "I1010 12:00:00 1 x.go:1] [SIEVE-API-EVENT]\t%s\t/registry/pods/default/%s"
+            "\tpod\tdefault\t%s\t%s" % (etype, name, name, json.dumps(obj))
+        )
+    return ("\n".join(lines) + "\n").encode()
+
+
+class TestIncrementalIngestion(unittest.TestCase):
+    def setUp(self):
+        self.result_dir = tempfile.mkdtemp()
+        self.test_context = make_test_context(self.result_dir)
+        self.test_context.common_config.trace_cache_enabled = True
+
+    def tearDown(self):
+        shutil.rmtree(self.result_dir)
+
+    def ingest_while_writing(
+        self, api_log: bytes, seed: int, max_chunk_size: int = 4096
+    ):
+        # Writes the log in chunks of random sizes (mostly cutting lines in the middle)
+        # while the ingester tails it
+        rnd = random.Random(seed)
+        api_log_path = os.path.join(self.result_dir, API_SERVER_LOG)
+        with open(api_log_path, "wb") as api_log_file:
+            incremental_ingestion = IncrementalIngestion(self.test_context)
+            incremental_ingestion.ingester.poll_interval = 0.001
+            incremental_ingestion.start()
+            pos = 0
+            while pos < len(api_log):
+                chunk_size = rnd.randint(1, max_chunk_size)
+                api_log_file.write(api_log[pos : pos + chunk_size])
+                api_log_file.flush()
+                pos += chunk_size
+                time.sleep(0.0005)
+        incremental_ingestion.finish()
+        return incremental_ingestion
+
+    def assert_same_oracle_files(self, ingested_store, batch_store):
+        self.assertEqual(
+            [(e.etype, e.key, e.obj_str) for e in ingested_store],
+            [(e.etype, e.key, e.obj_str) for e in batch_store],
+        )
+        self.assertEqual(
+            list(generate_history(self.test_context, ingested_store)),
+            list(generate_history(self.test_context, batch_store)),
+        )
+        self.assertEqual(
+            generate_state(self.test_context, ingested_store),
+            generate_state(self.test_context, batch_store),
+        )
+
+    def test_ingested_store_matches_batch_parse(self):
+        for seed in range(3):
+            api_log = generate_api_log(seed, 400)
+            incremental_ingestion = self.ingest_while_writing(api_log, seed)
+            self.assertTrue(incremental_ingestion.completed)
+            batch_store = build_api_event_store(self.result_dir)
+            self.assert_same_oracle_files(
+                incremental_ingestion.ingester.api_event_store, batch_store
+            )
+            self.assertEqual(
+                incremental_ingestion.history_digest,
+                generate_history_digest(self.test_context, batch_store),
+            )
+
+    def test_unterminated_last_line_is_ingested(self):
+        api_log = generate_api_log(0, 50).rstrip(b"\n")
+        incremental_ingestion = self.ingest_while_writing(api_log, 0)
+        self.assertTrue(incremental_ingestion.completed)
+        self.assertEqual(len(incremental_ingestion.ingester.api_event_store), 50)
+
+    def test_long_line_in_small_chunks_is_ingested(self):
+        api_log = generate_api_log(2, 20).split(b"\n")
+        long_obj = {"metadata": {"name": "pod-0", "namespace": "default"}}
+        long_obj["spec"] = {"data": "x" * 200000}
+        api_log.insert(
+            10,
+            (
+                "[SIEVE-API-EVENT]\tMODIFIED\t/registry/pods/default/pod-0"
+                "\tpod\tdefault\tpod-0\t%s" % json.dumps(long_obj)
+            ).encode(),
+        )
+        api_log = b"\n".join(api_log)
+        incremental_ingestion = self.ingest_while_writing(api_log, 2, 512)
+        self.assertTrue(incremental_ingestion.completed)
+        self.assert_same_oracle_files(
+            incremental_ingestion.ingester.api_event_store,
+            build_api_event_store(self.result_dir),
+        )
+        self.assertEqual(len(incremental_ingestion.ingester.api_event_store), 21)
+
+    def test_trace_cache_is_written_from_ingested_store(self):
+        api_log = generate_api_log(1, 200)
+        self.test_context.incremental_ingestion = self.ingest_while_writing(api_log, 1)
+        api_event_store, history_digest = load_api_event_store(self.test_context)
+        self.assertIsNotNone(history_digest)
+        api_log_path = os.path.join(self.result_dir, API_SERVER_LOG)
+        self.assertIsNotNone(read_trace_cache(api_log_path))
+        # load_api_events reads the cache written above
+        cached_api_events, cached_key_index = load_api_events(api_log_path)
+        self.assertEqual(
+            [(e.etype, e.key, e.obj_str) for e in cached_api_events],
+            [(e.etype, e.key, e.obj_str) for e in api_event_store],
+        )
+        self.assertEqual(cached_key_index, build_key_index(api_event_store.api_events))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from sieve_common.k8s_event import EVENT_NONE_TYPE, OperatorRead, ResourceKeyTable
+from sieve_analyzer.analyze import parse_sieve_log
+from sieve_analyzer.event_graph import EventGraph, EventVertex, OperatorReadIndex
+from tests.common import generate_sieve_log, make_test_context
+
+RECONCILER_TYPES = ["reconciler-a", "reconciler-b"]
+
+
+def reference_last_read_before(operator_read_vertices, operator_write):
+    # The linear scan that OperatorReadIndex replaced
+    prev_read_vertex = None
+    for operator_read_vertex in operator_read_vertices:
+        operator_read = operator_read_vertex.content
+        if operator_read.end_timestamp > operator_write.start_timestamp:
+            break
+        assert operator_read.end_timestamp < operator_write.start_timestamp
+        if (
+            operator_read.reconciler_type == operator_write.reconciler_type
+            and operator_read.reconcile_id == operator_write.reconcile_id
+        ):
+            prev_read_vertex = operator_read_vertex
+    return prev_read_vertex
+
+
+class QueryWrite:
+    # The fields of an operator_write that the scan looks at
+    def __init__(self, reconciler_type: str, reconcile_id: int, start_timestamp: int):
+        self.reconciler_type = reconciler_type
+        self.reconcile_id = reconcile_id
+        self.start_timestamp = start_timestamp
+
+
+def random_reads(rnd: random.Random, read_cnt: int, max_timestamp: int):
+    # The reads of one key, mostly in the order of end_timestamp.
+    # A read ends at an even timestamp and a write starts at an odd one,
+    # as a read and a write never share a line of the log.
+    operator_read_vertices = []
+    end_timestamps = sorted(
+        2 * timestamp for timestamp in rnd.sample(range(max_timestamp), read_cnt)
+    )
+    for i in range(read_cnt - 1):
+        if rnd.random() < 0.1:
+            end_timestamps[i], end_timestamps[i + 1] = (
+                end_timestamps[i + 1],
+                end_timestamps[i],
+            )
+    for end_timestamp in end_timestamps:
+        operator_read = OperatorRead(
+            "Get",
+            "false",
+            "pod",
+            "default",
+            "pod-1",
+            rnd.choice(RECONCILER_TYPES),
+            "NoError",
+            "{}",
+        )
+        operator_read.reconcile_id = rnd.randint(0, 4)
+        operator_read.end_timestamp = end_timestamp
+        operator_read_vertices.append(EventVertex(end_timestamp, operator_read))
+    return operator_read_vertices
+
+
+class TestOperatorReadIndex(unittest.TestCase):
+    def test_last_read_before_matches_linear_scan(self):
+        rnd = random.Random(0)
+        found_cnt = 0
+        not_found_cnt = 0
+        for _ in range(200):
+            max_timestamp = rnd.randint(1, 100)
+            operator_read_key_to_vertices = {
+                key_id: random_reads(rnd, rnd.randint(1, max_timestamp), max_timestamp)
+                for key_id in range(3)
+            }
+            operator_read_index = OperatorReadIndex(operator_read_key_to_vertices)
+            for _ in range(100):
+                key_id = rnd.randrange(4)
+                operator_write = QueryWrite(
+                    rnd.choice(RECONCILER_TYPES),
+                    rnd.randint(-1, 5),
+                    2 * rnd.randint(-1, max_timestamp) + 1,
+                )
+                expected = reference_last_read_before(
+                    operator_read_key_to_vertices.get(key_id, []), operator_write
+                )
+                actual = operator_read_index.get_last_read_before(
+                    operator_write.reconciler_type,
+                    operator_write.reconcile_id,
+                    key_id,
+                    operator_write.start_timestamp,
+                )
+                self.assertIs(actual, expected)
+                if expected is None:
+                    not_found_cnt += 1
+                else:
+                    found_cnt += 1
+        self.assertGreater(found_cnt, 2000)
+        self.assertGreater(not_found_cnt, 2000)
+
+
+class TestFindPrevReads(unittest.TestCase):
+    def setUp(self):
+        self.result_dir = tempfile.mkdtemp()
+        self.test_context = make_test_context(self.result_dir)
+        self.log_path = os.path.join(self.result_dir, "sieve-server.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.result_dir)
+
+    def test_find_prev_reads_matches_linear_scan(self):
+        found_cnt = 0
+        for seed in range(3):
+            generate_sieve_log(self.log_path, seed, 300)
+            key_table = ResourceKeyTable()
+            operator_hear_list, reconciler_event_list = parse_sieve_log(
+                self.test_context, self.log_path, key_table
+            )
+            event_graph = EventGraph({}, {}, {}, key_table)
+            event_graph.add_sorted_operator_hears(operator_hear_list)
+            event_graph.add_sorted_reconciler_events(reconciler_event_list)
+            for key_id in event_graph.operator_write_key_to_vertices:
+                prev_reads = event_graph.find_prev_reads(key_id)
+                operator_write_vertices = event_graph.operator_write_key_to_vertices[
+                    key_id
+                ]
+                for i in range(len(operator_write_vertices)):
+                    operator_write = operator_write_vertices[i].content
+                    operator_read_vertex = reference_last_read_before(
+                        event_graph.operator_read_key_to_vertices.get(key_id, []),
+                        operator_write,
+                    )
+                    if operator_read_vertex is None:
+                        expected = ({}, EVENT_NONE_TYPE, None)
+                    else:
+                        operator_read = operator_read_vertex.content
+                        expected = (
+                            operator_read.key_to_obj[operator_write.key],
+                            operator_read.etype,
+                            (operator_read.obj_str, operator_write.key),
+                        )
+                        found_cnt += 1
+                    self.assertEqual(prev_reads[i], expected)
+        # The log should have writes following a read in the same reconcile
+        self.assertGreater(found_cnt, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
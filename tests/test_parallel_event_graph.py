@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+from sieve_common.k8s_event import ResourceKeyTable
+from sieve_analyzer.analyze import parse_sieve_log
+from sieve_analyzer.event_graph import EventGraph
+from tests.common import generate_sieve_log, make_test_context
+
+LEARNED_MASKED_PATHS = {"pod/default/pod-1": [["spec", "replicas"]]}
+
+
+class TestParallelEventGraph(unittest.TestCase):
+    """
+    Sharding the per-key diff and cancel over worker processes
+    should give the same graph as computing it serially.
+    """
+
+    def setUp(self):
+        self.result_dir = tempfile.mkdtemp()
+        self.test_context = make_test_context(self.result_dir)
+        self.log_path = os.path.join(self.result_dir, "sieve-server.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.result_dir)
+
+    def build_event_graph(self, workers: int, diff_cache_size: int = 0):
+        key_table = ResourceKeyTable()
+        operator_hear_list, reconciler_event_list = parse_sieve_log(
+            self.test_context, self.log_path, key_table
+        )
+        event_graph = EventGraph(
+            LEARNED_MASKED_PATHS,
+            self.test_context.common_config.field_key_mask,
+            self.test_context.common_config.field_path_mask,
+            key_table,
+        )
+        event_graph.add_sorted_operator_hears(operator_hear_list)
+        event_graph.add_sorted_reconciler_events(reconciler_event_list)
+        event_graph.finalize(workers, diff_cache_size)
+        return event_graph
+
+    def analysis_results(self, event_graph: EventGraph):
+        operator_hears = [
+            (
+                vertex.content.id,
+                vertex.content.slim_prev_obj_map,
+                vertex.content.slim_cur_obj_map,
+                vertex.content.prev_etype,
+                vertex.content.signature,
+                vertex.content.signature_counter,
+                sorted(vertex.content.cancelled_by),
+            )
+            for vertex in event_graph.operator_hear_vertices
+        ]
+        operator_writes = [
+            (
+                vertex.content.id,
+                vertex.content.prev_obj_map,
+                vertex.content.slim_prev_obj_map,
+                vertex.content.slim_cur_obj_map,
+                vertex.content.prev_etype,
+                vertex.content.signature,
+                vertex.content.signature_counter,
+            )
+            for vertex in event_graph.operator_write_vertices
+        ]
+        return operator_hears, operator_writes
+
+    def test_sharded_matches_serial(self):
+        for seed in range(3):
+            generate_sieve_log(self.log_path, seed, 300)
+            serial = self.analysis_results(self.build_event_graph(1))
+            # The log should exercise the cancellation and the repeated signatures
+            self.assertTrue(any(hear[6] for hear in serial[0]))
+            self.assertTrue(any(hear[5] > 1 for hear in serial[0]))
+            self.assertTrue(any(write[6] > 1 for write in serial[1]))
+            for workers in [2, 3]:
+                self.assertEqual(
+                    self.analysis_results(self.build_event_graph(workers)), serial
+                )
+
+    def test_sharded_with_diff_cache_matches_serial(self):
+        generate_sieve_log(self.log_path, 7, 300)
+        serial = self.analysis_results(self.build_event_graph(1))
+        self.assertEqual(
+            self.analysis_results(self.build_event_graph(2, diff_cache_size=64)),
+            serial,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import random
+import unittest
+from sieve_common.k8s_event import OperatorHear, OperatorHearTypes
+from sieve_analyzer.event_graph import (
+    INTER_RECONCILER_EDGE,
+    EventEdge,
+    EventVertex,
+    ReachabilityIndex,
+    event_vertices_reachable,
+)
+
+
+def reachable_by_dfs(source: EventVertex, sink: EventVertex):
+    stack = [source]
+    visited = {source.gid}
+    while len(stack) != 0:
+        cur = stack.pop()
+        if cur.gid == sink.gid:
+            return True
+        for edge in cur.out_inter_reconciler_edges:
+            if edge.sink.gid not in visited:
+                visited.add(edge.sink.gid)
+                stack.append(edge.sink)
+    return False
+
+
+def random_dag(rnd: random.Random, vertex_cnt: int, edge_cnt: int):
+    # Every edge goes forward in start_timestamp, as in an event graph,
+    # but the gids are shuffled so that they do not follow the time order
+    gids = list(range(vertex_cnt))
+    rnd.shuffle(gids)
+    timestamps = sorted(rnd.sample(range(4 * vertex_cnt), vertex_cnt))
+    vertices = []
+    for i in range(vertex_cnt):
+        operator_hear = OperatorHear(str(gids[i]), OperatorHearTypes.UPDATED, "pod", "")
+        operator_hear.start_timestamp = timestamps[i]
+        vertices.append(EventVertex(gids[i], operator_hear))
+    for _ in range(edge_cnt):
+        source = rnd.randrange(vertex_cnt - 1)
+        if rnd.random() < 0.5:
+            # Mostly short edges, which make long chains
+            sink = min(vertex_cnt - 1, source + 1 + int(rnd.expovariate(0.5)))
+        else:
+            sink = rnd.randrange(source + 1, vertex_cnt)
+        vertices[source].add_out_inter_reconciler_edge(
+            EventEdge(vertices[source], vertices[sink], INTER_RECONCILER_EDGE)
+        )
+    return vertices
+
+
+class TestReachabilityIndex(unittest.TestCase):
+    def test_reachable_matches_dfs(self):
+        rnd = random.Random(0)
+        reachable_cnt = 0
+        unreachable_cnt = 0
+        for _ in range(200):
+            vertex_cnt = rnd.randint(2, 60)
+            vertices = random_dag(rnd, vertex_cnt, rnd.randint(0, 2 * vertex_cnt))
+            # The index is built from the vertices in any order
+            shuffled_vertices = list(vertices)
+            rnd.shuffle(shuffled_vertices)
+            reachability_index = ReachabilityIndex(shuffled_vertices)
+            for source in vertices:
+                for sink in vertices:
+                    expected = reachable_by_dfs(source, sink)
+                    self.assertEqual(
+                        reachability_index.reachable(source, sink),
+                        expected,
+                        (source.gid, sink.gid),
+                    )
+                    self.assertEqual(event_vertices_reachable(source, sink), expected)
+                    if expected:
+                        reachable_cnt += 1
+                    else:
+                        unreachable_cnt += 1
+        self.assertGreater(reachable_cnt, 10000)
+        self.assertGreater(unreachable_cnt, 10000)
+
+
+if __name__ == "__main__":
+    unittest.main()
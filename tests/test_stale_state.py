@@ -0,0 +1,206 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from sieve_common.k8s_event import (
+    ALLOWED_ERROR_TYPE,
+    OperatorHearTypes,
+    OperatorWriteTypes,
+)
+from sieve_analyzer import analyze
+from sieve_analyzer.event_graph import event_vertices_connected
+from sieve_perturbation_policies.stale_state import (
+    causality_pair_filtering_pass,
+    decide_stale_state_timing,
+    get_delete_write_vertices,
+    get_stale_state_baseline,
+    get_stale_state_baseline_cnt,
+    reversed_effect_filtering_pass,
+    stale_state_analysis,
+    stale_state_detectable_pass,
+)
+from tests.common import generate_sieve_log, make_test_context
+
+LEARNED_MASKED_PATHS = {"pod/default/pod-1": [["spec", "replicas"]]}
+
+# The stale state passes that the lazy baseline and the edge walk replaced:
+# the baseline pairs are built in full, the causality filtering checks
+# every pair for an edge and the reversed-effect filtering scans all the
+# operator_hears of the key of each pair.
+
+
+def reference_stale_state_baseline(event_graph):
+    candidate_pairs = []
+    for operator_write_vertex in event_graph.operator_write_vertices:
+        for operator_hear_vertex in event_graph.operator_hear_vertices:
+            operator_write = operator_write_vertex.content
+            operator_hear = operator_hear_vertex.content
+            if not operator_write.etype == OperatorWriteTypes.DELETE:
+                continue
+            if operator_write.start_timestamp > operator_hear.start_timestamp:
+                candidate_pairs.append((operator_hear_vertex, operator_write_vertex))
+    return candidate_pairs
+
+
+def reference_causality_pair_filtering_pass(event_pairs):
+    return [pair for pair in event_pairs if event_vertices_connected(pair[0], pair[1])]
+
+
+def reference_reversed_effect_filtering_pass(event_pairs, event_graph):
+    candidate_pairs = []
+    hear_key_to_vertices = event_graph.operator_hear_key_to_vertices
+    for pair in event_pairs:
+        operator_write = pair[1].content
+        if operator_write.error not in ALLOWED_ERROR_TYPE:
+            continue
+        reversed_effect = False
+        if operator_write.key_id in hear_key_to_vertices:
+            for operator_hear_vertex in hear_key_to_vertices[operator_write.key_id]:
+                operator_hear = operator_hear_vertex.content
+                if operator_hear.start_timestamp <= operator_write.end_timestamp:
+                    continue
+                if operator_hear.etype == OperatorHearTypes.ADDED:
+                    reversed_effect = True
+                if operator_hear.etype == OperatorHearTypes.UPDATED:
+                    reversed_effect = True
+        else:
+            reversed_effect = True
+        if reversed_effect:
+            candidate_pairs.append(pair)
+    return candidate_pairs
+
+
+def reference_stale_state_counts(event_graph, test_context):
+    candidate_pairs = reference_stale_state_baseline(event_graph)
+    baseline_spec_number = len(candidate_pairs)
+    after_p1_spec_number = -1
+    after_p2_spec_number = -1
+    if test_context.common_config.causality_pruning_enabled:
+        candidate_pairs = reference_causality_pair_filtering_pass(candidate_pairs)
+        after_p1_spec_number = len(candidate_pairs)
+    if test_context.common_config.effective_updates_pruning_enabled:
+        candidate_pairs = reference_reversed_effect_filtering_pass(
+            candidate_pairs, event_graph
+        )
+        after_p2_spec_number = len(candidate_pairs)
+    if test_context.common_config.nondeterministic_pruning_enabled:
+        candidate_pairs = stale_state_detectable_pass(test_context, candidate_pairs)
+    final_spec_number = len(candidate_pairs)
+    for pair in candidate_pairs:
+        # Both timings are tested, so the pair counts twice
+        if decide_stale_state_timing(pair[0], pair[1]) == "both":
+            baseline_spec_number += 1
+            after_p1_spec_number += 1
+            after_p2_spec_number += 1
+            final_spec_number += 1
+    return (
+        baseline_spec_number,
+        after_p1_spec_number,
+        after_p2_spec_number,
+        final_spec_number,
+    )
+
+
+def gid_pairs(event_pairs):
+    return [(pair[0].gid, pair[1].gid) for pair in event_pairs]
+
+
+class TestStaleState(unittest.TestCase):
+    def setUp(self):
+        self.result_dir = tempfile.mkdtemp()
+        self.test_context = make_test_context(self.result_dir)
+        self.test_context.common_config.persist_test_plans_enabled = False
+        self.log_path = os.path.join(self.result_dir, "sieve-server.log")
+        self.oracle_dir = os.path.join(self.result_dir, "oracle")
+        os.makedirs(self.oracle_dir)
+        with open(os.path.join(self.oracle_dir, "mask.json"), "w") as f:
+            json.dump(LEARNED_MASKED_PATHS, f)
+        # Read by the nondeterministic pruning
+        with open(os.path.join(self.test_context.oracle_dir, "state.json"), "w") as f:
+            json.dump({"pod/default/pod-3": "SIEVE-IGNORE"}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.result_dir)
+
+    def build_event_graphs(self):
+        # The graphs of a few logs, with and without the hear-read-overlap filtering
+        # deciding the operator_hear -> operator_write edges
+        hear_read_filter_flag = analyze.HEAR_READ_FILTER_FLAG
+        try:
+            for seed in range(3):
+                generate_sieve_log(self.log_path, seed, 300)
+                for flag in [True, False]:
+                    analyze.HEAR_READ_FILTER_FLAG = flag
+                    yield analyze.build_event_graph(
+                        self.test_context, self.log_path, self.oracle_dir
+                    )
+        finally:
+            analyze.HEAR_READ_FILTER_FLAG = hear_read_filter_flag
+
+    def test_passes_match_full_baseline(self):
+        kept_by_walk_cnt = 0
+        dropped_by_walk_cnt = 0
+        for event_graph in self.build_event_graphs():
+            expected_baseline = reference_stale_state_baseline(event_graph)
+            delete_write_vertices = get_delete_write_vertices(event_graph)
+            baseline = list(
+                get_stale_state_baseline(event_graph, delete_write_vertices)
+            )
+            self.assertEqual(gid_pairs(baseline), gid_pairs(expected_baseline))
+            self.assertEqual(
+                get_stale_state_baseline_cnt(event_graph, delete_write_vertices),
+                len(expected_baseline),
+            )
+            # The pairs are taken from the edges in the baseline order
+            expected_after_p1 = reference_causality_pair_filtering_pass(
+                expected_baseline
+            )
+            after_p1 = causality_pair_filtering_pass(event_graph, len(baseline))
+            self.assertEqual(gid_pairs(after_p1), gid_pairs(expected_after_p1))
+            self.assertGreater(len(after_p1), 0)
+            self.assertLess(len(after_p1), len(baseline))
+            # The walk back over the operator_hears of the key stops at the same answer
+            for event_pairs in [baseline, after_p1]:
+                expected_after_p2 = reference_reversed_effect_filtering_pass(
+                    event_pairs, event_graph
+                )
+                after_p2 = reversed_effect_filtering_pass(event_pairs, event_graph)
+                self.assertEqual(gid_pairs(after_p2), gid_pairs(expected_after_p2))
+                kept_pairs = set(gid_pairs(after_p2))
+                for pair in event_pairs:
+                    operator_write = pair[1].content
+                    if (
+                        operator_write.error in ALLOWED_ERROR_TYPE
+                        and operator_write.key_id
+                        in event_graph.operator_hear_key_to_vertices
+                    ):
+                        if (pair[0].gid, pair[1].gid) in kept_pairs:
+                            kept_by_walk_cnt += 1
+                        else:
+                            dropped_by_walk_cnt += 1
+        # The walk decides both ways
+        self.assertGreater(kept_by_walk_cnt, 0)
+        self.assertGreater(dropped_by_walk_cnt, 0)
+
+    def test_counts_match_full_baseline(self):
+        common_config = self.test_context.common_config
+        for event_graph in self.build_event_graphs():
+            for causality in [True, False]:
+                for effective_updates in [True, False]:
+                    common_config.causality_pruning_enabled = causality
+                    common_config.effective_updates_pruning_enabled = effective_updates
+                    # The nondeterministic pruning loads state.json for every pair,
+                    # so it only runs on the pairs left by the causality filtering
+                    common_config.nondeterministic_pruning_enabled = causality
+                    self.assertEqual(
+                        stale_state_analysis(
+                            event_graph, self.result_dir, self.test_context
+                        ),
+                        reference_stale_state_counts(event_graph, self.test_context),
+                        (causality, effective_updates),
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from sieve_common.trace_cache import API_SERVER_LOG, load_api_events, read_trace_cache
+
+
+def api_event_line(name: str) -> str:
+    obj = {"metadata": {"name": name, "namespace": "default"}}
+    return (
+        "I1010 12:00:00 1 x.go:1] [SIEVE-API-EVENT]\tADDED\t/registry/pods/default/%s"
+        "\tpod\tdefault\t%s\t%s\n" % (name, name, json.dumps(obj))
+    )
+
+
+class TestTraceCache(unittest.TestCase):
+    def setUp(self):
+        self.result_dir = tempfile.mkdtemp()
+        self.api_log_path = os.path.join(self.result_dir, API_SERVER_LOG)
+
+    def tearDown(self):
+        shutil.rmtree(self.result_dir)
+
+    def test_carriage_return_inside_a_token_is_cached(self):
+        # Only line feeds end a log line, so a lone carriage return
+        # inside a line is part of a token and must not split the cached record
+        names = ["pod-0", "pod\r1", "pod-2"]
+        with open(self.api_log_path, "w", newline="") as api_log:
+            for name in names:
+                api_log.write(api_event_line(name))
+        api_events, key_index = load_api_events(self.api_log_path, True)
+        self.assertEqual([api_event.name for api_event in api_events], names)
+        cache = read_trace_cache(self.api_log_path)
+        self.assertIsNotNone(cache)
+        header, records = cache
+        self.assertEqual(len(records), len(names))
+        cached_api_events, cached_key_index = load_api_events(self.api_log_path)
+        self.assertEqual(
+            [(e.etype, e.key, e.name, e.obj_str) for e in cached_api_events],
+            [(e.etype, e.key, e.name, e.obj_str) for e in api_events],
+        )
+        self.assertEqual(cached_key_index, key_index)
+
+
+if __name__ == "__main__":
+    unittest.main()